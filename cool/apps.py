@@ -63,6 +63,21 @@ def set_filed_init_wrapper():
     Field.__init__ = init_wrapper
 
 
+def prepare_model_cache_key_plans():
+    from cool.model.cache import model_cache
+    for model in apps.get_models():
+        if getattr(model, '_MODEL_WITH_CACHE', False):
+            model_cache.prepare_key_plans(model)
+
+
+def register_cache_metrics():
+    if not cool_settings.CACHE_METRICS_ENABLED:
+        return
+    from cool.core.cache import add_listener, cache_metrics
+    cache_metrics.flush_interval = cool_settings.CACHE_METRICS_FLUSH_INTERVAL
+    add_listener(cache_metrics)
+
+
 class CoolConfig(AppConfig):
     name = 'cool'
     verbose_name = _("Django Cool")
@@ -70,6 +85,8 @@ class CoolConfig(AppConfig):
     def ready(self):
         set_filed_init_wrapper()
         register_checks()
+        prepare_model_cache_key_plans()
+        register_cache_metrics()
 
         if cool_settings.ADMIN_FILTER_WITH_HUMAN_TITLE:
             field_list_filter_init = FieldListFilter.__init__
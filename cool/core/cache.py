@@ -1,45 +1,439 @@
 # encoding: utf-8
 
+import asyncio
+import copy
+import datetime
+import decimal
+import functools
+import hashlib
 import inspect
+import json
+import logging
+import os
+import pickle
+import socket
+import threading
+import time
+import uuid
+import weakref
+import zlib
+from collections import OrderedDict, defaultdict, deque, namedtuple
 
 from django.core.cache import DEFAULT_CACHE_ALIAS, caches
 from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files import File
+from django.db.models import Model
+from django.utils.crypto import get_random_string
 from django.utils.encoding import force_str
 
+logger = logging.getLogger('cool.core')
+
+CacheEvent = namedtuple('CacheEvent', ('cache', 'item', 'name', 'op', 'keys', 'hits', 'elapsed', 'values'))
+CompressedValue = namedtuple('CompressedValue', ('compressor', 'data'))
+# 已序列化（未压缩）的值，读取时直接反序列化，避免缓存后端再次序列化对象
+PickledValue = namedtuple('PickledValue', ('data', ))
+# 带 tag 的值，tags 为写入时的 ((tag key, 版本号), ...)，读取时 tag 版本号已变化视为未命中
+TaggedValue = namedtuple('TaggedValue', ('value', 'tags'))
+
+_MISSING = object()
+
+_listeners = list()
+
+
+def add_listener(listener):
+    """
+    注册缓存调用监听，每次缓存调用后以 `CacheEvent` 为参数调用，未注册监听时没有额外开销
+    """
+    if listener not in _listeners:
+        _listeners.append(listener)
+
+
+def remove_listener(listener):
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+
+def has_listeners():
+    return bool(_listeners)
+
+
+def send_event(event):
+    """
+    发送 `CacheEvent` 给所有监听
+    """
+    for listener in list(_listeners):
+        listener(event)
+
+
+class UncacheableValue(ValueError):
+    """
+    不能用于生成缓存 key 的值（如上传文件）
+    """
+
+
+def _json_dumps(value):
+    return json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+
+
+def normalize_key_value(value):
+    """
+    将值转换为可稳定序列化的结构（区分类型），用于生成缓存 key，上传文件抛出 `UncacheableValue`
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [normalize_key_value(v) for v in value]
+    if isinstance(value, (set, frozenset)):
+        return {'t': 'set', 'v': sorted((normalize_key_value(v) for v in value), key=_json_dumps)}
+    if isinstance(value, dict):
+        items = [[normalize_key_value(k), normalize_key_value(v)] for k, v in value.items()]
+        return {'t': 'dict', 'v': sorted(items, key=_json_dumps)}
+    if isinstance(value, (datetime.date, datetime.time)):
+        return {'t': type(value).__name__, 'v': value.isoformat()}
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return {'t': type(value).__name__, 'v': str(value)}
+    if isinstance(value, Model):
+        return {'t': value._meta.label_lower, 'v': normalize_key_value(value.pk)}
+    if isinstance(value, File):
+        raise UncacheableValue(value)
+    return {'t': type(value).__qualname__, 'v': force_str(value)}
+
+
+def key_digest(value):
+    """
+    值规范化并序列化后的摘要，用于生成缓存 key
+    """
+    return hashlib.sha1(_json_dumps(normalize_key_value(value)).encode('utf-8')).hexdigest()
+
+
+class ZlibCompressor:
+    """
+    zlib 压缩（标准库）
+    """
+    name = 'zlib'
+
+    def __init__(self, level=6):
+        self.level = level
+
+    def compress(self, data):
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data):
+        return zlib.decompress(data)
+
+
+class Lz4Compressor:
+    """
+    lz4 压缩，速度快于 zlib，需安装 lz4
+    """
+    name = 'lz4'
+
+    def compress(self, data):
+        import lz4.frame
+        return lz4.frame.compress(data)
+
+    def decompress(self, data):
+        import lz4.frame
+        return lz4.frame.decompress(data)
+
+
+_compressors = {
+    ZlibCompressor.name: ZlibCompressor(),
+    Lz4Compressor.name: Lz4Compressor(),
+}
+
+
+def get_compressor(compressor):
+    """
+    获取压缩器，lz4 未安装时使用 zlib
+    """
+    if not isinstance(compressor, str):
+        _compressors.setdefault(compressor.name, compressor)
+        return compressor
+    if compressor == Lz4Compressor.name:
+        try:
+            import lz4.frame  # NOQA
+        except ImportError:
+            compressor = ZlibCompressor.name
+    return _compressors[compressor]
+
+
+def _unpack(value):
+    cls = value.__class__
+    if cls is PickledValue:
+        return pickle.loads(value.data)
+    if cls is CompressedValue:
+        return pickle.loads(_compressors[value.compressor].decompress(value.data))
+    return value
+
+
+TAG_KEY_PREFIX = 'cool:cache_tags'
+
+
+def _tag_key(tag):
+    return '%s:%s' % (TAG_KEY_PREFIX, force_str(tag))
+
+
+def _new_tag_version():
+    return int(time.time() * 1000)
+
+
+async def _acache_call(cache, func_name, *args):
+    func = getattr(cache, 'a%s' % func_name, None)
+    if func is None:
+        from asgiref.sync import sync_to_async
+        func = sync_to_async(getattr(cache, func_name))
+    return await func(*args)
+
+
+def get_tag_versions(tags, tags_cache_alias=DEFAULT_CACHE_ALIAS):
+    """
+    获取 tag 当前版本号，返回 ((tag key, 版本号), ...)，版本号不存在时初始化
+    """
+    cache = caches[tags_cache_alias]
+    tag_keys = [_tag_key(tag) for tag in tags]
+    versions = cache.get_many(tag_keys)
+    for tag_key in tag_keys:
+        if tag_key not in versions:
+            version = _new_tag_version()
+            if not cache.add(tag_key, version, None):
+                version = cache.get(tag_key, version)
+            versions[tag_key] = version
+    return tuple((tag_key, versions[tag_key]) for tag_key in tag_keys)
+
+
+async def aget_tag_versions(tags, tags_cache_alias=DEFAULT_CACHE_ALIAS):
+    """
+    `get_tag_versions` 的异步版本
+    """
+    cache = caches[tags_cache_alias]
+    tag_keys = [_tag_key(tag) for tag in tags]
+    versions = await _acache_call(cache, 'get_many', tag_keys)
+    for tag_key in tag_keys:
+        if tag_key not in versions:
+            version = _new_tag_version()
+            if not await _acache_call(cache, 'add', tag_key, version, None):
+                version = await _acache_call(cache, 'get', tag_key, version)
+            versions[tag_key] = version
+    return tuple((tag_key, versions[tag_key]) for tag_key in tag_keys)
+
+
+def _get_tag_keys(data):
+    return list({
+        tag_key for value in data.values() if value.__class__ is TaggedValue for tag_key, _ in value.tags
+    })
+
+
+def _check_tags(data, versions):
+    ret = dict()
+    for key, value in data.items():
+        if value.__class__ is TaggedValue:
+            if any(versions.get(tag_key) != version for tag_key, version in value.tags):
+                continue
+            value = value.value
+        ret[key] = value
+    return ret
+
+
+def check_tags(data, tags_cache_alias=DEFAULT_CACHE_ALIAS):
+    """
+    去掉缓存值中的 tag 信息，tag 已失效的值视为未命中（从结果中去掉）
+    """
+    tag_keys = _get_tag_keys(data)
+    if not tag_keys:
+        return data
+    return _check_tags(data, caches[tags_cache_alias].get_many(tag_keys))
+
+
+async def acheck_tags(data, tags_cache_alias=DEFAULT_CACHE_ALIAS):
+    """
+    `check_tags` 的异步版本
+    """
+    tag_keys = _get_tag_keys(data)
+    if not tag_keys:
+        return data
+    return _check_tags(data, await _acache_call(caches[tags_cache_alias], 'get_many', tag_keys))
+
+
+def invalidate_tags(tags, tags_cache_alias=DEFAULT_CACHE_ALIAS):
+    """
+    使 tag 对应的所有缓存失效（增加 tag 版本号）
+
+        invalidate_tags(['auth.user:1'])
+    """
+    if not tags:
+        return
+    cache = caches[tags_cache_alias]
+    for tag in tags:
+        tag_key = _tag_key(tag)
+        try:
+            cache.incr(tag_key)
+        except ValueError:
+            # 版本号不存在（未使用或已被淘汰）时重新初始化，之前写入的值版本号均不一致
+            cache.add(tag_key, _new_tag_version(), None)
+
 
 def _is_cache_item(obj):
     return isinstance(obj, CacheItem)
 
 
+def _get_real_key(item_prefix, key):
+    if item_prefix == key:
+        return None
+    item_prefix += ":"
+    if not key.startswith(item_prefix):
+        return key
+    else:
+        return key[len(item_prefix):]
+
+
+def _make_key(item_prefix, key):
+    if key.__class__ is str:
+        return item_prefix + ':' + key
+    if key is None:
+        return item_prefix
+    if isinstance(key, (tuple, list)):
+        key = ':'.join(map(force_str, key))
+    return '%s:%s' % (item_prefix, key)
+
+
 class CacheItem:
     """
     缓存项目类
+
+    :param compress_threshold: 序列化后超过该大小（字节）的值压缩后写入缓存，为空不压缩
+    :param max_size: 写入缓存的值（压缩后）超过该大小（字节）时不写入缓存，为空不限制
+    :param compressor: 压缩方式 zlib 或 lz4（未安装时使用 zlib），也可传入实现 compress/decompress 的对象
     """
-    def __init__(self, cache=None, name=None, default_timeout=DEFAULT_TIMEOUT):
+    def __init__(
+            self, cache=None, name=None, default_timeout=DEFAULT_TIMEOUT, versioned=False,
+            compress_threshold=None, max_size=None, compressor=ZlibCompressor.name
+    ):
         self.cache = cache
         self.name = name
         self.default_timeout = default_timeout
+        self.versioned = versioned
+        self.compress_threshold = compress_threshold
+        self.max_size = max_size
+        self.compressor = get_compressor(compressor)
+        self.packed = compress_threshold is not None or max_size is not None
+        # 由 BaseCache 预先生成的 key 前缀，未重写 key 生成方法时常用方法直接调用缓存后端
+        self.prefix = None
+        self.fast = False
+
+    def _prefix(self):
+        if self.versioned:
+            return self.cache.item_prefix(self)
+        return self.prefix
+
+    def _pack_value(self, value):
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if self.compress_threshold is not None and len(data) >= self.compress_threshold:
+            data = self.compressor.compress(data)
+            value = CompressedValue(self.compressor.name, data)
+        else:
+            value = PickledValue(data)
+        if self.max_size is not None and len(data) > self.max_size:
+            return _MISSING
+        return value
+
+    def _pack(self, key, value):
+        value = self._pack_value(value)
+        if value is _MISSING:
+            self.cache.on_oversize(self, [key])
+        return value
 
-    def add(self, key, value, timeout=DEFAULT_TIMEOUT):
-        return self.cache.inner_call(self, 'add', key=key, value=value, timeout=timeout)
+    def _pack_many(self, data):
+        ret = dict()
+        oversize = list()
+        for key, value in data.items():
+            value = self._pack_value(value)
+            if value is _MISSING:
+                oversize.append(key)
+            else:
+                ret[key] = value
+        if oversize:
+            self.cache.on_oversize(self, oversize)
+        return ret
+
+    def _unpack_many(self, data):
+        if self.packed:
+            return {key: _unpack(value) for key, value in data.items()}
+        return data
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, tags=None):
+        if self.packed:
+            value = self._pack(key, value)
+            if value is _MISSING:
+                return False
+        if tags:
+            value = TaggedValue(value, self.cache.get_tag_versions(tags))
+        if self.fast and not _listeners:
+            cache = self.cache
+            ret = cache.cache.add(_make_key(self._prefix(), key), value, cache.get_timeout(self, timeout))
+        else:
+            ret = self.cache.inner_call(self, 'add', key=key, value=value, timeout=timeout)
+        return ret
 
     def get(self, key, default=None):
-        return self.cache.inner_call(self, 'get', key=key, default=default)
+        if self.fast and not _listeners:
+            value = self.cache.cache.get(_make_key(self._prefix(), key), default)
+        else:
+            value = self.cache.inner_call(self, 'get', key=key, default=default)
+        if value.__class__ is TaggedValue:
+            value = self.cache.check_tags({key: value}).get(key, default)
+        return _unpack(value) if self.packed else value
 
-    def set(self, key, value, timeout=DEFAULT_TIMEOUT):
-        return self.cache.inner_call(self, 'set', key=key, value=value, timeout=timeout)
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, tags=None):
+        """
+        写入缓存
+
+        :param tags: 缓存 tag 列表，`invalidate_tags` 后失效
+        """
+        if self.packed:
+            value = self._pack(key, value)
+            if value is _MISSING:
+                return
+        if tags:
+            value = TaggedValue(value, self.cache.get_tag_versions(tags))
+        if self.fast and not _listeners:
+            cache = self.cache
+            ret = cache.cache.set(_make_key(self._prefix(), key), value, cache.get_timeout(self, timeout))
+        else:
+            ret = self.cache.inner_call(self, 'set', key=key, value=value, timeout=timeout)
+        return ret
 
     def touch(self, key, timeout=DEFAULT_TIMEOUT):
         return self.cache.inner_call(self, 'touch', key=key, timeout=timeout)
 
     def delete(self, key):
+        if self.fast and not _listeners:
+            return self.cache.cache.delete(_make_key(self._prefix(), key))
         return self.cache.inner_call(self, 'delete', key=key)
 
     def get_many(self, keys):
-        return self.cache.inner_call(self, 'get_many', keys=keys, ret_dict_key=True)
+        if self.fast and not _listeners:
+            prefix = self._prefix()
+            ret = self.cache.cache.get_many([_make_key(prefix, key) for key in keys])
+            ret = {_get_real_key(prefix, k): v for k, v in ret.items()}
+        else:
+            ret = self.cache.inner_call(self, 'get_many', keys=keys, ret_dict_key=True)
+        return self._unpack_many(self.cache.check_tags(ret))
 
     def get_or_set(self, key, default, timeout=DEFAULT_TIMEOUT):
-        return self.cache.inner_call(self, 'get_or_set', key=key, default=default, timeout=timeout)
+        if not self.packed:
+            value = self.cache.inner_call(self, 'get_or_set', key=key, default=default, timeout=timeout)
+            if value.__class__ is not TaggedValue:
+                return value
+        # 压缩及大小限制的值需要在写入前处理，带 tag 的值需要检查 tag 是否失效，与缓存后端 get_or_set 逻辑一致
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            if callable(default):
+                default = default()
+            self.add(key, default, timeout)
+            value = self.get(key, default)
+        return value
 
     def incr(self, key, delta=1):
         return self.cache.inner_call(self, 'incr', key=key, delta=delta)
@@ -47,15 +441,369 @@ class CacheItem:
     def decr(self, key, delta=1):
         return self.cache.inner_call(self, 'decr', key=key, delta=delta)
 
-    def set_many(self, data, timeout=DEFAULT_TIMEOUT):
-        return self.cache.inner_call(self, 'set_many', key_dict_fields=('data', ), data=data, timeout=timeout)
+    def _tag_many(self, data, versions):
+        return {key: TaggedValue(value, versions) for key, value in data.items()}
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, tags=None):
+        if self.packed:
+            data = self._pack_many(data)
+        if tags:
+            data = self._tag_many(data, self.cache.get_tag_versions(tags))
+        if self.fast and not _listeners:
+            cache = self.cache
+            prefix = self._prefix()
+            ret = cache.cache.set_many(
+                {_make_key(prefix, key): value for key, value in data.items()}, cache.get_timeout(self, timeout)
+            )
+        else:
+            ret = self.cache.inner_call(self, 'set_many', key_dict_fields=('data', ), data=data, timeout=timeout)
+        return ret
 
     def delete_many(self, keys):
+        if self.fast and not _listeners:
+            prefix = self._prefix()
+            return self.cache.cache.delete_many([_make_key(prefix, key) for key in keys])
         return self.cache.inner_call(self, 'delete_many', keys=keys)
 
     def call(self, func_name, **kwargs):
         return self.cache.inner_call(self, func_name, **kwargs)
 
+    async def aadd(self, key, value, timeout=DEFAULT_TIMEOUT, tags=None):
+        if self.packed:
+            value = self._pack(key, value)
+            if value is _MISSING:
+                return False
+        if tags:
+            value = TaggedValue(value, await self.cache.aget_tag_versions(tags))
+        return await self.cache.ainner_call(self, 'add', key=key, value=value, timeout=timeout)
+
+    async def aget(self, key, default=None):
+        value = await self.cache.ainner_call(self, 'get', key=key, default=default)
+        if value.__class__ is TaggedValue:
+            value = (await self.cache.acheck_tags({key: value})).get(key, default)
+        return _unpack(value) if self.packed else value
+
+    async def aset(self, key, value, timeout=DEFAULT_TIMEOUT, tags=None):
+        if self.packed:
+            value = self._pack(key, value)
+            if value is _MISSING:
+                return
+        if tags:
+            value = TaggedValue(value, await self.cache.aget_tag_versions(tags))
+        return await self.cache.ainner_call(self, 'set', key=key, value=value, timeout=timeout)
+
+    async def adelete(self, key):
+        return await self.cache.ainner_call(self, 'delete', key=key)
+
+    async def aget_many(self, keys):
+        ret = await self.cache.ainner_call(self, 'get_many', keys=keys, ret_dict_key=True)
+        return self._unpack_many(await self.cache.acheck_tags(ret))
+
+    async def aset_many(self, data, timeout=DEFAULT_TIMEOUT, tags=None):
+        if self.packed:
+            data = self._pack_many(data)
+        if tags:
+            data = self._tag_many(data, await self.cache.aget_tag_versions(tags))
+        return await self.cache.ainner_call(
+            self, 'set_many', key_dict_fields=('data', ), data=data, timeout=timeout
+        )
+
+    async def adelete_many(self, keys):
+        return await self.cache.ainner_call(self, 'delete_many', keys=keys)
+
+    def lock(self, key, timeout=10):
+        return CacheLock(self, key, timeout)
+
+    def memoize(self, timeout=DEFAULT_TIMEOUT, key=None, lock_timeout=None):
+        """
+        缓存函数返回值的装饰器，lock_timeout 不为空时缓存未命中只有一个进程执行函数
+
+            @cache.item1.memoize(timeout=60, key=lambda a, b: (a, b))
+            def func(a, b):
+                ...
+            func.invalidate(a, b)
+
+        :param key: 由函数参数生成缓存 key 的函数，为空时使用全部参数的摘要，装饰方法时必须指定
+        """
+        def decorator(func):
+            return MemoizedFunction(self, func, timeout=timeout, key=key, lock_timeout=lock_timeout)
+        return decorator
+
+    def memoize_many(self, timeout=DEFAULT_TIMEOUT, key=None, lock_timeout=None):
+        """
+        批量缓存函数返回值的装饰器，被装饰函数第一个参数为 id 列表，返回 id 到结果的字典，只对缓存未命中的 id 调用函数
+
+            @cache.item1.memoize_many(timeout=60)
+            def func(ids):
+                return {obj.id: obj.name for obj in Model.objects.filter(id__in=ids)}
+            func([1, 2, 3])
+            func.invalidate([1, 2])
+
+        :param key: 由 id 及其他参数生成缓存 key 的函数，为空时使用全部参数的摘要，装饰方法时必须指定
+        """
+        def decorator(func):
+            return MemoizedManyFunction(self, func, timeout=timeout, key=key, lock_timeout=lock_timeout)
+        return decorator
+
+    def get_version(self, namespace=None):
+        return self.cache.get_version(self, namespace)
+
+    def incr_version(self, namespace=None):
+        """
+        增加版本号，versioned 为真时原有缓存全部失效
+        """
+        return self.cache.incr_version(self, namespace)
+
+
+class CacheLock:
+    """
+    基于缓存 add 实现的分布式锁，缓存 add 调用失败时退化为进程内锁
+
+        with cache.item1.lock("test") as acquired:
+            if acquired:
+                ...
+    """
+    _local_locks = weakref.WeakValueDictionary()
+    _local_locks_lock = threading.Lock()
+
+    def __init__(self, item, key, timeout=10):
+        self.item = item
+        if isinstance(key, (tuple, list)):
+            self.key = tuple(key) + ('__lock__', )
+        else:
+            self.key = (key, '__lock__')
+        self.timeout = timeout
+        self._token = None
+        self._local_lock = None
+
+    def _acquire_local(self):
+        lock_key = self.item.cache.make_key(self.item, self.key)
+        with self._local_locks_lock:
+            lock = self._local_locks.get(lock_key, None)
+            if lock is None:
+                lock = threading.Lock()
+                self._local_locks[lock_key] = lock
+        if lock.acquire(blocking=False):
+            self._local_lock = lock
+            return True
+        return False
+
+    def _acquire(self):
+        token = get_random_string(16)
+        try:
+            acquired = self.item.add(self.key, token, self.timeout)
+        except Exception:
+            return self._acquire_local()
+        if acquired:
+            self._token = token
+        return acquired
+
+    def acquire(self, blocking=False, blocking_timeout=None, interval=0.05):
+        """
+        获取锁，blocking 为真时最多等待 blocking_timeout 秒（默认为锁超时时间）
+        """
+        if blocking_timeout is None:
+            blocking_timeout = self.timeout
+        deadline = time.monotonic() + blocking_timeout
+        while True:
+            if self._acquire():
+                return True
+            if not blocking or time.monotonic() >= deadline:
+                return False
+            time.sleep(interval)
+
+    async def _aacquire(self):
+        token = get_random_string(16)
+        try:
+            acquired = await self.item.aadd(self.key, token, self.timeout)
+        except Exception:
+            return self._acquire_local()
+        if acquired:
+            self._token = token
+        return acquired
+
+    async def aacquire(self, blocking=False, blocking_timeout=None, interval=0.05):
+        """
+        `acquire` 的异步版本
+        """
+        if blocking_timeout is None:
+            blocking_timeout = self.timeout
+        deadline = time.monotonic() + blocking_timeout
+        while True:
+            if await self._aacquire():
+                return True
+            if not blocking or time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(interval)
+
+    async def arelease(self):
+        if self._local_lock is not None:
+            self._local_lock.release()
+            self._local_lock = None
+        elif self._token is not None:
+            if await self.item.aget(self.key) == self._token:
+                await self.item.adelete(self.key)
+            self._token = None
+
+    def release(self):
+        if self._local_lock is not None:
+            self._local_lock.release()
+            self._local_lock = None
+        elif self._token is not None:
+            if self.item.get(self.key) == self._token:
+                self.item.delete(self.key)
+            self._token = None
+
+    @property
+    def locked(self):
+        return self._local_lock is not None or self._token is not None
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.locked:
+            self.release()
+
+    async def __aenter__(self):
+        return await self.aacquire()
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if self.locked:
+            await self.arelease()
+
+
+class MemoizedFunction:
+    """
+    `CacheItem.memoize` 装饰后的函数
+    """
+    lock_interval = 0.05
+
+    def __init__(self, item, func, *, timeout=DEFAULT_TIMEOUT, key=None, lock_timeout=None):
+        functools.update_wrapper(self, func)
+        self.item = item
+        self.func = func
+        self.timeout = timeout
+        self.key = key
+        self.lock_timeout = lock_timeout
+        self.name = '%s.%s' % (func.__module__, func.__qualname__)
+        self.instance = None
+
+    def __set_name__(self, owner, name):
+        # 默认 key 无法稳定区分实例，装饰方法时必须指定 key
+        if self.key is None:
+            raise ImproperlyConfigured('%s: memoize on a method requires key' % self.name)
+
+    def __get__(self, instance, owner=None):
+        """
+        装饰方法时绑定实例，实例作为第一个参数传给函数及 key 函数
+        """
+        if instance is None:
+            return self
+        bound = copy.copy(self)
+        bound.instance = instance
+        return bound
+
+    def _bind(self, args):
+        if self.instance is None:
+            return args
+        return (self.instance, ) + args
+
+    def make_key(self, *args, **kwargs):
+        args = self._bind(args)
+        if self.key is None:
+            # 参数区分类型序列化后取摘要，避免不同参数生成相同 key
+            return '%s:%s' % (self.name, key_digest([list(args), kwargs]))
+        key = self.key(*args, **kwargs)
+        if not isinstance(key, (tuple, list)):
+            key = (key, )
+        return ':'.join(map(force_str, (self.name, ) + tuple(key)))
+
+    def _wait(self, keys):
+        """
+        等待其他进程写入缓存
+        """
+        ret = dict()
+        deadline = time.monotonic() + self.lock_timeout
+        while keys and time.monotonic() < deadline:
+            time.sleep(self.lock_interval)
+            ret.update(self.item.get_many(keys))
+            keys = [key for key in keys if key not in ret]
+        return ret
+
+    def __call__(self, *args, **kwargs):
+        key = self.make_key(*args, **kwargs)
+        value = self.item.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        if self.lock_timeout:
+            with self.item.lock(key, self.lock_timeout) as acquired:
+                if not acquired:
+                    data = self._wait([key])
+                    if key in data:
+                        return data[key]
+                else:
+                    # 加锁前其他进程可能已写入缓存
+                    value = self.item.get(key, _MISSING)
+                    if value is not _MISSING:
+                        return value
+                value = self.func(*self._bind(args), **kwargs)
+                self.item.set(key, value, self.timeout)
+                return value
+        value = self.func(*self._bind(args), **kwargs)
+        self.item.set(key, value, self.timeout)
+        return value
+
+    def invalidate(self, *args, **kwargs):
+        """
+        清空参数对应的缓存
+        """
+        self.item.delete(self.make_key(*args, **kwargs))
+
+
+class MemoizedManyFunction(MemoizedFunction):
+    """
+    `CacheItem.memoize_many` 装饰后的函数
+    """
+
+    def __call__(self, ids, *args, **kwargs):
+        keys = {_id: self.make_key(_id, *args, **kwargs) for _id in ids}
+        data = self.item.get_many(list(keys.values()))
+        missing = [_id for _id, key in keys.items() if key not in data]
+        locks = list()
+        try:
+            if missing and self.lock_timeout:
+                wait_keys = list()
+                load_ids = list()
+                for _id in missing:
+                    lock = self.item.lock(keys[_id], self.lock_timeout)
+                    if lock.acquire():
+                        locks.append(lock)
+                        load_ids.append(_id)
+                    else:
+                        wait_keys.append(keys[_id])
+                if load_ids:
+                    # 加锁前其他进程可能已写入缓存
+                    data.update(self.item.get_many([keys[_id] for _id in load_ids]))
+                if wait_keys:
+                    data.update(self._wait(wait_keys))
+                missing = [_id for _id in missing if keys[_id] not in data]
+            if missing:
+                values = self.func(*self._bind((missing, ) + args), **kwargs)
+                values = {_id: value for _id, value in values.items() if _id in keys}
+                self.item.set_many({keys[_id]: value for _id, value in values.items()}, self.timeout)
+                data.update({keys[_id]: value for _id, value in values.items()})
+        finally:
+            for lock in locks:
+                lock.release()
+        return {_id: data[key] for _id, key in keys.items() if key in data}
+
+    def invalidate(self, ids, *args, **kwargs):
+        """
+        清空 id 列表对应的缓存
+        """
+        self.item.delete_many([self.make_key(_id, *args, **kwargs) for _id in ids])
+
 
 class BaseCache:
     """
@@ -66,27 +814,56 @@ class BaseCache:
             default_timeout = 600
             item1 = CacheItem()
             item2 = CacheItem(default_timeout=60)
+            item3 = CacheItem(versioned=True)
         cache = MyCache()
         cache.item1.set("test", 1)
         cache.item1.get("test")
+        cache.item3.incr_version()  # item3 中原有缓存全部失效
+        cache.item1.set("test", 1, tags=["tag1"])
+        cache.invalidate_tags(["tag1"])  # tag1 对应的缓存全部失效
     """
     key_prefix = None
     default_timeout = DEFAULT_TIMEOUT
     cache_alias = DEFAULT_CACHE_ALIAS
+    # tag 版本号所在的缓存
+    tags_cache_alias = DEFAULT_CACHE_ALIAS
+    # 版本号进程内缓存时间
+    version_timeout = 1
 
     def __new__(cls, *args, **kwargs):
         self = super().__new__(cls)
+        # 未重写 key 生成及调用方法时，CacheItem 常用方法跳过 inner_call 直接调用缓存后端
+        fast = (
+            cls.item_prefix is BaseCache.item_prefix
+            and cls.make_key is BaseCache.make_key
+            and cls.inner_call is BaseCache.inner_call
+        )
         api_endpoints = inspect.getmembers(self, _is_cache_item)
         for name, api in api_endpoints:
-            api_cls = type(api)
-            api = api_cls(self, name)
+            api = copy.copy(api)
+            api.cache = self
+            api.name = name
+            api.prefix = '%s:%s' % (cls.key_prefix, name)
+            api.fast = fast
             setattr(self, name, api)
         return self
 
     def __init__(self):
         self.cache = caches[self.cache_alias]
+        self._versions = dict()
         assert self.key_prefix is not None
 
+    def batch(self):
+        """
+        批量操作，多个缓存项目的操作延迟到退出时合并执行（一次 set_many、一次 delete_many、一次 get_many）
+
+            with cache.batch() as b:
+                f1 = b.item1.get("test")
+                f2 = b.item2.get_many(["test1", "test2"])
+            f1.result(), f2.result()
+        """
+        return CacheBatch(self)
+
     def get_timeout(self, item=None, timeout=DEFAULT_TIMEOUT):
         if timeout == DEFAULT_TIMEOUT:
             if _is_cache_item(item) and item.default_timeout != DEFAULT_TIMEOUT:
@@ -97,54 +874,651 @@ class BaseCache:
             timeout = -1
         return timeout
 
+    def version_key(self, item, namespace=None):
+        k = '%s:%s:__version__' % (self.key_prefix, item.name)
+        if namespace is not None:
+            k = '%s:%s' % (k, namespace)
+        return k
+
+    def get_version(self, item, namespace=None):
+        """
+        获取版本号，进程内缓存 version_timeout 秒
+        """
+        version_key = self.version_key(item, namespace)
+        now = time.monotonic()
+        cached = self._versions.get(version_key, None)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+        version = self.cache.get(version_key)
+        if version is None:
+            # 版本号不存在（或已被淘汰）时使用当前时间，不会与之前的版本号重复
+            self.cache.add(version_key, int(time.time() * 1000), timeout=None)
+            version = self.cache.get(version_key, 0)
+        self._versions[version_key] = (now + self.version_timeout, version)
+        return version
+
+    async def aget_version(self, item, namespace=None):
+        """
+        `get_version` 的异步版本
+        """
+        version_key = self.version_key(item, namespace)
+        now = time.monotonic()
+        cached = self._versions.get(version_key, None)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+        version = await _acache_call(self.cache, 'get', version_key)
+        if version is None:
+            await _acache_call(self.cache, 'add', version_key, int(time.time() * 1000), None)
+            version = await _acache_call(self.cache, 'get', version_key, 0)
+        self._versions[version_key] = (now + self.version_timeout, version)
+        return version
+
+    def incr_version(self, item, namespace=None):
+        """
+        增加版本号
+        """
+        version_key = self.version_key(item, namespace)
+        try:
+            version = self.cache.incr(version_key)
+        except ValueError:
+            version = int(time.time() * 1000)
+            self.cache.set(version_key, version, timeout=None)
+        self._versions[version_key] = (time.monotonic() + self.version_timeout, version)
+        return version
+
+    def get_tag_versions(self, tags):
+        """
+        获取 tag 当前版本号，写入带 tag 的缓存时使用
+        """
+        return get_tag_versions(tags, self.tags_cache_alias)
+
+    async def aget_tag_versions(self, tags):
+        return await aget_tag_versions(tags, self.tags_cache_alias)
+
+    def check_tags(self, data):
+        """
+        去掉缓存值中的 tag 信息，tag 已失效的值视为未命中
+        """
+        return check_tags(data, self.tags_cache_alias)
+
+    async def acheck_tags(self, data):
+        return await acheck_tags(data, self.tags_cache_alias)
+
+    def invalidate_tags(self, tags):
+        """
+        使 tag 对应的所有缓存失效
+        """
+        invalidate_tags(tags, self.tags_cache_alias)
+
     def item_prefix(self, item):
-        return '%s:%s' % (self.key_prefix, item.name)
+        prefix = item.prefix
+        if prefix is None:
+            prefix = '%s:%s' % (self.key_prefix, item.name)
+        if item.versioned:
+            return '%s:%s' % (prefix, self.get_version(item))
+        return prefix
+
+    async def aitem_prefix(self, item):
+        """
+        `item_prefix` 的异步版本，重写 item_prefix 时调用同步方法
+        """
+        if not item.versioned or self.__class__.item_prefix is not BaseCache.item_prefix:
+            return self.item_prefix(item)
+        prefix = item.prefix
+        if prefix is None:
+            prefix = '%s:%s' % (self.key_prefix, item.name)
+        return '%s:%s' % (prefix, await self.aget_version(item))
 
     def make_key(self, item, key):
-        k = self.item_prefix(item)
-        if isinstance(key, (tuple, list)):
-            key = ':'.join(map(force_str, key))
-        if key is not None:
-            k = '%s:%s' % (k, key)
-        return k
+        return _make_key(self.item_prefix(item), key)
 
-    def inner_call(
-            self, item, func_name, *,
-            key_fields=('key', ),
-            keys_fields=('keys', ),
-            key_dict_fields=(),
-            timeout_fields=('timeout', ),
-            ret_dict_key=False,
-            ret_list_key=False,
-            **kwargs
-    ):
+    def _key_maker(self, item, item_prefix):
+        """
+        生成缓存 key 的函数，未重写 make_key 时使用已计算的前缀，避免每个 key 重复获取版本号
+        """
+        if self.__class__.make_key is BaseCache.make_key:
+            return functools.partial(_make_key, item_prefix)
+        return functools.partial(self.make_key, item)
+
+    def _call_kwargs(self, item, item_prefix, key_fields, keys_fields, key_dict_fields, timeout_fields, kwargs):
+        make_key = self._key_maker(item, item_prefix)
         for key in key_fields:
             if key in kwargs:
-                kwargs[key] = self.make_key(item, kwargs[key])
+                kwargs[key] = make_key(kwargs[key])
         for keys in keys_fields:
             if keys in kwargs:
-                kwargs[keys] = [self.make_key(item, key) for key in kwargs[keys]]
+                kwargs[keys] = [make_key(key) for key in kwargs[keys]]
         for key_dict in key_dict_fields:
             if key_dict in kwargs and isinstance(kwargs[key_dict], dict):
-                kwargs[key_dict] = {self.make_key(item, key): value for key, value in kwargs[key_dict].items()}
+                kwargs[key_dict] = {make_key(key): value for key, value in kwargs[key_dict].items()}
         for timeout in timeout_fields:
             if timeout in kwargs:
                 kwargs[timeout] = self.get_timeout(item, kwargs[timeout])
-        ret = getattr(self.cache, func_name)(**kwargs)
-
-        def _get_real_key(_item_prefix, _key):
-            if _item_prefix == _key:
-                return None
-            _item_prefix += ":"
-            if not _key.startswith(_item_prefix):
-                return _key
-            else:
-                return _key[len(_item_prefix):]
+        return kwargs
 
+    @staticmethod
+    def _call_ret(item_prefix, ret, ret_dict_key, ret_list_key):
         if ret_dict_key and isinstance(ret, dict):
-            item_prefix = self.item_prefix(item)
             return {_get_real_key(item_prefix, k): v for k, v in ret.items()}
         if ret_list_key and isinstance(ret, list):
-            item_prefix = self.item_prefix(item)
             return [_get_real_key(item_prefix, k) for k in ret]
         return ret
+
+    def inner_call(
+            self, item, func_name, *,
+            key_fields=('key', ),
+            keys_fields=('keys', ),
+            key_dict_fields=(),
+            timeout_fields=('timeout', ),
+            ret_dict_key=False,
+            ret_list_key=False,
+            **kwargs
+    ):
+        item_prefix = self.item_prefix(item)
+        kwargs = self._call_kwargs(item, item_prefix, key_fields, keys_fields, key_dict_fields, timeout_fields, kwargs)
+        if _listeners:
+            start = time.perf_counter()
+            ret = getattr(self.cache, func_name)(**kwargs)
+            self._emit(item, item_prefix, func_name, kwargs, ret, time.perf_counter() - start)
+        else:
+            ret = getattr(self.cache, func_name)(**kwargs)
+        return self._call_ret(item_prefix, ret, ret_dict_key, ret_list_key)
+
+    async def ainner_call(
+            self, item, func_name, *,
+            key_fields=('key', ),
+            keys_fields=('keys', ),
+            key_dict_fields=(),
+            timeout_fields=('timeout', ),
+            ret_dict_key=False,
+            ret_list_key=False,
+            **kwargs
+    ):
+        """
+        inner_call 的异步版本，使用缓存后端的异步方法（如 aget），不支持时在线程中调用同步方法
+        """
+        item_prefix = await self.aitem_prefix(item)
+        kwargs = self._call_kwargs(item, item_prefix, key_fields, keys_fields, key_dict_fields, timeout_fields, kwargs)
+        func = getattr(self.cache, 'a%s' % func_name, None)
+        if func is None:
+            from asgiref.sync import sync_to_async
+            func = sync_to_async(getattr(self.cache, func_name))
+        if _listeners:
+            start = time.perf_counter()
+            ret = await func(**kwargs)
+            self._emit(item, item_prefix, func_name, kwargs, ret, time.perf_counter() - start)
+        else:
+            ret = await func(**kwargs)
+        return self._call_ret(item_prefix, ret, ret_dict_key, ret_list_key)
+
+    def get_instrument_name(self, item, item_prefix, keys):
+        """
+        监听事件中的统计名称，默认为缓存项目前缀
+        """
+        return item.prefix or '%s:%s' % (self.key_prefix, item.name)
+
+    def on_oversize(self, item, keys):
+        """
+        缓存值超过 max_size 未写入缓存时调用，记录日志并发送 op 为 oversize 的监听事件
+        """
+        item_prefix = self.item_prefix(item)
+        make_key = self._key_maker(item, item_prefix)
+        keys = [make_key(key) for key in keys]
+        logger.warning('Cache value exceeds max_size %s, skipped: %s', item.max_size, ', '.join(keys))
+        if _listeners:
+            event = CacheEvent(
+                cache=self,
+                item=item,
+                name=self.get_instrument_name(item, item_prefix, keys),
+                op='oversize',
+                keys=len(keys),
+                hits=0,
+                elapsed=0,
+                values=()
+            )
+            send_event(event)
+
+    def _emit(self, item, item_prefix, func_name, kwargs, ret, elapsed):
+        hits = 0
+        values = ()
+        if 'key' in kwargs:
+            keys = [kwargs['key']]
+            if func_name == 'get':
+                if ret is not kwargs.get('default', None):
+                    hits = 1
+                    values = (ret, )
+            elif 'value' in kwargs:
+                values = (kwargs['value'], )
+        elif 'keys' in kwargs:
+            keys = kwargs['keys']
+            if func_name == 'get_many':
+                hits = len(ret)
+                values = list(ret.values())
+        elif isinstance(kwargs.get('data', None), dict):
+            keys = list(kwargs['data'].keys())
+            values = list(kwargs['data'].values())
+        else:
+            keys = []
+        event = CacheEvent(
+            cache=self,
+            item=item,
+            name=self.get_instrument_name(item, item_prefix, keys),
+            op=func_name,
+            keys=len(keys),
+            hits=hits,
+            elapsed=elapsed,
+            values=values
+        )
+        send_event(event)
+
+
+class CacheFuture:
+    """
+    批量操作结果，批量操作执行后通过 result() 获取
+    """
+    def __init__(self):
+        self._done = False
+        self._value = None
+
+    @property
+    def done(self):
+        return self._done
+
+    def set_result(self, value):
+        self._value = value
+        self._done = True
+
+    def result(self):
+        if not self._done:
+            raise RuntimeError('Cache batch has not been executed')
+        return self._value
+
+
+class CacheBatchItem:
+    """
+    批量操作中的缓存项目，读取操作返回 `CacheFuture`
+    """
+    def __init__(self, batch, item):
+        self.batch = batch
+        self.item = item
+        self._make_key = item.cache._key_maker(item, item.cache.item_prefix(item))
+
+    def get(self, key, default=None):
+        return self.batch.add_get({self._make_key(key): key}, False, default, self.item.packed)
+
+    def get_many(self, keys):
+        return self.batch.add_get({self._make_key(key): key for key in keys}, True, packed=self.item.packed)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        self.set_many({key: value}, timeout)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT):
+        if self.item.packed:
+            data = self.item._pack_many(data)
+        timeout = self.item.cache.get_timeout(self.item, timeout)
+        self.batch.add_set({self._make_key(key): value for key, value in data.items()}, timeout)
+
+    def delete(self, key):
+        self.delete_many([key])
+
+    def delete_many(self, keys):
+        self.batch.add_delete([self._make_key(key) for key in keys])
+
+
+class CacheBatch:
+    """
+    缓存批量操作，执行时先写入（set_many、delete_many）再读取（get_many）
+    """
+    def __init__(self, cache):
+        self.cache = cache
+        self._items = dict()
+        self._gets = list()
+        self._sets = OrderedDict()
+        self._deletes = dict()
+
+    def __getattr__(self, name):
+        item = getattr(self.cache, name)
+        if not _is_cache_item(item):
+            raise AttributeError(name)
+        batch_item = self._items.get(name, None)
+        if batch_item is None:
+            batch_item = self._items[name] = CacheBatchItem(self, item)
+        return batch_item
+
+    def add_get(self, keys, many, default=None, packed=False):
+        future = CacheFuture()
+        self._gets.append((keys, many, default, packed, future))
+        return future
+
+    def add_set(self, data, timeout):
+        for key in data.keys():
+            for values in self._sets.values():
+                values.pop(key, None)
+            self._deletes.pop(key, None)
+        self._sets.setdefault(timeout, dict()).update(data)
+
+    def add_delete(self, keys):
+        for key in keys:
+            for values in self._sets.values():
+                values.pop(key, None)
+            self._deletes[key] = None
+
+    def _get_keys(self):
+        keys = dict()
+        for item_keys, _, _, _, _ in self._gets:
+            keys.update(dict.fromkeys(item_keys.keys()))
+        return list(keys.keys())
+
+    def _resolve(self, data):
+        gets, self._gets = self._gets, list()
+        for keys, many, default, packed, future in gets:
+            if many:
+                ret = {key: data[full_key] for full_key, key in keys.items() if full_key in data}
+                future.set_result({key: _unpack(value) for key, value in ret.items()} if packed else ret)
+            else:
+                value = data.get(next(iter(keys.keys())), default)
+                future.set_result(_unpack(value) if packed else value)
+
+    def _pop_writes(self):
+        sets, self._sets = self._sets, OrderedDict()
+        deletes, self._deletes = self._deletes, dict()
+        return [(data, timeout) for timeout, data in sets.items() if data], list(deletes.keys())
+
+    def execute(self):
+        sets, deletes = self._pop_writes()
+        for data, timeout in sets:
+            self.cache.cache.set_many(data, timeout)
+        if deletes:
+            self.cache.cache.delete_many(deletes)
+        keys = self._get_keys()
+        self._resolve(self.cache.check_tags(self.cache.cache.get_many(keys)) if keys else {})
+
+    async def aexecute(self):
+        """
+        `execute` 的异步版本
+        """
+        sets, deletes = self._pop_writes()
+        for data, timeout in sets:
+            await self._acall('set_many', data, timeout)
+        if deletes:
+            await self._acall('delete_many', deletes)
+        keys = self._get_keys()
+        self._resolve(await self.cache.acheck_tags(await self._acall('get_many', keys)) if keys else {})
+
+    async def _acall(self, func_name, *args):
+        return await _acache_call(self.cache.cache, func_name, *args)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.execute()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            await self.aexecute()
+
+
+class CacheMetrics:
+    """
+    缓存调用统计（调用次数、命中率、耗时 p50/p99、读写数据大小），注册为监听后生效
+
+        add_listener(cache_metrics)
+        cache_metrics.get_metrics()
+
+    设置 flush_interval 时定期将本进程统计写入缓存，可通过 `cache_metrics` 命令汇总查看所有进程的统计
+    """
+    key_prefix = 'cool:cache_metrics'
+
+    def __init__(self, max_samples=1000, flush_interval=None, cache_alias=DEFAULT_CACHE_ALIAS):
+        self.max_samples = max_samples
+        self.flush_interval = flush_interval
+        self.cache_alias = cache_alias
+        self.process_id = '%s:%s' % (socket.gethostname(), os.getpid())
+        self._lock = threading.Lock()
+        self._data = dict()
+        self._flush_at = None
+
+    @staticmethod
+    def _get_size(values):
+        size = 0
+        for value in values:
+            try:
+                size += len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+            except Exception:
+                pass
+        return size
+
+    def _get_data(self, name):
+        data = self._data.get(name, None)
+        if data is None:
+            data = self._data[name] = {
+                'calls': 0, 'keys': 0, 'hits': 0, 'misses': 0, 'bytes': 0, 'oversize': 0,
+                'latencies': deque(maxlen=self.max_samples)
+            }
+        return data
+
+    def _add_vary(self, event):
+        """
+        op 为 vary 的事件按 values 中的各维度统计命中情况（名称为 <name>:<维度>），不计入调用次数及耗时
+        """
+        with self._lock:
+            for vary in event.values:
+                data = self._get_data('%s:%s' % (event.name, vary))
+                data['keys'] += event.keys
+                data['hits'] += event.hits
+                data['misses'] += event.keys - event.hits
+
+    def __call__(self, event):
+        if event.op == 'vary':
+            self._add_vary(event)
+            return
+        size = self._get_size(event.values) if event.values else 0
+        with self._lock:
+            data = self._get_data(event.name)
+            if event.op == 'oversize':
+                data['oversize'] += event.keys
+                return
+            data['calls'] += 1
+            data['keys'] += event.keys
+            if event.op in ('get', 'get_many'):
+                data['hits'] += event.hits
+                data['misses'] += event.keys - event.hits
+            data['bytes'] += size
+            data['latencies'].append(event.elapsed)
+        if self.flush_interval:
+            now = time.monotonic()
+            if self._flush_at is None:
+                self._flush_at = now + self.flush_interval
+            elif now >= self._flush_at:
+                self._flush_at = now + self.flush_interval
+                self.flush()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                name: dict(data, latencies=list(data['latencies'])) for name, data in self._data.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._data.clear()
+
+    @staticmethod
+    def _percentile(samples, percent):
+        if not samples:
+            return None
+        return samples[int(round(percent * (len(samples) - 1)))]
+
+    @classmethod
+    def summarize(cls, snapshot):
+        """
+        计算统计结果（耗时单位为秒）
+        """
+        ret = dict()
+        for name, data in sorted(snapshot.items()):
+            latencies = sorted(data['latencies'])
+            reads = data['hits'] + data['misses']
+            ret[name] = {
+                'calls': data['calls'],
+                'keys': data['keys'],
+                'hits': data['hits'],
+                'misses': data['misses'],
+                'hit_ratio': data['hits'] / reads if reads else None,
+                'p50': cls._percentile(latencies, 0.5),
+                'p99': cls._percentile(latencies, 0.99),
+                'bytes': data['bytes'],
+                'oversize': data.get('oversize', 0),
+            }
+        return ret
+
+    def get_metrics(self):
+        """
+        本进程统计结果
+        """
+        return self.summarize(self.snapshot())
+
+    def _index_key(self):
+        return '%s:processes' % self.key_prefix
+
+    def flush(self):
+        """
+        将本进程统计写入缓存
+        """
+        timeout = max(self.flush_interval or 0, 60) * 10
+        cache = caches[self.cache_alias]
+        cache.set('%s:%s' % (self.key_prefix, self.process_id), self.snapshot(), timeout)
+        processes = cache.get(self._index_key()) or dict()
+        now = time.time()
+        processes = {k: v for k, v in processes.items() if v + timeout > now}
+        processes[self.process_id] = now
+        cache.set(self._index_key(), processes, timeout)
+
+    def load(self):
+        """
+        从缓存汇总所有进程写入的统计
+        """
+        cache = caches[self.cache_alias]
+        processes = cache.get(self._index_key()) or dict()
+        snapshots = cache.get_many(['%s:%s' % (self.key_prefix, process_id) for process_id in processes])
+        ret = dict()
+        for snapshot in snapshots.values():
+            for name, data in snapshot.items():
+                merged = ret.setdefault(
+                    name, {'calls': 0, 'keys': 0, 'hits': 0, 'misses': 0, 'bytes': 0, 'oversize': 0}
+                )
+                for k in ('calls', 'keys', 'hits', 'misses', 'bytes', 'oversize'):
+                    merged[k] += data.get(k, 0)
+                merged.setdefault('latencies', list()).extend(data['latencies'])
+        return ret
+
+    def clear(self):
+        """
+        清空缓存中所有进程的统计
+        """
+        cache = caches[self.cache_alias]
+        processes = cache.get(self._index_key()) or dict()
+        cache.delete_many(['%s:%s' % (self.key_prefix, process_id) for process_id in processes])
+        cache.delete(self._index_key())
+
+
+cache_metrics = CacheMetrics()
+
+
+class LocalCache:
+    """
+    进程内缓存（LRU淘汰，支持过期时间）
+
+        local = LocalCache(max_size=100)
+        local.set("test", 1, timeout=10)
+        local.get("test")
+    """
+    def __init__(self, max_size=1000):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.RLock()
+
+    def _get(self, key, now):
+        item = self._data.get(key, None)
+        if item is None:
+            return False, None
+        expire_at, value = item
+        if expire_at is not None and expire_at <= now:
+            del self._data[key]
+            return False, None
+        self._data.move_to_end(key)
+        return True, value
+
+    def get(self, key, default=None):
+        with self._lock:
+            found, value = self._get(key, time.monotonic())
+        return value if found else default
+
+    def get_many(self, keys):
+        ret = dict()
+        with self._lock:
+            now = time.monotonic()
+            for key in keys:
+                found, value = self._get(key, now)
+                if found:
+                    ret[key] = value
+        return ret
+
+    def set(self, key, value, timeout=None):
+        self.set_many({key: value}, timeout)
+
+    def set_many(self, data, timeout=None):
+        expire_at = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            for key, value in data.items():
+                self._data[key] = (expire_at, value)
+                self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        self.delete_many([key])
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class BaseBroadcast:
+    """
+    跨进程广播通道基类，用于通知所有进程清理进程内缓存
+
+    发布的消息所有订阅进程（包括发布者自身）都应收到
+    """
+    def publish(self, channel, message):
+        raise NotImplementedError
+
+    def subscribe(self, channel, callback):
+        raise NotImplementedError
+
+
+class LocalBroadcast(BaseBroadcast):
+    """
+    进程内广播，仅适用于单进程部署或测试
+    """
+    def __init__(self):
+        self._subscribers = defaultdict(list)
+
+    def publish(self, channel, message):
+        for callback in list(self._subscribers.get(channel, ())):
+            callback(message)
+
+    def subscribe(self, channel, callback):
+        self._subscribers[channel].append(callback)
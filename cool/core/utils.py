@@ -1,6 +1,11 @@
 # encoding: utf-8
+import atexit
+import logging
 import operator
+import queue
+import threading
 from functools import reduce
+from logging.handlers import QueueHandler, QueueListener
 
 from django.core.exceptions import FieldDoesNotExist
 from django.db.models import Q
@@ -92,3 +97,41 @@ def get_search_results(queryset, search_term, search_fields, model):
             queryset = queryset.filter(reduce(operator.or_, or_queries))
         use_distinct |= any(lookup_spawns_duplicates(model._meta, search_spec) for search_spec in orm_lookups)
     return queryset, use_distinct
+
+
+class _LoggerHandler(logging.Handler):
+    """
+    将日志交给原 logger 处理（使用原 logger 的 handler 及向上传递规则）
+    """
+    def __init__(self, logger):
+        super().__init__()
+        self.logger = logger
+
+    def emit(self, record):
+        self.logger.handle(record)
+
+
+_queue_loggers = dict()
+_queue_loggers_lock = threading.Lock()
+
+
+def get_queue_logger(logger):
+    """
+    获取在后台线程输出的 logger，日志通过 `QueueHandler` 放入队列，由后台线程交给原 logger 的 handler 输出
+    """
+    queue_logger = _queue_loggers.get(logger.name, None)
+    if queue_logger is not None:
+        return queue_logger
+    with _queue_loggers_lock:
+        queue_logger = _queue_loggers.get(logger.name, None)
+        if queue_logger is None:
+            log_queue = queue.SimpleQueue()
+            listener = QueueListener(log_queue, _LoggerHandler(logger))
+            listener.start()
+            atexit.register(listener.stop)
+            # 不注册到 logging 的 logger 层级中，不会重复向上传递
+            queue_logger = logging.Logger(logger.name)
+            queue_logger.propagate = False
+            queue_logger.addHandler(QueueHandler(log_queue))
+            _queue_loggers[logger.name] = queue_logger
+    return queue_logger
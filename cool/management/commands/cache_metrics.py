@@ -0,0 +1,39 @@
+# encoding: utf-8
+import json
+
+from django.core.management.base import BaseCommand
+
+from cool.core.cache import cache_metrics
+
+
+class Command(BaseCommand):
+    """
+    查看缓存调用统计（需开启 CACHE_METRICS_ENABLED）
+    """
+    help = 'dump cache metrics collected by all processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true', help='output as json')
+        parser.add_argument('--clear', action='store_true', help='clear collected metrics')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            cache_metrics.clear()
+            return
+        metrics = cache_metrics.summarize(cache_metrics.load())
+        if options['json']:
+            self.stdout.write(json.dumps(metrics, indent=2, sort_keys=True))
+            return
+        self.stdout.write('%-50s %10s %10s %10s %10s %12s %10s' % (
+            'name', 'calls', 'hit_ratio', 'p50(ms)', 'p99(ms)', 'bytes', 'oversize'
+        ))
+        for name, data in metrics.items():
+            self.stdout.write('%-50s %10d %10s %10s %10s %12d %10d' % (
+                name,
+                data['calls'],
+                '-' if data['hit_ratio'] is None else '%.2f%%' % (data['hit_ratio'] * 100),
+                '-' if data['p50'] is None else '%.3f' % (data['p50'] * 1000),
+                '-' if data['p99'] is None else '%.3f' % (data['p99'] * 1000),
+                data['bytes'],
+                data['oversize'],
+            ))
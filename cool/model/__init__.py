@@ -4,10 +4,13 @@ from cool.model.descriptors import (
     ForwardManyToOneCacheDescriptor, ForwardOneToOneCacheDescriptor,
 )
 from cool.model.fields import ForeignKey, OneToOneField
-from cool.model.models import AbstractUserMixin, BaseModel
+from cool.model.models import (
+    AbstractUserMixin, BaseModel, CacheManager, CacheQuerySet,
+)
+from cool.model.utils import prefetch_cached
 
 __all__ = [
     'ForwardManyToOneCacheDescriptor', 'ForwardOneToOneCacheDescriptor',
     'ForeignKey', 'OneToOneField',
-    'AbstractUserMixin', 'BaseModel',
+    'AbstractUserMixin', 'BaseModel', 'CacheManager', 'CacheQuerySet', 'prefetch_cached',
 ]
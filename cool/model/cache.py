@@ -1,13 +1,144 @@
 # encoding: utf-8
+import asyncio
+import contextlib
+import copy
+import hashlib
+import heapq
+import itertools
+import logging
 import operator
+import threading
+import time
+from collections import namedtuple
+from contextvars import ContextVar
 from functools import reduce
 
-from django.db import connections, models
+from django.db import connections, models, router, transaction
 from django.db.models import Func, Q
 from django.utils.crypto import get_random_string
 
 from cool.core import cache
 from cool.model.utils import TupleValue
+from cool.settings import cool_settings
+
+logger = logging.getLogger('cool.model')
+
+StaleValue = namedtuple('StaleValue', ('value', 'expire_at'))
+
+
+class NoneValue:
+    """
+    缓存中表示数据不存在
+    """
+
+
+NONE_VALUE = NoneValue()
+
+
+class PickleCodec:
+    """
+    缓存编码，直接保存对象（由缓存后端序列化）
+    """
+
+    def encode(self, model_cls, obj):
+        return obj
+
+    def decode(self, model_cls, value):
+        """
+        解码失败返回 None（视为未命中）
+        """
+        if not isinstance(value, model_cls):
+            return None
+        return value
+
+
+class CompactCodec(PickleCodec):
+    """
+    紧凑缓存编码，只保存 concrete field 的值及 schema hash，通过 `Model.from_db` 还原对象，
+    model 字段变更后 schema hash 不一致视为未命中
+    """
+
+    def __init__(self):
+        self._schemas = dict()
+
+    def get_schema(self, model_cls):
+        schema = self._schemas.get(model_cls, None)
+        if schema is None:
+            fields = model_cls._meta.concrete_fields
+            attnames = tuple(field.attname for field in fields)
+            desc = ";".join("%s:%s" % (field.attname, field.get_internal_type()) for field in fields)
+            schema_hash = hashlib.md5(("%s|%s" % (model_cls._meta.label, desc)).encode('utf-8')).hexdigest()[:8]
+            schema = self._schemas[model_cls] = (schema_hash, attnames)
+        return schema
+
+    def encode(self, model_cls, obj):
+        schema_hash, attnames = self.get_schema(model_cls)
+        return schema_hash, tuple(getattr(obj, attname) for attname in attnames)
+
+    def decode(self, model_cls, value):
+        schema_hash, attnames = self.get_schema(model_cls)
+        if not isinstance(value, tuple) or len(value) != 2 or value[0] != schema_hash:
+            return None
+        return model_cls.from_db(router.db_for_read(model_cls), attnames, value[1])
+
+
+_identity_map = ContextVar('cool_model_identity_map', default=None)
+
+
+@contextlib.contextmanager
+def identity_map():
+    """
+    请求级对象缓存，范围内通过缓存获取的同一对象只获取一次（基于 contextvars，协程安全）
+
+        with identity_map():
+            user1 = User.get_obj_by_pk_from_cache(1)
+            user2 = User.get_obj_by_pk_from_cache(1)  # 不再访问缓存
+    """
+    if _identity_map.get() is not None:
+        yield
+        return
+    token = _identity_map.set(dict())
+    try:
+        yield
+    finally:
+        _identity_map.reset(token)
+
+
+class KeyPlan:
+    """
+    model 缓存 key 生成计划，预先解析字段、排序及 key 模板，生成 key 时不再访问 model 元信息
+    """
+    __slots__ = ('field_names', 'order', 'related', 'prefix')
+
+    def __init__(self, model_cls, field_names):
+        assert issubclass(model_cls, models.Model)
+        assert field_names
+        fields = [ModelCache._get_field(model_cls, name) for name in field_names]
+        self.order = tuple(sorted(range(len(fields)), key=lambda idx: fields[idx].name))
+        fields = [fields[idx] for idx in self.order]
+        self.field_names = tuple(field.name for field in fields)
+        assert (
+            (len(fields) == 1 and fields[0].unique)
+            or self.field_names in ModelCache.get_unique_togethers(model_cls)
+        )
+        self.related = tuple(
+            (field.related_model, field.target_field.attname) if isinstance(field, models.ForeignObject) else None
+            for field in fields
+        )
+        self.prefix = "%s:%s:" % (model_cls._meta.db_table, "|".join(self.field_names))
+
+    def make_key(self, field_values):
+        """
+        返回 key 及排序后的字段名、字段值
+        """
+        values = list()
+        for idx, related in zip(self.order, self.related):
+            value = field_values[idx]
+            if related is not None and isinstance(value, related[0]):
+                value = getattr(value, related[1])
+            values.append(str(value))
+        values = tuple(values)
+        return self.prefix + "|".join(values), self.field_names, values
 
 
 class ModelCache(cache.BaseCache):
@@ -19,6 +150,102 @@ class ModelCache(cache.BaseCache):
 
     item = cache.CacheItem()
 
+    _key_plans = dict()
+    _unique_togethers = dict()
+
+    # 进程内缓存失效广播频道
+    broadcast_channel = 'cool:model_cache:invalidate'
+    # 刷新过期数据时默认加锁时间
+    lock_timeout = 10
+    # 等待其他进程加载数据时的轮询间隔
+    lock_interval = 0.05
+
+    def __init__(self):
+        super().__init__()
+        self._local = None
+        self._broadcast = None
+        self._local_lock = threading.Lock()
+        self._codec = None
+        self._delay_deleter = _DelayDeleter(self)
+        self.stats = dict()
+        self.reset_stats()
+
+    @property
+    def local(self):
+        """
+        进程内缓存，首次使用时创建并订阅失效广播
+        """
+        if self._local is None:
+            with self._local_lock:
+                if self._local is None:
+                    local = cache.LocalCache(max_size=cool_settings.MODEL_CACHE_LOCAL_MAX_SIZE)
+                    self.broadcast.subscribe(self.broadcast_channel, self._on_invalidate)
+                    self._local = local
+        return self._local
+
+    @property
+    def codec(self):
+        """
+        默认缓存编码，由 :setting:`MODEL_CACHE_CODEC_CLASS` 配置
+        """
+        if self._codec is None:
+            self._codec = cool_settings.MODEL_CACHE_CODEC_CLASS()
+        return self._codec
+
+    @property
+    def broadcast(self):
+        if self._broadcast is None:
+            self._broadcast = cool_settings.MODEL_CACHE_BROADCAST_CLASS()
+        return self._broadcast
+
+    def get_instrument_name(self, item, item_prefix, keys):
+        """
+        缓存调用统计按 model 数据表区分
+        """
+        name = super().get_instrument_name(item, item_prefix, keys)
+        if item is self.item and keys:
+            parts = keys[0][len(item_prefix) + 1:].split(':', 2)
+            if len(parts) == 3:
+                name = '%s:%s' % (name, parts[1])
+        return name
+
+    def _on_invalidate(self, keys):
+        if self._local is not None:
+            self._local.delete_many(keys)
+
+    def reset_stats(self):
+        self.stats = {
+            'identity': {'hits': 0, 'misses': 0},
+            'local': {'hits': 0, 'misses': 0},
+            'remote': {'hits': 0, 'misses': 0},
+        }
+
+    def get_stats(self):
+        """
+        各级缓存命中统计
+        """
+        return copy.deepcopy(self.stats)
+
+    def _count(self, tier, hits, misses):
+        stats = self.stats[tier]
+        stats['hits'] += hits
+        stats['misses'] += misses
+
+    def local_get_many(self, keys):
+        ret = self.local.get_many(keys)
+        self._count('local', len(ret), len(keys) - len(ret))
+        return {k: copy.copy(v) for k, v in ret.items()}
+
+    def local_set_many(self, data, timeout):
+        self.local.set_many({k: copy.copy(v) for k, v in data.items()}, timeout)
+
+    def local_delete_many(self, keys):
+        """
+        清理本进程及广播清理其他进程中的进程内缓存
+        """
+        self._on_invalidate(keys)
+        self.broadcast.publish(self.broadcast_channel, list(keys))
+
     @classmethod
     def _get_field(cls, model_cls, field_name):
         if field_name == 'pk':
@@ -27,41 +254,92 @@ class ModelCache(cache.BaseCache):
             return model_cls._meta.get_field(field_name)
 
     @classmethod
-    def _get_key(cls, model_cls, field_names, field_values):
+    def get_unique_togethers(cls, model_cls):
+        """
+        model 的联合唯一键字段名（按字段名排序）列表，包含 `unique_together` 及无条件的 `UniqueConstraint`
+        """
+        unique_togethers = cls._unique_togethers.get(model_cls, None)
+        if unique_togethers is None:
+            unique_togethers = list()
+            field_names_list = list(model_cls._meta.unique_together)
+            for constraint in model_cls._meta.constraints:
+                if not isinstance(constraint, models.UniqueConstraint):
+                    continue
+                # 带条件或表达式的唯一约束只在部分数据或计算值上唯一，不能用于缓存
+                if constraint.condition is not None or getattr(constraint, 'expressions', None):
+                    continue
+                field_names_list.append(constraint.fields)
+            for field_names in field_names_list:
+                field_names = tuple(sorted([cls._get_field(model_cls, field).name for field in field_names]))
+                if field_names not in unique_togethers:
+                    unique_togethers.append(field_names)
+            cls._unique_togethers[model_cls] = unique_togethers
+        return unique_togethers
+
+    @classmethod
+    def get_key_plan(cls, model_cls, field_names):
+        """
+        获取（首次使用时生成）缓存 key 生成计划
+        """
+        field_names = tuple(field_names)
+        plan = cls._key_plans.get((model_cls, field_names), None)
+        if plan is None:
+            plan = cls._key_plans[(model_cls, field_names)] = KeyPlan(model_cls, field_names)
+        return plan
+
+    @classmethod
+    def prepare_key_plans(cls, model_cls):
+        """
+        预先生成主键、唯一键、联合唯一键的缓存 key 生成计划
+        """
+        cls.get_key_plan(model_cls, ('pk', ))
+        for field in model_cls._meta.fields:
+            if field.unique:
+                cls.get_key_plan(model_cls, (field.name, ))
+        for unique_together in cls.get_unique_togethers(model_cls):
+            cls.get_key_plan(model_cls, unique_together)
+
+    def get_model_version(self, model_cls):
+        """
+        model 缓存版本号，进程内缓存 version_timeout 秒
+        """
+        return self.get_version(self.item, model_cls._meta.label_lower)
+
+    async def aget_model_version(self, model_cls):
+        """
+        `get_model_version` 的异步版本
+        """
+        return await self.aget_version(self.item, model_cls._meta.label_lower)
+
+    def _get_key(self, model_cls, field_names, field_values):
         assert (
             field_values and field_names
             and isinstance(field_values, (list, tuple))
             and isinstance(field_names, (list, tuple))
             and len(field_values) == len(field_names)
         )
-        assert issubclass(model_cls, models.Model)
-        temp = []
-        for name, value in zip(field_names, field_values):
-            field = cls._get_field(model_cls, name)
-            if isinstance(field, models.ForeignObject) and isinstance(value, field.related_model):
-                value = getattr(value, field.target_field.attname)
-            value = str(value)
-            temp.append((field.name, value, field))
-        field_names, field_values, fields = zip(*sorted(temp))
-        if len(field_names) == 1:
-            assert fields[0].unique
-        else:
-            unique_togethers = [
-                tuple(sorted([cls._get_field(model_cls, field).name for field in unique_together]))
-                for unique_together in model_cls._meta.unique_together
-            ]
-            assert field_names in unique_togethers
-
-        def _list_to_key(_input):
-            return "|".join(map(str, _input))
-        return "%s:%s:%s" % (
-            model_cls._meta.db_table, _list_to_key(field_names), _list_to_key(field_values)
-        ), field_names, field_values
+        key, names, values = self.get_key_plan(model_cls, field_names).make_key(field_values)
+        return '%s:%s' % (self.get_model_version(model_cls), key), names, values
 
-    @classmethod
-    def get_many_from_db(cls, model_cls, field_values, field_names):
+    def _get_keys(self, model_cls, field_names, field_values_list, version=None):
+        """
+        批量生成缓存 key，version 为空时获取 model 缓存版本号
+        """
+        assert field_names and isinstance(field_names, (list, tuple))
+        make_key = self.get_key_plan(model_cls, field_names).make_key
+        if version is None:
+            version = self.get_model_version(model_cls)
+        version = '%s:' % version
+        size = len(field_names)
+        ret = list()
+        for field_values in field_values_list:
+            assert len(field_values) == size
+            key, names, values = make_key(field_values)
+            ret.append((version + key, names, values))
+        return ret
 
-        ret = dict()
+    @classmethod
+    def _get_many_queryset(cls, model_cls, field_values, field_names):
         if hasattr(model_cls, 'get_queryset') and callable(model_cls.get_queryset):
             queryset = model_cls.get_queryset()
         else:
@@ -102,44 +380,561 @@ class ModelCache(cache.BaseCache):
                 value = str(value)
                 new_field_value.append(value)
             dict_keys_list.append(tuple(new_field_value))
+        return many_queryset, new_field_names, dict_keys_list
 
+    @classmethod
+    def get_many_from_db(cls, model_cls, field_values, field_names):
+
+        ret = dict()
+        many_queryset, new_field_names, dict_keys_list = cls._get_many_queryset(model_cls, field_values, field_names)
         for obj in many_queryset:
             ret[tuple([str(getattr(obj, field_name)) for field_name in new_field_names])] = obj
         return ret, dict_keys_list
 
-    def get_many(self, model_cls, field_names, field_values, *, ttl=None):
+    @classmethod
+    async def aget_many_from_db(cls, model_cls, field_values, field_names):
+        """
+        `get_many_from_db` 的异步版本，Django 不支持异步 ORM 时在线程中查询
+        """
+        ret = dict()
+        many_queryset, new_field_names, dict_keys_list = cls._get_many_queryset(model_cls, field_values, field_names)
+        if hasattr(many_queryset, '__aiter__'):
+            objs = [obj async for obj in many_queryset]
+        else:
+            from asgiref.sync import sync_to_async
+            objs = await sync_to_async(list)(many_queryset)
+        for obj in objs:
+            ret[tuple([str(getattr(obj, field_name)) for field_name in new_field_names])] = obj
+        return ret, dict_keys_list
+
+    def _decode_many(self, model_cls, keys, data, *, stale_ttl=None, codec=None):
+        if codec is None:
+            codec = self.codec
+        ret = dict()
+        stale_keys = list()
+        now = time.time()
+        for key, value in data.items():
+            stale = False
+            if isinstance(value, StaleValue):
+                stale = bool(stale_ttl) and value.expire_at <= now
+                value = value.value
+            if not isinstance(value, NoneValue):
+                value = codec.decode(model_cls, value)
+                if value is None:
+                    continue
+            if stale:
+                stale_keys.append(key)
+            ret[key] = value
+        self._count('remote', len(ret), len(keys) - len(ret))
+        return ret, stale_keys
+
+    def _encode_many(self, model_cls, data, ttl, *, stale_ttl=None, codec=None):
+        if codec is None:
+            codec = self.codec
+        data = {key: codec.encode(model_cls, value) for key, value in data.items()}
+        if stale_ttl:
+            expire_at = time.time() + ttl
+            data = {key: StaleValue(value, expire_at) for key, value in data.items()}
+            ttl += stale_ttl
+        return data, ttl
+
+    def remote_get_many(self, model_cls, keys, *, stale_ttl=None, codec=None):
+        """
+        从缓存获取数据，返回数据及已过软过期时间的key列表
+        """
+        return self._decode_many(model_cls, keys, self.item.get_many(keys), stale_ttl=stale_ttl, codec=codec)
+
+    async def remote_aget_many(self, model_cls, keys, *, stale_ttl=None, codec=None):
+        data = await self.item.aget_many(keys)
+        return self._decode_many(model_cls, keys, data, stale_ttl=stale_ttl, codec=codec)
+
+    def remote_set_many(self, model_cls, data, ttl, *, stale_ttl=None, codec=None):
+        data, ttl = self._encode_many(model_cls, data, ttl, stale_ttl=stale_ttl, codec=codec)
+        self.item.set_many(data, ttl)
+
+    async def remote_aset_many(self, model_cls, data, ttl, *, stale_ttl=None, codec=None):
+        data, ttl = self._encode_many(model_cls, data, ttl, stale_ttl=stale_ttl, codec=codec)
+        await self.item.aset_many(data, ttl)
+
+    def batch_lock(self, keys, timeout):
+        """
+        一批缓存 key 共用一个锁（一次 add），单个 key 时与 `item.lock(key)` 相同，多个 key 时使用排序后 key 的摘要
+        """
+        if len(keys) == 1:
+            return self.item.lock(keys[0], timeout)
+        digest = hashlib.md5('\n'.join(sorted(keys)).encode('utf-8')).hexdigest()
+        return self.item.lock(('__batch__', digest), timeout)
+
+    def _wait_many(self, model_cls, keys, lock, timeout, *, stale_ttl=None, codec=None):
+        """
+        等待其他进程加载数据，锁释放后（如数据不存在且不缓存）获取锁并停止等待，由调用方从数据库加载
+        """
+        ret = dict()
+        deadline = time.monotonic() + timeout
+        while keys and time.monotonic() < deadline:
+            time.sleep(self.lock_interval)
+            data, _ = self.remote_get_many(model_cls, keys, stale_ttl=stale_ttl, codec=codec)
+            ret.update(data)
+            keys = [key for key in keys if key not in data]
+            if keys and lock.acquire():
+                break
+        return ret
+
+    async def _await_many(self, model_cls, keys, lock, timeout, *, stale_ttl=None, codec=None):
+        ret = dict()
+        deadline = time.monotonic() + timeout
+        while keys and time.monotonic() < deadline:
+            await asyncio.sleep(self.lock_interval)
+            data, _ = await self.remote_aget_many(model_cls, keys, stale_ttl=stale_ttl, codec=codec)
+            ret.update(data)
+            keys = [key for key in keys if key not in data]
+            if keys and await lock.aacquire():
+                break
+        return ret
+
+    def _split_loaded(self, load_keys, db_data, cache_key_to_value, none_ttl):
+        """
+        将数据库加载结果按缓存 key 拆分为存在的数据及不存在的数据
+        """
+        value_to_cache_key = {cache_key_to_value[key]: key for key in load_keys}
+        data = {value_to_cache_key[value]: obj for value, obj in db_data.items() if value in value_to_cache_key}
+        none_data = dict()
+        if none_ttl:
+            none_data = {key: NONE_VALUE for key in load_keys if key not in data}
+        return data, none_data
+
+    def _load_many(self, model_cls, field_names, keys, cache_key_to_value, *,
+                   ttl, local_ttl=None, lock_timeout=None, stale_ttl=None, none_ttl=None, codec=None, locked=None):
+        """
+        从数据库加载数据并写入缓存，设置 lock_timeout 时同一key只有一个进程访问数据库
+
+        :param locked: (已获取锁的key, 锁)，这些key直接从数据库加载
+        """
+        ret = dict()
+        locks = list()
+        load_keys = list()
+        if locked is not None:
+            load_keys.extend(locked[0])
+            locks.append(locked[1])
+        try:
+            if lock_timeout and keys:
+                lock = self.batch_lock(keys, lock_timeout)
+                if lock.acquire():
+                    # 加锁前其他进程可能已写入缓存
+                    data, _ = self.remote_get_many(model_cls, keys, stale_ttl=stale_ttl, codec=codec)
+                else:
+                    data = self._wait_many(model_cls, keys, lock, lock_timeout, stale_ttl=stale_ttl, codec=codec)
+                if lock.locked:
+                    locks.append(lock)
+                ret.update(data)
+                keys = [key for key in keys if key not in data]
+            load_keys.extend(keys)
+            if load_keys:
+                db_data, _ = self.get_many_from_db(
+                    model_cls, [cache_key_to_value[key] for key in load_keys], field_names
+                )
+                data, none_data = self._split_loaded(load_keys, db_data, cache_key_to_value, none_ttl)
+                self.remote_set_many(model_cls, data, ttl, stale_ttl=stale_ttl, codec=codec)
+                if none_data:
+                    self.item.set_many(none_data, none_ttl)
+                self._local_set_loaded(data, none_data, local_ttl, none_ttl)
+                ret.update(data)
+                ret.update(none_data)
+        finally:
+            for lock in locks:
+                lock.release()
+        return ret, load_keys
+
+    async def _aload_many(self, model_cls, field_names, keys, cache_key_to_value, *,
+                          ttl, local_ttl=None, lock_timeout=None, stale_ttl=None, none_ttl=None, codec=None,
+                          locked=None):
+        ret = dict()
+        locks = list()
+        load_keys = list()
+        if locked is not None:
+            load_keys.extend(locked[0])
+            locks.append(locked[1])
+        try:
+            if lock_timeout and keys:
+                lock = self.batch_lock(keys, lock_timeout)
+                if await lock.aacquire():
+                    data, _ = await self.remote_aget_many(model_cls, keys, stale_ttl=stale_ttl, codec=codec)
+                else:
+                    data = await self._await_many(
+                        model_cls, keys, lock, lock_timeout, stale_ttl=stale_ttl, codec=codec
+                    )
+                if lock.locked:
+                    locks.append(lock)
+                ret.update(data)
+                keys = [key for key in keys if key not in data]
+            load_keys.extend(keys)
+            if load_keys:
+                db_data, _ = await self.aget_many_from_db(
+                    model_cls, [cache_key_to_value[key] for key in load_keys], field_names
+                )
+                data, none_data = self._split_loaded(load_keys, db_data, cache_key_to_value, none_ttl)
+                await self.remote_aset_many(model_cls, data, ttl, stale_ttl=stale_ttl, codec=codec)
+                if none_data:
+                    await self.item.aset_many(none_data, none_ttl)
+                self._local_set_loaded(data, none_data, local_ttl, none_ttl)
+                ret.update(data)
+                ret.update(none_data)
+        finally:
+            for lock in locks:
+                await lock.arelease()
+        return ret, load_keys
+
+    def _local_set_loaded(self, data, none_data, local_ttl, none_ttl):
+        if local_ttl:
+            self.local_set_many(data, local_ttl)
+            if none_data:
+                self.local_set_many(none_data, min(local_ttl, none_ttl))
+
+    def _prepare_get_many(self, model_cls, field_names, field_values, local_ttl, version=None):
+        """
+        生成缓存 key，并从请求级对象缓存、进程内缓存中获取数据
+
+        :return: (从数据库加载时使用的字段名, 缓存key到字段值, dict_keys_list, 已获取数据, 未获取的key, 事务中已修改的key)
+        """
         cache_key_to_value = dict()
-        value_to_cache_key = dict()
         dict_keys_list = list()
-        if ttl is None:
-            ttl = self.default_timeout
-        for field_value in field_values:
-            assert len(field_value) == len(field_names)
-            key, name, value = self._get_key(model_cls, field_names, field_value)
+        plan = self.get_key_plan(model_cls, field_names)
+        for key, name, value in self._get_keys(model_cls, field_names, field_values, version):
             dict_keys_list.append(value)
             cache_key_to_value[key] = value
-            value_to_cache_key[value] = key
-        ret = self.item.get_many(cache_key_to_value.keys())
-        if ret:
-            ret = {cache_key_to_value[k]: v for k, v in ret.items()}
-        else:
-            ret = dict()
+        ret = dict()
+        keys = list(cache_key_to_value.keys())
+        # 当前事务中已修改但未提交的数据直接从数据库获取，且不写入缓存
+        pending = self._get_pending(router.db_for_write(model_cls))
+        dirty_keys = list()
+        if pending is not None and pending.is_dirty(model_cls, keys):
+            if model_cls in pending.models:
+                dirty_keys, keys = keys, list()
+            else:
+                dirty_keys = [k for k in keys if k in pending]
+                keys = [k for k in keys if k not in pending]
+        objs = _identity_map.get()
+        if objs is not None:
+            identity_ret = {k: objs[k] for k in keys if k in objs}
+            self._count('identity', len(identity_ret), len(keys) - len(identity_ret))
+            ret.update(identity_ret)
+            keys = [k for k in keys if k not in identity_ret]
+        if keys and local_ttl:
+            ret.update(self.local_get_many(keys))
+            keys = [k for k in keys if k not in ret]
+        # 缓存 key 中的字段值按字段名排序，从数据库加载时使用同样排序的字段名
+        return plan.field_names, cache_key_to_value, dict_keys_list, ret, keys, dirty_keys
 
-        not_found_values = value_to_cache_key.keys() - ret.keys()
-        if not_found_values:
-            not_found_info, _ = self.get_many_from_db(model_cls, not_found_values, field_names)
-            self.item.set_many({value_to_cache_key[k]: v for k, v in not_found_info.items()}, ttl)
-            ret.update(not_found_info)
-        return ret, dict_keys_list
+    def _finish_get_many(self, ret, dirty_ret, cache_key_to_value, dict_keys_list):
+        objs = _identity_map.get()
+        if objs is not None:
+            objs.update(ret)
+        ret.update(dirty_ret)
+        return {
+            cache_key_to_value[k]: v for k, v in ret.items() if not isinstance(v, NoneValue)
+        }, dict_keys_list
 
-    def delete_many(self, model_cls, field_names, field_values):
-        keys = list()
-        for field_value in field_values:
-            assert len(field_value) == len(field_names)
-            key, name, value = self._get_key(model_cls, field_names, field_value)
-            keys.append(key)
+    def get_many(self, model_cls, field_names, field_values, *,
+                 ttl=None, local_ttl=None, lock_timeout=None, stale_ttl=None, none_ttl=None, codec=None):
+        """
+        批量获取数据，依次从请求级对象缓存（启用 identity_map 时）、进程内缓存（设置 local_ttl 时）、缓存、数据库中获取
+
+        :param ttl: 缓存时间
+        :param local_ttl: 进程内缓存时间
+        :param lock_timeout: 缓存未命中时加锁时间，同一key只有一个进程访问数据库，为空不加锁
+        :param stale_ttl: 缓存过期后仍可以返回旧数据的时间，期间只有一个进程刷新数据
+        :param none_ttl: 数据不存在时的缓存时间，为空不缓存
+        :param codec: 缓存编码，为空使用默认编码
+        """
+        if ttl is None:
+            ttl = self.default_timeout
+        field_names, cache_key_to_value, dict_keys_list, ret, keys, dirty_keys = self._prepare_get_many(
+            model_cls, field_names, field_values, local_ttl
+        )
+        dirty_ret = dict()
+        if dirty_keys:
+            db_data, _ = self.get_many_from_db(model_cls, [cache_key_to_value[k] for k in dirty_keys], field_names)
+            dirty_ret, _ = self._split_loaded(dirty_keys, db_data, cache_key_to_value, None)
+        locked = None
+        if keys:
+            remote_ret, stale_keys = self.remote_get_many(model_cls, keys, stale_ttl=stale_ttl, codec=codec)
+            ret.update(remote_ret)
+            keys = [k for k in keys if k not in remote_ret]
+            if stale_keys:
+                lock = self.batch_lock(stale_keys, lock_timeout or self.lock_timeout)
+                if lock.acquire():
+                    locked = (stale_keys, lock)
+            if local_ttl:
+                self.local_set_many({k: v for k, v in remote_ret.items() if k not in stale_keys}, local_ttl)
+        if keys or locked:
+            data, load_keys = self._load_many(
+                model_cls, field_names, keys, cache_key_to_value,
+                ttl=ttl, local_ttl=local_ttl, lock_timeout=lock_timeout, stale_ttl=stale_ttl, none_ttl=none_ttl,
+                codec=codec, locked=locked
+            )
+            for key in load_keys:
+                ret.pop(key, None)
+            ret.update(data)
+        return self._finish_get_many(ret, dirty_ret, cache_key_to_value, dict_keys_list)
+
+    async def aget_many(self, model_cls, field_names, field_values, *,
+                        ttl=None, local_ttl=None, lock_timeout=None, stale_ttl=None, none_ttl=None, codec=None):
+        """
+        `get_many` 的异步版本
+        """
+        if ttl is None:
+            ttl = self.default_timeout
+        version = await self.aget_model_version(model_cls)
+        field_names, cache_key_to_value, dict_keys_list, ret, keys, dirty_keys = self._prepare_get_many(
+            model_cls, field_names, field_values, local_ttl, version
+        )
+        dirty_ret = dict()
+        if dirty_keys:
+            db_data, _ = await self.aget_many_from_db(
+                model_cls, [cache_key_to_value[k] for k in dirty_keys], field_names
+            )
+            dirty_ret, _ = self._split_loaded(dirty_keys, db_data, cache_key_to_value, None)
+        locked = None
+        if keys:
+            remote_ret, stale_keys = await self.remote_aget_many(model_cls, keys, stale_ttl=stale_ttl, codec=codec)
+            ret.update(remote_ret)
+            keys = [k for k in keys if k not in remote_ret]
+            if stale_keys:
+                lock = self.batch_lock(stale_keys, lock_timeout or self.lock_timeout)
+                if await lock.aacquire():
+                    locked = (stale_keys, lock)
+            if local_ttl:
+                self.local_set_many({k: v for k, v in remote_ret.items() if k not in stale_keys}, local_ttl)
+        if keys or locked:
+            data, load_keys = await self._aload_many(
+                model_cls, field_names, keys, cache_key_to_value,
+                ttl=ttl, local_ttl=local_ttl, lock_timeout=lock_timeout, stale_ttl=stale_ttl, none_ttl=none_ttl,
+                codec=codec, locked=locked
+            )
+            for key in load_keys:
+                ret.pop(key, None)
+            ret.update(data)
+        return self._finish_get_many(ret, dirty_ret, cache_key_to_value, dict_keys_list)
+
+    def _get_pending(self, using, create=False):
+        """
+        获取数据库连接当前事务中等待提交后执行的缓存操作，不在事务中时返回 None
+
+        create 为真时注册提交后的回调，保存点回滚会丢弃其中注册的回调，因此每次修改都注册一次，提交后只执行第一次
+        """
+        connection = connections[using]
+        pending = getattr(connection, 'cool_model_cache_pending', None)
+        if not connection.in_atomic_block:
+            if pending is not None:
+                connection.cool_model_cache_pending = None
+            return None
+        if create:
+            if pending is None:
+                pending = connection.cool_model_cache_pending = _PendingOperations(self, connection)
+            transaction.on_commit(pending.commit, using=using)
+        return pending
+
+    def _pop_identity(self, keys):
+        objs = _identity_map.get()
+        if objs is not None:
+            for key in keys:
+                objs.pop(key, None)
+
+    def _set_keys(self, model_cls, data, *, ttl, local_ttl=None, stale_ttl=None, codec=None):
+        self.remote_set_many(model_cls, data, ttl, stale_ttl=stale_ttl, codec=codec)
+        if local_ttl:
+            # 只在使用进程内缓存时广播清理其他进程中的旧数据
+            self.local_delete_many(list(data.keys()))
+            self.local_set_many(data, local_ttl)
+
+    def _delete_keys(self, keys, local_keys=(), *, delay=True):
+        ret = self.item.delete_many(keys)
+        if local_keys:
+            self.local_delete_many(local_keys)
+        delay_delete = cool_settings.MODEL_CACHE_DELAY_DELETE
+        if delay and delay_delete:
+            self._delay_deleter.add(delay_delete, keys, local_keys)
+        return ret
+
+    def set_obj(self, model_cls, field_values_list, obj, *,
+                ttl=None, local_ttl=None, stale_ttl=None, codec=None, using=None):
+        """
+        将对象写入多个缓存 key（一次 set_many），在事务中时提交后清空，提交后读取时重新加载
+
+        :param field_values_list: (字段组合, 字段值) 列表
+        """
+        if ttl is None:
+            ttl = self.default_timeout
+        if using is None:
+            using = router.db_for_write(model_cls)
+        keys = [self._get_key(model_cls, field_names, values)[0] for field_names, values in field_values_list]
+        pending = self._get_pending(using, create=True)
+        if pending is not None:
+            # 事务中只清空，保存点回滚时不会写入回滚的数据
+            self._pop_identity(keys)
+            pending.delete_many(keys, bool(local_ttl))
+            return
+        data = {key: obj for key in keys}
+        self._set_keys(model_cls, data, ttl=ttl, local_ttl=local_ttl, stale_ttl=stale_ttl, codec=codec)
+        objs = _identity_map.get()
+        if objs is not None:
+            objs.update(data)
+
+    def delete_many(self, model_cls, field_names, field_values, *, local=True, using=None):
+        """
+        批量清空缓存，local 为真时同时清理所有进程中的进程内缓存
+
+        在事务中时，同一事务中的清空操作合并后在提交后执行，提交前本线程读取这些数据时直接访问数据库
+        """
+        keys = [key for key, name, value in self._get_keys(model_cls, field_names, field_values)]
+        return self.delete_keys(model_cls, keys, local=local, using=using)
+
+    def invalidate_model(self, model_cls, *, using=None):
+        """
+        增加 model 缓存版本号使该 model 所有缓存失效，在事务中时提交后再执行
+        """
+        if using is None:
+            using = router.db_for_write(model_cls)
+        pending = self._get_pending(using, create=True)
+        if pending is not None:
+            pending.invalidate_model(model_cls)
+            return
+        self.incr_version(self.item, model_cls._meta.label_lower)
+
+    def invalidate_tags(self, tags, *, using=None):
+        """
+        清空 tag 对应的所有缓存，using 对应的数据库在事务中时提交后再执行
+        """
+        if not tags:
+            return
+        if using is not None:
+            pending = self._get_pending(using, create=True)
+            if pending is not None:
+                pending.invalidate_tags(tags)
+                return
+        super().invalidate_tags(tags)
+
+    def delete_keys(self, model_cls, keys, *, local=True, using=None):
+        """
+        批量清空缓存 key，参数同 `delete_many`
+        """
+        if not keys:
+            return
+        if using is None:
+            using = router.db_for_write(model_cls)
+        self._pop_identity(keys)
+        pending = self._get_pending(using, create=True)
+        if pending is not None:
+            pending.delete_many(keys, local)
+            return
+        return self._delete_keys(keys, keys if local else ())
+
+
+class _PendingOperations:
+    """
+    事务中等待提交后执行的缓存失效操作，提交后合并执行（清空的 key 一次 delete_many）
+
+    只记录失效操作不记录写入，保存点回滚后提交时不会把回滚的数据写入缓存
+    """
+
+    def __init__(self, model_cache, connection):
+        self.model_cache = model_cache
+        self.connection = connection
+        # key -> 是否清理进程内缓存
+        self.keys = dict()
+        # 需要增加缓存版本号的 model
+        self.models = set()
+        # 需要清空的缓存 tag
+        self.tags = set()
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def is_dirty(self, model_cls, keys):
+        return model_cls in self.models or any(key in self.keys for key in keys)
+
+    def delete_many(self, keys, local):
+        for key in keys:
+            self.keys[key] = local or self.keys.get(key, False)
+
+    def invalidate_model(self, model_cls):
+        self.models.add(model_cls)
+
+    def invalidate_tags(self, tags):
+        self.tags.update(tags)
+
+    def commit(self):
+        if getattr(self.connection, 'cool_model_cache_pending', None) is self:
+            self.connection.cool_model_cache_pending = None
+        keys, self.keys = self.keys, dict()
+        models, self.models = self.models, set()
+        tags, self.tags = self.tags, set()
+        for model_cls in models:
+            self.model_cache.incr_version(self.model_cache.item, model_cls._meta.label_lower)
         if keys:
-            return self.item.delete_many(keys)
+            self.model_cache._delete_keys(list(keys), [key for key, local in keys.items() if local])
+        if tags:
+            self.model_cache.invalidate_tags(list(tags))
+
+
+class _DelayDeleter:
+    """
+    延迟再次清空缓存，所有延迟清空共用一个后台线程，到期的 key 合并后一次清空
+    """
+
+    def __init__(self, model_cache):
+        self.model_cache = model_cache
+        self._cond = threading.Condition()
+        # (到期时间, 序号, keys, local_keys)
+        self._queue = list()
+        self._counter = itertools.count()
+        self._thread = None
+
+    def add(self, delay, keys, local_keys=()):
+        with self._cond:
+            heapq.heappush(self._queue, (time.monotonic() + delay, next(self._counter), keys, local_keys))
+            # fork 后子进程中线程不存在，需要重新创建
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='cool-model-cache-delay-delete', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def pop_due(self, now=None):
+        """
+        取出已到期的 key，返回 (keys, local_keys)
+        """
+        if now is None:
+            now = time.monotonic()
+        keys = dict()
+        local_keys = dict()
+        with self._cond:
+            while self._queue and self._queue[0][0] <= now:
+                _, _, item_keys, item_local_keys = heapq.heappop(self._queue)
+                keys.update(dict.fromkeys(item_keys))
+                local_keys.update(dict.fromkeys(item_local_keys))
+        return list(keys), list(local_keys)
+
+    def _wait(self):
+        with self._cond:
+            while True:
+                if not self._queue:
+                    self._cond.wait()
+                    continue
+                timeout = self._queue[0][0] - time.monotonic()
+                if timeout <= 0:
+                    return
+                self._cond.wait(timeout)
+
+    def _run(self):
+        while True:
+            self._wait()
+            keys, local_keys = self.pop_due()
+            if not keys:
+                continue
+            try:
+                self.model_cache._delete_keys(keys, local_keys, delay=False)
+            except Exception:
+                logger.exception('delay delete model cache failed')
 
 
 model_cache = ModelCache()
@@ -0,0 +1,31 @@
+# encoding: utf-8
+import asyncio
+
+from cool.model.cache import identity_map
+
+try:
+    from django.utils.decorators import sync_and_async_middleware
+except ImportError:  # Django < 3.1
+    def sync_and_async_middleware(func):
+        return func
+
+
+@sync_and_async_middleware
+def identity_map_middleware(get_response):
+    """
+    请求内启用 `cool.model.cache.identity_map` ，请求结束后自动清空
+
+        MIDDLEWARE = [
+            ...
+            'cool.model.middleware.identity_map_middleware',
+        ]
+    """
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            with identity_map():
+                return await get_response(request)
+    else:
+        def middleware(request):
+            with identity_map():
+                return get_response(request)
+    return middleware
@@ -2,7 +2,7 @@
 import warnings
 
 from django.contrib.auth.models import Group, Permission
-from django.db import DatabaseError, models
+from django.db import DatabaseError, models, router
 from django.db.models.manager import EmptyManager
 from django.utils.functional import cached_property
 
@@ -93,6 +93,23 @@ class ModelCacheMixin:
 
     _MODEL_WITH_CACHE = True
     _MODEL_CACHE_TTL = 600
+    # 进程内缓存时间（秒），为0时不使用进程内缓存
+    _MODEL_CACHE_LOCAL_TTL = 0
+    # 缓存未命中时加锁时间（秒），同一key只有一个进程访问数据库，为0时不加锁
+    _MODEL_CACHE_LOCK_TIMEOUT = 0
+    # 缓存过期后仍可返回旧数据的时间（秒），期间只有一个进程刷新数据，为0时不返回旧数据
+    _MODEL_CACHE_STALE_TTL = 0
+    # 数据不存在时的缓存时间（秒），为0时不缓存
+    _MODEL_CACHE_NONE_TTL = 0
+    # 缓存编码（如 `cool.model.cache.CompactCodec()`），为空使用 MODEL_CACHE_CODEC_CLASS 配置
+    _MODEL_CACHE_CODEC = None
+    # 保存时将对象写入缓存（而非清空缓存）
+    _MODEL_CACHE_WRITE_THROUGH = False
+    # 清空或刷新对象缓存时同时清空 tag `get_cache_tag(pk)` 对应的缓存（如 `CoolBFFAPIView` 缓存的接口数据），
+    # model 所有缓存失效时清空 tag `get_cache_tag()` 对应的缓存
+    _MODEL_CACHE_TAGS = False
+    # queryset 批量修改（update、delete）超过该行数时不逐条清空缓存，改为使 model 所有缓存失效
+    _MODEL_CACHE_FLUSH_ROWS_LIMIT = 1000
 
     @classmethod
     def get_queryset(cls):
@@ -172,21 +189,242 @@ class ModelCacheMixin:
         )
         return data
 
+    @classmethod
+    async def aget_obj_by_pk_from_cache(cls, pk):
+        """
+        `get_obj_by_pk_from_cache` 的异步版本
+        """
+        _dict_keys_list = list()
+        data = await cls.aget_objs_from_cache(
+            field_names=['pk'], field_values=[(pk, )], _dict_keys_list=_dict_keys_list
+        )
+        return data.get(_dict_keys_list[0], None)
+
+    @classmethod
+    async def aget_objs_by_pks_from_cache(cls, pks, _dict_keys_list=None):
+        """
+        `get_objs_by_pks_from_cache` 的异步版本
+        """
+        return await cls.aget_objs_from_cache(
+            field_names=['pk'], field_values=[(pk, ) for pk in pks], _dict_keys_list=_dict_keys_list
+        )
+
+    @classmethod
+    async def aget_obj_by_unique_key_from_cache(cls, **kwargs):
+        """
+        `get_obj_by_unique_key_from_cache` 的异步版本
+        """
+        assert len(kwargs) == 1
+        name, value = list(kwargs.items())[0]
+        _dict_keys_list = list()
+        data = await cls.aget_objs_from_cache(
+            field_names=[name], field_values=[(value, )], _dict_keys_list=_dict_keys_list
+        )
+        return data.get(_dict_keys_list[0], None)
+
+    @classmethod
+    async def aget_objs_by_unique_keys_from_cache(cls, *, _dict_keys_list=None, **kwargs):
+        """
+        `get_objs_by_unique_keys_from_cache` 的异步版本
+        """
+        assert len(kwargs) == 1, kwargs
+        name, values = list(kwargs.items())[0]
+        return await cls.aget_objs_from_cache(
+            field_names=[name], field_values=[(value, ) for value in values], _dict_keys_list=_dict_keys_list
+        )
+
+    @classmethod
+    async def aget_obj_by_unique_together_key_from_cache(cls, **kwargs):
+        """
+        `get_obj_by_unique_together_key_from_cache` 的异步版本
+        """
+        field_names, field_values = zip(*kwargs.items())
+        _dict_keys_list = list()
+        data = await cls.aget_objs_from_cache(
+            field_names=field_names, field_values=[field_values], _dict_keys_list=_dict_keys_list
+        )
+        return data.get(_dict_keys_list[0], None)
+
+    @classmethod
+    async def aget_objs_by_unique_together_key_from_cache(cls, _dict_keys_list=None, **kwargs):
+        """
+        `get_objs_by_unique_together_key_from_cache` 的异步版本
+        """
+        value_size = None
+        for key, value in kwargs.items():
+            assert isinstance(value, (list, tuple))
+            if value_size is None:
+                value_size = len(value)
+            else:
+                assert len(value) == value_size
+        assert value_size is not None
+        field_names, field_values = zip(*kwargs.items())
+        field_values = list(zip(*field_values))
+        return await cls.aget_objs_from_cache(
+            field_names=field_names, field_values=field_values, _dict_keys_list=_dict_keys_list
+        )
+
+    @classmethod
+    def get_cache_field_names_list(cls):
+        """
+        缓存使用的字段组合列表（主键、唯一键、联合唯一键）
+        """
+        ret = [('pk', )]
+        for field in cls._meta.fields:
+            if field.unique and not field.primary_key:
+                ret.append((field.name, ))
+        ret.extend(model_cache.get_unique_togethers(cls))
+        return ret
+
+    @classmethod
+    def get_cache_attnames(cls):
+        """
+        缓存使用的所有字段 attname
+        """
+        ret = list()
+        for field_names in cls.get_cache_field_names_list():
+            for field_name in field_names:
+                attname = model_cache._get_field(cls, field_name).attname
+                if attname not in ret:
+                    ret.append(attname)
+        return ret
+
+    @classmethod
+    def get_cache_tag(cls, pk=None):
+        """
+        对象对应的缓存 tag（`app_label.model_name:pk`），pk 为空时为 model 对应的缓存 tag（`app_label.model_name`）
+        """
+        if pk is None:
+            return cls._meta.label_lower
+        return '%s:%s' % (cls._meta.label_lower, pk)
+
+    @classmethod
+    def get_cache_tags(cls, pk):
+        """
+        写入缓存时使用的 tag（对象及 model 对应的 tag），对象修改或 model 所有缓存失效后缓存自动失效
+
+            CACHE_ITEM.set(key, value, tags=Order.get_cache_tags(order.pk))
+        """
+        return [cls.get_cache_tag(pk), cls.get_cache_tag()]
+
+    @classmethod
+    def invalidate_cache_tags(cls, pks, using=None):
+        """
+        清空主键对应 tag 的缓存，在事务中时提交后再清空，`_MODEL_CACHE_TAGS` 为假时不处理
+        """
+        pks = [pk for pk in pks if pk is not None]
+        if not cls._MODEL_CACHE_TAGS or not pks:
+            return
+        if using is None:
+            using = router.db_for_write(cls)
+        model_cache.invalidate_tags([cls.get_cache_tag(pk) for pk in pks], using=using)
+
+    @classmethod
+    def flush_cache_rows(cls, rows, using=None):
+        """
+        批量清空数据对应的所有缓存（一次 delete_many）
+
+        :param rows: 数据列表，每项为 attname 到字段值的字典（至少包含 `get_cache_attnames` 中的字段）
+        """
+        if not cls._MODEL_WITH_CACHE or not rows:
+            return
+        keys = dict()
+        for field_names in cls.get_cache_field_names_list():
+            attnames = [model_cache._get_field(cls, field_name).attname for field_name in field_names]
+            field_values_list = list()
+            for row in rows:
+                values = [row[attname] for attname in attnames]
+                if None not in values:
+                    field_values_list.append(values)
+            keys.update(dict.fromkeys(key for key, _, _ in model_cache._get_keys(cls, field_names, field_values_list)))
+        model_cache.delete_keys(cls, list(keys), local=bool(cls._MODEL_CACHE_LOCAL_TTL), using=using)
+        cls.invalidate_cache_tags([row[cls._meta.pk.attname] for row in rows], using=using)
+
+    def get_cache_field_values_list(self, origin=False):
+        """
+        对象所有缓存对应的 (字段组合, 字段值) 列表，origin 为真时只返回有修改的字段组合及修改前的值
+        """
+        changed_map = self.__dict__.get('changed_map', {}) if origin else {}
+        ret = list()
+        for field_names in self.get_cache_field_names_list():
+            values = list()
+            changed = False
+            for field_name in field_names:
+                field = model_cache._get_field(self.__class__, field_name)
+                value = getattr(self, field.attname)
+                for name in (field.attname, field.name):
+                    if name in changed_map:
+                        value = changed_map[name]
+                        if field.is_relation and isinstance(value, models.Model):
+                            value = value.pk
+                        changed = True
+                        break
+                values.append(value)
+            # F() 等表达式保存后对象中的值未知，无法生成缓存 key
+            if any(hasattr(value, 'resolve_expression') for value in values):
+                continue
+            if not origin or changed:
+                ret.append((field_names, values))
+        return ret
+
     def flush_cache(self):
         """
-        清空对象所有缓存缓存
+        清空对象所有缓存缓存（包括唯一键修改前的缓存）
         """
         if not self._MODEL_WITH_CACHE:
             return
-        self.flush_field_cache(field_names=['pk'], field_values=[(self.pk, )])
-        for field in self._meta.fields:
-            if field.unique:
-                self.flush_field_cache(field_names=[field.name], field_values=[(getattr(self, field.name), )])
-        for field_together in self._meta.unique_together:
-            self.flush_field_cache(
-                field_names=field_together,
-                field_values=[[getattr(self, field_name) for field_name in field_together]]
-            )
+        self._flush_cache_keys(self._get_cache_keys(), self.pk)
+
+    def _get_cache_keys(self):
+        keys = list()
+        for field_names, values in self.get_cache_field_values_list() + self.get_cache_field_values_list(True):
+            key = model_cache._get_key(self.__class__, field_names, values)[0]
+            if key not in keys:
+                keys.append(key)
+        return keys
+
+    def _flush_cache_keys(self, keys, pk):
+        model_cache.delete_keys(
+            self.__class__, keys, local=bool(self._MODEL_CACHE_LOCAL_TTL), using=self._state.db
+        )
+        self.invalidate_cache_tags([pk], using=self._state.db)
+
+    def refresh_cache(self):
+        """
+        将对象写入所有缓存（一次 set_many），唯一键有修改时清空修改前的缓存
+        """
+        if not self._MODEL_WITH_CACHE:
+            return
+        cls = self.__class__
+        fields = cls._meta.concrete_fields
+        obj = cls.from_db(self._state.db, [f.attname for f in fields], [getattr(self, f.attname) for f in fields])
+        model_cache.set_obj(
+            model_cls=cls,
+            field_values_list=self.get_cache_field_values_list(),
+            obj=obj,
+            ttl=cls._MODEL_CACHE_TTL,
+            local_ttl=cls._MODEL_CACHE_LOCAL_TTL,
+            stale_ttl=cls._MODEL_CACHE_STALE_TTL,
+            codec=cls._MODEL_CACHE_CODEC,
+            using=self._state.db
+        )
+        for field_names, values in self.get_cache_field_values_list(origin=True):
+            self.flush_field_cache(field_names=field_names, field_values=[values], using=self._state.db)
+        self.invalidate_cache_tags([self.pk], using=self._state.db)
+
+    @classmethod
+    def invalidate_all_cache(cls, using=None):
+        """
+        使 model 所有缓存失效（如数据迁移或 queryset.update 之后），在事务中时提交后再执行
+
+        `_MODEL_CACHE_TAGS` 为真时同时清空 model 对应 tag（`get_cache_tag()`）的缓存
+        """
+        if using is None:
+            using = router.db_for_write(cls)
+        if cls._MODEL_WITH_CACHE:
+            model_cache.invalidate_model(cls, using=using)
+        if cls._MODEL_CACHE_TAGS:
+            model_cache.invalidate_tags([cls.get_cache_tag()], using=using)
 
     @classmethod
     def _check_field_key(cls, *, field_names, field_values):
@@ -199,14 +437,20 @@ class ModelCacheMixin:
             assert len(field_value) == len(field_names)
 
     @classmethod
-    def flush_field_cache(cls, *, field_names, field_values):
+    def flush_field_cache(cls, *, field_names, field_values, using=None):
         """
-        清空缓存
+        清空缓存，在事务中时提交后再清空
         """
         if not cls._MODEL_WITH_CACHE:
             return
         cls._check_field_key(field_names=field_names, field_values=field_values)
-        model_cache.delete_many(model_cls=cls, field_names=field_names, field_values=field_values)
+        model_cache.delete_many(
+            model_cls=cls,
+            field_names=field_names,
+            field_values=field_values,
+            local=bool(cls._MODEL_CACHE_LOCAL_TTL),
+            using=using
+        )
 
     @classmethod
     def get_objs_from_cache(cls, *, field_names, field_values, _dict_keys_list=None):
@@ -219,7 +463,12 @@ class ModelCacheMixin:
                 model_cls=cls,
                 field_names=field_names,
                 field_values=field_values,
-                ttl=cls._MODEL_CACHE_TTL
+                ttl=cls._MODEL_CACHE_TTL,
+                local_ttl=cls._MODEL_CACHE_LOCAL_TTL,
+                lock_timeout=cls._MODEL_CACHE_LOCK_TIMEOUT,
+                stale_ttl=cls._MODEL_CACHE_STALE_TTL,
+                none_ttl=cls._MODEL_CACHE_NONE_TTL,
+                codec=cls._MODEL_CACHE_CODEC
             )
         else:
             ret, dict_keys_list = model_cache.get_many_from_db(
@@ -232,6 +481,35 @@ class ModelCacheMixin:
             _dict_keys_list.extend(dict_keys_list)
         return ret
 
+    @classmethod
+    async def aget_objs_from_cache(cls, *, field_names, field_values, _dict_keys_list=None):
+        """
+        `get_objs_from_cache` 的异步版本
+        """
+        cls._check_field_key(field_names=field_names, field_values=field_values)
+        if cls._MODEL_WITH_CACHE:
+            ret, dict_keys_list = await model_cache.aget_many(
+                model_cls=cls,
+                field_names=field_names,
+                field_values=field_values,
+                ttl=cls._MODEL_CACHE_TTL,
+                local_ttl=cls._MODEL_CACHE_LOCAL_TTL,
+                lock_timeout=cls._MODEL_CACHE_LOCK_TIMEOUT,
+                stale_ttl=cls._MODEL_CACHE_STALE_TTL,
+                none_ttl=cls._MODEL_CACHE_NONE_TTL,
+                codec=cls._MODEL_CACHE_CODEC
+            )
+        else:
+            ret, dict_keys_list = await model_cache.aget_many_from_db(
+                model_cls=cls,
+                field_names=field_names,
+                field_values=field_values
+            )
+        if isinstance(_dict_keys_list, list):
+            _dict_keys_list.clear()
+            _dict_keys_list.extend(dict_keys_list)
+        return ret
+
 
 class SearchModelMixin:
     """
@@ -261,10 +539,115 @@ class SearchModelMixin:
         return cls._gen_search_fields()
 
 
+class CacheQuerySet(models.QuerySet):
+    """
+    批量修改数据（update、delete、bulk_update、bulk_create）时同时清空 model 缓存
+    """
+    # 按主键重新查询缓存字段时每批的主键数
+    cache_rows_batch_size = 500
+
+    def _get_cache_rows(self, queryset=None, limit=None):
+        """
+        查询缓存使用的字段值，limit 不为空且数据超过 limit 条时返回 None
+        """
+        if queryset is None:
+            queryset = self
+        attnames = self.model.get_cache_attnames()
+        queryset = queryset.order_by().values_list(*attnames)
+        if limit is not None:
+            queryset = queryset[:limit + 1]
+        rows = [dict(zip(attnames, row)) for row in queryset]
+        if limit is not None and len(rows) > limit:
+            return None
+        return rows
+
+    def _get_cache_rows_by_pks(self, pks):
+        rows = list()
+        queryset = self.model._base_manager.using(self.db)
+        size = self.cache_rows_batch_size
+        for i in range(0, len(pks), size):
+            rows.extend(self._get_cache_rows(queryset.filter(pk__in=pks[i:i + size])))
+        return rows
+
+    def _get_cache_rows_by_objs(self, objs):
+        attnames = self.model.get_cache_attnames()
+        return [{attname: getattr(obj, attname) for attname in attnames} for obj in objs]
+
+    def _is_cache_fields(self, field_names):
+        attnames = set(self.model.get_cache_attnames())
+        for field_name in field_names:
+            field = self.model._meta.get_field(field_name)
+            if field.attname in attnames:
+                return True
+        return False
+
+    def update(self, **kwargs):
+        if not self.model._MODEL_WITH_CACHE:
+            return super().update(**kwargs)
+        rows = self._get_cache_rows(limit=self.model._MODEL_CACHE_FLUSH_ROWS_LIMIT)
+        if rows is None:
+            # 超过行数限制时不逐条清空，使 model 所有缓存及 tag 失效
+            ret = super().update(**kwargs)
+            self.model.invalidate_all_cache(using=self.db)
+            return ret
+        ret = super().update(**kwargs)
+        if rows and self._is_cache_fields(kwargs.keys()):
+            # 修改了缓存字段时同时清空修改后的值对应的缓存
+            pk_attname = self.model._meta.pk.attname
+            rows.extend(self._get_cache_rows_by_pks([row[pk_attname] for row in rows]))
+        self.model.flush_cache_rows(rows, using=self.db)
+        return ret
+    update.alters_data = True
+
+    def delete(self):
+        if not self.model._MODEL_WITH_CACHE:
+            return super().delete()
+        rows = self._get_cache_rows(limit=self.model._MODEL_CACHE_FLUSH_ROWS_LIMIT)
+        if rows is None:
+            # 超过行数限制时不逐条清空，使 model 所有缓存及 tag 失效
+            ret = super().delete()
+            self.model.invalidate_all_cache(using=self.db)
+            return ret
+        ret = super().delete()
+        self.model.flush_cache_rows(rows, using=self.db)
+        return ret
+    delete.alters_data = True
+    delete.queryset_only = True
+
+    def bulk_update(self, objs, fields, batch_size=None):
+        if not self.model._MODEL_WITH_CACHE:
+            return super().bulk_update(objs, fields, batch_size=batch_size)
+        objs = tuple(objs)
+        rows = list()
+        if objs and self._is_cache_fields(fields):
+            rows.extend(self._get_cache_rows_by_pks([obj.pk for obj in objs]))
+        ret = super().bulk_update(objs, fields, batch_size=batch_size)
+        rows.extend(self._get_cache_rows_by_objs(objs))
+        self.model.flush_cache_rows(rows, using=self.db)
+        return ret
+    bulk_update.alters_data = True
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        if self.model._MODEL_WITH_CACHE:
+            # 清空新数据可能存在的数据不存在缓存
+            self.model.flush_cache_rows(self._get_cache_rows_by_objs(objs), using=self.db)
+        return objs
+    bulk_create.alters_data = True
+
+
+class CacheManager(models.Manager.from_queryset(CacheQuerySet)):
+    """
+    BaseModel 默认 Manager，批量修改数据时同时清空 model 缓存
+    """
+
+
 class BaseModel(ModelFieldChangeMixin, ModelCacheMixin, SearchModelMixin, models.Model):
     """
     Model基类，支持字段变更监控记录，主键唯一键缓存，搜索字段自动生成
     """
+    objects = CacheManager()
+
     class Meta:
         abstract = True
         ordering = ['-pk', ]
@@ -285,14 +668,19 @@ class BaseModel(ModelFieldChangeMixin, ModelCacheMixin, SearchModelMixin, models
         return '%s%s(%s)' % (self.__class__.__name__, self._meta.verbose_name, self.pk)
 
     def delete(self, using=None, keep_parents=False):
+        if not self._MODEL_WITH_CACHE:
+            return super().delete(using=using, keep_parents=keep_parents)
+        # 删除后 pk 被置空，使用删除前的字段值清空缓存
+        keys, pk = self._get_cache_keys(), self.pk
         ret = super().delete(using=using, keep_parents=keep_parents)
-        self.flush_cache()
+        self._flush_cache_keys(keys, pk)
         return ret
 
     def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
         if update_fields:
             fd = {f.name for f in self._meta.fields}
             update_fields = list(fd & set(update_fields))
+        saved = True
         try:
             super().save(
                 force_insert=force_insert, force_update=force_update, using=using, update_fields=update_fields
@@ -300,7 +688,21 @@ class BaseModel(ModelFieldChangeMixin, ModelCacheMixin, SearchModelMixin, models
         except DatabaseError as exp:
             if not str(exp).endswith('did not affect any rows.'):
                 raise exp
-        self.flush_cache()
+            saved = False
+        if saved and self._can_write_through(update_fields):
+            self.refresh_cache()
+        else:
+            self.flush_cache()
+
+    def _can_write_through(self, update_fields):
+        """
+        只更新部分字段、存在延迟加载字段或字段值为 F() 等表达式时，对象中的值与数据库不一致，不能直接写入缓存
+        """
+        if not self._MODEL_CACHE_WRITE_THROUGH or update_fields is not None or self.get_deferred_fields():
+            return False
+        return not any(
+            hasattr(getattr(self, f.attname), 'resolve_expression') for f in self._meta.concrete_fields
+        )
 
 
 class AbstractUserMixin:
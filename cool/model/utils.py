@@ -1,5 +1,6 @@
 # encoding: utf-8
-from django.db.models import Value, fields
+from django.db.models import Value, fields, prefetch_related_objects
+from django.db.models.constants import LOOKUP_SEP
 
 
 class TupleValue(Value):
@@ -45,3 +46,77 @@ def get_child_field(model_cls, attr):
         else:
             name += ' ' + verbose_name
     return isinstance(field, fields.BooleanField), name, null
+
+
+def _prefetch_cached_field(instances, name):
+    related_objs = list()
+    filled = 0
+    model_instances = dict()
+    for instance in instances:
+        model_instances.setdefault(type(instance), []).append(instance)
+    for model_cls, model_objs in model_instances.items():
+        field = model_cls._meta.get_field(name)
+        if not field.concrete or not (field.many_to_one or field.one_to_one):
+            raise ValueError("'%s' is not a forward foreign key of %s" % (name, model_cls.__name__))
+        remote_model = field.remote_field.model
+        if (
+            not getattr(remote_model, '_MODEL_WITH_CACHE', False)
+            or not hasattr(remote_model, 'get_objs_from_cache')
+            or len(field.foreign_related_fields) != 1
+        ):
+            prefetch_related_objects(model_objs, name)
+            for obj in model_objs:
+                related_objs.append(getattr(obj, name))
+            continue
+
+        values = dict()
+        for obj in model_objs:
+            if field.is_cached(obj):
+                related_objs.append(field.get_cached_value(obj))
+                continue
+            value = field.get_local_related_value(obj)[0]
+            if value is not None:
+                values.setdefault(value, []).append(obj)
+        if not values:
+            continue
+        value_list = list(values.keys())
+        dict_keys_list = list()
+        data = remote_model.get_objs_from_cache(
+            field_names=[field.foreign_related_fields[0].name],
+            field_values=[(value, ) for value in value_list],
+            _dict_keys_list=dict_keys_list
+        )
+        for value, dict_key in zip(value_list, dict_keys_list):
+            rel_obj = data.get(dict_key, None)
+            if rel_obj is None:
+                continue
+            related_objs.append(rel_obj)
+            for obj in values[value]:
+                field.set_cached_value(obj, rel_obj)
+                if not field.remote_field.multiple:
+                    field.remote_field.set_cached_value(rel_obj, obj)
+                filled += 1
+    related_objs = list({id(obj): obj for obj in related_objs if obj is not None}.values())
+    return related_objs, filled
+
+
+def prefetch_cached(objs, *lookups):
+    """
+    批量从缓存获取外键对象并填充到 Django 外键缓存中，之后访问外键不再逐个查询，
+    关联 model 不支持缓存时使用 `prefetch_related_objects` 批量获取
+
+        orders = list(Order.objects.all())
+        prefetch_cached(orders, 'customer', 'shop__owner')
+
+    返回从缓存填充的外键数量
+    """
+    objs = [obj for obj in objs if obj is not None]
+    filled = 0
+    for lookup in lookups:
+        instances = objs
+        for name in lookup.split(LOOKUP_SEP):
+            if not instances:
+                break
+            instances, count = _prefetch_cached_field(instances, name)
+            filled += count
+    return filled
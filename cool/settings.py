@@ -5,9 +5,16 @@ from django.test.signals import setting_changed
 from django.utils.module_loading import import_string
 
 DEFAULTS = {
+    # Cache
+    'CACHE_METRICS_ENABLED': False,
+    'CACHE_METRICS_FLUSH_INTERVAL': 60,
     # Model
     'MODEL_SET_VERBOSE_NAME_TO_DB_COMMENT': False,
     'MODEL_SET_DEFAULT_TO_DB_DEFAULT': False,
+    'MODEL_CACHE_LOCAL_MAX_SIZE': 1000,
+    'MODEL_CACHE_BROADCAST_CLASS': 'cool.core.cache.LocalBroadcast',
+    'MODEL_CACHE_CODEC_CLASS': 'cool.model.cache.PickleCodec',
+    'MODEL_CACHE_DELAY_DELETE': 0,
     # Admin
     'ADMIN_AUTOCOMPLETE_CHECK_PERM': True,
     'ADMIN_FILTER_USE_SELECT': True,
@@ -41,6 +48,15 @@ DEFAULTS = {
 
     'API_RESPONSE_DICT_FUNCTION': 'cool.views.response.get_response_dict',
 
+    'API_LOG_META_KEYS': (
+        'REMOTE_ADDR', 'HTTP_X_FORWARDED_FOR', 'HTTP_USER_AGENT', 'HTTP_REFERER', 'CONTENT_TYPE', 'CONTENT_LENGTH'
+    ),
+    'API_LOG_DATA_MAX_LENGTH': 1000,
+    'API_LOG_SAMPLE_RATE': 1,
+    'API_LOG_ASYNC': False,
+    'API_STAGE_TIMING': False,
+    'API_SERVER_TIMING': False,
+
     # websocket
     'API_WS_REQ_ID_NAME': 'req_id',
     'API_WS_REQ_PATH_NAME': 'path',
@@ -57,7 +73,9 @@ DEFAULTS = {
 # List of settings that may be in string import notation.
 IMPORT_STRINGS = [
     'API_RESPONSE_DICT_FUNCTION',
-    'ADMIN_SITE_REGISTER_FILTER_FUNCTION'
+    'ADMIN_SITE_REGISTER_FILTER_FUNCTION',
+    'MODEL_CACHE_BROADCAST_CLASS',
+    'MODEL_CACHE_CODEC_CLASS',
 ]
 
 
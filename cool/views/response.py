@@ -1,10 +1,14 @@
 # encoding: utf-8
+from collections import namedtuple
 
 from rest_framework.response import Response
 
 from cool.settings import cool_settings
 from cool.views.error_code import ErrorCode
 
+# 渲染后的返回内容，用于缓存
+RenderedResponse = namedtuple('RenderedResponse', ('content', 'status_code', 'content_type', 'etag'))
+
 
 def get_response_dict(*, code, message, data, success_with_code_msg, **kwargs):
     if not success_with_code_msg and code == ErrorCode.SUCCESS:
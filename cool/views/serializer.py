@@ -1,11 +1,53 @@
 # encoding: utf-8
 import importlib
 import inspect
+import logging
 
+from django.core.exceptions import FieldDoesNotExist
 from django.db import models
+from django.db.models.constants import LOOKUP_SEP
 from rest_framework import serializers
 from rest_framework.fields import empty
 
+from cool.model.utils import prefetch_cached
+
+logger = logging.getLogger('cool.views')
+
+
+def get_cached_lookups(serializer, model_cls, prefix=''):
+    """
+    获取序列化字段中使用缓存的外键路径（供 `prefetch_cached` 使用）
+    """
+    ret = list()
+    for field in serializer._readable_fields:
+        if isinstance(field, serializers.PrimaryKeyRelatedField):
+            # 只使用外键值，不会获取外键对象
+            continue
+        path = list()
+        current_model = model_cls
+        for attr in field.source_attrs:
+            try:
+                model_field = current_model._meta.get_field(attr)
+            except FieldDoesNotExist:
+                break
+            if not model_field.concrete or not (model_field.many_to_one or model_field.one_to_one):
+                break
+            remote_model = model_field.remote_field.model
+            if not getattr(remote_model, '_MODEL_WITH_CACHE', False):
+                break
+            path.append(attr)
+            current_model = remote_model
+        if path:
+            lookup = prefix + LOOKUP_SEP.join(path)
+            if lookup not in ret:
+                ret.append(lookup)
+        if isinstance(field, serializers.Serializer) and len(path) == len(field.source_attrs):
+            sub_prefix = prefix + LOOKUP_SEP.join(path) + LOOKUP_SEP if path else prefix
+            for lookup in get_cached_lookups(field, current_model, sub_prefix):
+                if lookup not in ret:
+                    ret.append(lookup)
+    return ret
+
 
 class ListSerializer(serializers.ListSerializer):
 
@@ -14,8 +56,33 @@ class ListSerializer(serializers.ListSerializer):
         self.filter = kwargs.pop('filter', None)
         self.exclude = kwargs.pop('exclude', None)
         self.limit = kwargs.pop('limit', None)
+        self.prefetch_cached = kwargs.pop('prefetch_cached', None)
+        # 通过批量获取节省的外键缓存查询次数
+        self.saved_cached_lookups = 0
         super().__init__(*args, **kwargs)
 
+    def get_cached_lookups(self):
+        """
+        子序列化类中需要批量获取的外键路径，可以通过 `prefetch_cached=False` 或子序列化类
+        `Meta.prefetch_cached = False` 关闭
+        """
+        prefetch = self.prefetch_cached
+        if prefetch is None:
+            prefetch = getattr(getattr(self.child, 'Meta', None), 'prefetch_cached', True)
+        model_cls = getattr(getattr(self.child, 'Meta', None), 'model', None)
+        if not prefetch or model_cls is None or not isinstance(self.child, serializers.Serializer):
+            return []
+        return get_cached_lookups(self.child, model_cls)
+
+    def to_representation(self, data):
+        lookups = self.get_cached_lookups()
+        if lookups:
+            data = list(data.all() if isinstance(data, models.Manager) else data)
+            saved = prefetch_cached(data, *lookups)
+            self.saved_cached_lookups += saved
+            logger.debug("%s prefetch cached %s saved %d lookups", self.child.__class__.__name__, lookups, saved)
+        return super().to_representation(data)
+
     def get_attribute(self, instance):
         attribute = super().get_attribute(instance)
         if isinstance(attribute, models.Manager):
@@ -43,6 +110,7 @@ class ListSerializerMixin:
         _filter = kwargs.pop('filter', None)
         exclude = kwargs.pop('exclude', None)
         limit = kwargs.pop('limit', None)
+        prefetch = kwargs.pop('prefetch_cached', None)
         if meta is not None and not hasattr(meta, 'list_serializer_class'):
             meta.list_serializer_class = ListSerializer
         ret = super().many_init(*args, **kwargs)
@@ -51,10 +119,12 @@ class ListSerializerMixin:
             getattr(ret, '_kwargs', dict())['filter'] = _filter
             getattr(ret, '_kwargs', dict())['exclude'] = exclude
             getattr(ret, '_kwargs', dict())['limit'] = limit
+            getattr(ret, '_kwargs', dict())['prefetch_cached'] = prefetch
             ret.order_by = order_by
             ret.filter = _filter
             ret.limit = limit
             ret.exclude = exclude
+            ret.prefetch_cached = prefetch
         return ret
 
 
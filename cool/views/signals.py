@@ -0,0 +1,7 @@
+# encoding: utf-8
+
+from django.dispatch import Signal
+
+# CoolBFFAPIView 请求结束时发送各阶段耗时（需开启 API_STAGE_TIMING 或有 receiver）
+# sender 为 view 类，参数：view, request, response, stages（阶段名称到耗时秒数的有序字典）
+request_stage_timing = Signal()
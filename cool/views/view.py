@@ -1,33 +1,105 @@
 # encoding: utf-8
 from __future__ import absolute_import, unicode_literals
 
-import copy
+import hashlib
 import json
 import logging
 import time
 from collections import OrderedDict
 
 from django.conf import settings
-from django.core.exceptions import ValidationError as CoreValidationError
+from django.core.exceptions import (
+    ImproperlyConfigured, ValidationError as CoreValidationError,
+)
 from django.db.models import Model, QuerySet
 from django.forms import forms
 from django.http import HttpResponse
 from django.template.loader import render_to_string
+from django.utils.cache import get_conditional_response
 from django.utils.datastructures import MultiValueDict
 from django.utils.encoding import force_str
+from django.utils.http import quote_etag
 from django.utils.safestring import mark_safe
+from django.utils.translation import get_language
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError as RestValidationError
 from rest_framework.fields import empty
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.response import Response
 from rest_framework.serializers import ModelSerializer
 from rest_framework.views import APIView
 
+from cool.core import cache as core_cache
+from cool.core.utils import get_queue_logger
 from cool.settings import cool_settings
 from cool.views.error_code import ErrorCode
 from cool.views.exceptions import CoolAPIException
 from cool.views.options import ViewMetaclass, ViewOptions
 from cool.views.param import Param
-from cool.views.response import ResponseData
+from cool.views.response import RenderedResponse, ResponseData
+from cool.views.signals import request_stage_timing
+
+
+def _json_dumps(value):
+    return json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+
+
+def _data_shape(data):
+    """
+    数据结构（字段名及类型），用于判断返回数据结构是否修改
+    """
+    if isinstance(data, dict):
+        return {force_str(k): _data_shape(v) for k, v in data.items()}
+    if isinstance(data, (list, tuple)):
+        return [_data_shape(v) for v in data]
+    return type(data).__name__
+
+
+def _truncate(text, max_length):
+    if max_length is not None and len(text) > max_length:
+        return text[:max_length]
+    return text
+
+
+def _dumps_truncated(data, max_length):
+    """
+    json 序列化，超过 max_length 时停止序列化并截断
+    """
+    from rest_framework.utils import encoders
+    if max_length is None:
+        return json.dumps(data, ensure_ascii=False, cls=encoders.JSONEncoder)
+    chunks = list()
+    length = 0
+    for chunk in encoders.JSONEncoder(ensure_ascii=False).iterencode(data):
+        chunks.append(chunk)
+        length += len(chunk)
+        if length > max_length:
+            break
+    return _truncate(''.join(chunks), max_length)
+
+
+class StageTimer:
+    """
+    请求各阶段耗时（秒），同名阶段耗时累加
+    """
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = OrderedDict()
+
+    def add(self, name, elapsed):
+        self.stages[name] = self.stages.get(name, 0) + elapsed
+
+    @property
+    def total(self):
+        return time.perf_counter() - self.start
+
+    def get_server_timing(self):
+        """
+        `Server-Timing` 响应头内容（毫秒）
+        """
+        items = ['%s;dur=%.3f' % (name, elapsed * 1000) for name, elapsed in self.stages.items()]
+        items.append('total;dur=%.3f' % (self.total * 1000))
+        return ', '.join(items)
 
 
 class ParamSerializer(serializers.Serializer):
@@ -126,9 +198,25 @@ class CoolBFFAPIView(APIView, metaclass=ViewMetaclass):
     # 用于生成缓存可以的请求参数列表, 为空表示所有请求参数
     KEY_FIELDS = None
 
-    # 缓存内容 `cool.core.cache.CacheItem`，为空不缓存
+    # 请求各阶段耗时，未开启 API_STAGE_TIMING、API_SERVER_TIMING 且没有 request_stage_timing receiver 时为空
+    stage_timer = None
+
+    # 缓存内容 `cool.core.cache.CacheItem`，为空不缓存，数据量较大时可设置 compress_threshold、max_size
     CACHE_ITEM = None
 
+    # 缓存版本，返回数据结构修改后修改该值使已有缓存失效，为空时使用返回数据结构的摘要
+    CACHE_VERSION = None
+
+    # 缓存渲染后的返回内容（按协商的 renderer 区分），命中时直接返回，不再序列化及渲染
+    CACHE_RENDERED = False
+
+    # 缓存渲染后的返回内容时返回 ETag，GET 请求 If-None-Match 匹配时返回 304
+    CACHE_ETAG = False
+
+    # 缓存 key 区分的请求维度，如 ('user', 'permissions', 'language', 'header:Accept-Language', 'cookie:name', 'tenant')
+    # 其他名称调用 get_cache_vary_<name>(request)，未定义时使用 request.<name>
+    CACHE_VARY = ()
+
     def __init__(self, *args, **kwargs):
         super(CoolBFFAPIView, self).__init__(*args, **kwargs)
         for method in self.support_methods:
@@ -223,33 +311,176 @@ class CoolBFFAPIView(APIView, metaclass=ViewMetaclass):
         """
         pass
 
+    @classmethod
+    def get_cache_key_fields(cls):
+        """
+        用于生成缓存 key 的参数列表，按类缓存
+        """
+        key_fields = cls.__dict__.get('_cache_key_fields', None)
+        if key_fields is None:
+            key_fields = cls.KEY_FIELDS
+            if key_fields is None:
+                key_fields = cls._meta.param_fields.keys()
+            key_fields = cls._cache_key_fields = tuple(key_fields)
+        return key_fields
+
+    @classmethod
+    def get_cache_version(cls):
+        """
+        缓存版本，按类缓存
+        """
+        version = cls.__dict__.get('_cache_version', None)
+        if version is None:
+            version = cls.CACHE_VERSION
+            if version is None:
+                shape = _json_dumps(_data_shape(cls.response_info_data()))
+                version = hashlib.md5(shape.encode('utf-8')).hexdigest()[:8]
+            version = cls._cache_version = force_str(version)
+        return version
+
     def view_uniq_key(self):
-        return f'{self.__class__.__module__}.{self.__class__.__name__}'
+        return f'{self.__class__.__module__}.{self.__class__.__name__}:{self.get_cache_version()}'
+
+    def get_cache_vary_user(self, request):
+        return request.user.pk if request.user.is_authenticated else None
+
+    def get_cache_vary_permissions(self, request):
+        return sorted(request.user.get_all_permissions()) if request.user.is_authenticated else []
+
+    def get_cache_vary_language(self, request):
+        return get_language()
+
+    def get_cache_vary_value(self, request, vary):
+        """
+        缓存 key 区分维度的值
+        """
+        kind, _, name = vary.partition(':')
+        if kind == 'header' and name:
+            return request.headers.get(name)
+        if kind == 'cookie' and name:
+            return request.COOKIES.get(name)
+        func = getattr(self, 'get_cache_vary_%s' % vary, None)
+        if func is not None:
+            return func(request)
+        if not hasattr(request, vary):
+            raise ImproperlyConfigured(
+                '%s.CACHE_VARY: unknown vary %r, define get_cache_vary_%s()' % (self.__class__.__name__, vary, vary)
+            )
+        return getattr(request, vary)
 
     def gen_cache_key(self, params):
         """
-        获取缓存唯一标识
+        获取缓存唯一标识（规范化后参数及 `CACHE_VARY` 各维度值的摘要），参数中有上传文件时返回 None 不缓存
         """
-        key_fields = self.KEY_FIELDS
-        if key_fields is None:
-            key_fields = self.request_info_data().keys()
-        params_key = tuple(copy.deepcopy([(key, getattr(params, key)) for key in key_fields]))
-        return (self.view_uniq_key(), ) + params_key
+        try:
+            data = [[key, getattr(params, key)] for key in self.get_cache_key_fields()]
+            if self.CACHE_VARY:
+                data.append([[vary, self.get_cache_vary_value(self.request, vary)] for vary in self.CACHE_VARY])
+            digest = core_cache.key_digest(data)
+        except core_cache.UncacheableValue:
+            return None
+        return self.view_uniq_key(), digest
+
+    def get_cache(self, cache_key):
+        """
+        读取缓存，有监听时每次读取发送一个 op 为 vary 的事件（values 为 `CACHE_VARY` 各维度），按维度统计命中情况
+        """
+        value = self.CACHE_ITEM.get(cache_key)
+        if self.CACHE_VARY and core_cache.has_listeners():
+            core_cache.send_event(core_cache.CacheEvent(
+                cache=self.CACHE_ITEM.cache,
+                item=self.CACHE_ITEM,
+                name='cool:view_cache:vary',
+                op='vary',
+                keys=1,
+                hits=0 if value is None else 1,
+                elapsed=0,
+                values=tuple(self.CACHE_VARY)
+            ))
+        return value
+
+    def get_rendered_cache_key(self, request, cache_key):
+        """
+        渲染后返回内容的缓存 key，可浏览 API 页面包含请求相关内容不缓存
+
+        key 包含协商后的媒体类型（含 `indent` 等参数）的摘要，参数不同的渲染结果分开缓存
+        """
+        renderer = getattr(request, 'accepted_renderer', None)
+        if renderer is None or isinstance(renderer, BrowsableAPIRenderer):
+            return None
+        media_type = getattr(request, 'accepted_media_type', None) or renderer.media_type
+        return cache_key + (renderer.format, core_cache.key_digest(media_type)[:8])
+
+    def get_rendered_response(self, request, rendered):
+        """
+        由缓存的渲染后内容生成返回
+        """
+        response = HttpResponse(rendered.content, status=rendered.status_code, content_type=rendered.content_type)
+        return self.get_conditional_response(request, response, rendered.etag)
+
+    def get_conditional_response(self, request, response, etag):
+        if not self.CACHE_ETAG:
+            return response
+        response['ETag'] = etag
+        if request.method not in ('GET', 'HEAD'):
+            return response
+        return get_conditional_response(request, etag=etag, response=response)
+
+    def cache_rendered_response(self, request, response, cache_key):
+        """
+        渲染返回内容并写入缓存
+        """
+        response.render()
+        rendered = RenderedResponse(
+            content=response.content,
+            status_code=response.status_code,
+            content_type=response['Content-Type'],
+            etag=quote_etag(hashlib.md5(response.content).hexdigest())
+        )
+        self.CACHE_ITEM.set(cache_key, rendered)
+        return self.get_conditional_response(request, response, rendered.etag)
+
+    def stage(self, name, func, *args, **kwargs):
+        """
+        调用 func 并记录为 name 阶段耗时，未开启阶段耗时统计时直接调用
+        """
+        timer = self.stage_timer
+        if timer is None:
+            return func(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            timer.add(name, time.perf_counter() - start)
 
     def view(self, request, *args, **kwargs):
-        self.init_params(request, *args, **kwargs)
-        self.check_api_permissions(request, *args, **kwargs)
+        self.stage('params', self.init_params, request, *args, **kwargs)
+        # 权限校验在读取缓存之前
+        self.stage('permissions', self.check_api_permissions, request, *args, **kwargs)
         context = None
+        cache_key = None
         if self.CACHE_ITEM is not None:
-            cache_key = self.gen_cache_key(request.params)
-            context = self.CACHE_ITEM.get(cache_key)
+            cache_key = self.stage('cache', self.gen_cache_key, request.params)
+        if cache_key is not None and self.CACHE_RENDERED:
+            rendered_cache_key = self.get_rendered_cache_key(request, cache_key)
+            if rendered_cache_key is not None:
+                rendered = self.stage('cache', self.get_cache, rendered_cache_key)
+                if rendered is not None:
+                    return self.get_rendered_response(request, rendered)
+            context = self.stage('context', self.get_context, request, *args, **kwargs)
+            context = self.stage('serialize', self.get_response_data, context)
+            if isinstance(context, ResponseData):
+                self._rendered_cache_key = rendered_cache_key
+            return self.stage('serialize', self.get_response, context)
+        if cache_key is not None:
+            context = self.stage('cache', self.get_cache, cache_key)
         if context is None:
-            context = self.get_context(request, *args, **kwargs)
-            context = self.get_response_data(context)
-        if self.CACHE_ITEM is not None and isinstance(context, ResponseData):
-            self.CACHE_ITEM.set(cache_key, context)
+            context = self.stage('context', self.get_context, request, *args, **kwargs)
+            context = self.stage('serialize', self.get_response_data, context)
+        if cache_key is not None and isinstance(context, ResponseData):
+            self.stage('cache', self.CACHE_ITEM.set, cache_key, context)
 
-        response = self.get_response(context)
+        response = self.stage('serialize', self.get_response, context)
         return response
 
     def get_context(self, request, *args, **kwargs):
@@ -295,71 +526,144 @@ class CoolBFFAPIView(APIView, metaclass=ViewMetaclass):
         return super().handle_exception(exc)
 
     def initial(self, request, *args, **kwargs):
+        if (
+            cool_settings.API_STAGE_TIMING
+            or cool_settings.API_SERVER_TIMING
+            or request_stage_timing.has_listeners(self.__class__)
+        ):
+            self.stage_timer = StageTimer()
         self.log_request(request, *args, **kwargs)
-        return super().initial(request, *args, **kwargs)
+        return self.stage('initial', super().initial, request, *args, **kwargs)
 
     def finalize_response(self, request, response, *args, **kwargs):
         response = super().finalize_response(request, response, *args, **kwargs)
+        if self.stage_timer is not None and isinstance(response, Response):
+            # 统计耗时时提前渲染，渲染耗时计入 render 阶段
+            self.stage('render', response.render)
+        rendered_cache_key = getattr(self, '_rendered_cache_key', None)
+        if rendered_cache_key is not None and isinstance(response, Response):
+            self._rendered_cache_key = None
+            response = self.cache_rendered_response(request, response, rendered_cache_key)
+        if self.stage_timer is not None:
+            self.finish_stage_timer(request, response)
         self.log_response(request, response, *args, **kwargs)
         return response
 
+    def finish_stage_timer(self, request, response):
+        """
+        输出各阶段耗时：`Server-Timing` 响应头（API_SERVER_TIMING）及 `request_stage_timing` 信号
+        """
+        if cool_settings.API_SERVER_TIMING:
+            response['Server-Timing'] = self.stage_timer.get_server_timing()
+        request_stage_timing.send(
+            sender=self.__class__, view=self, request=request, response=response, stages=self.stage_timer.stages
+        )
+
     def get_uncaught_exception_response(self, exc, context):
         self.log_exception(self.request, exc, context)
         if settings.DEBUG:
             return None
         return self.get_response(ResponseData(None, ErrorCode.ERROR_SYSTEM, status_code=self.SYSTEM_ERROR_STATUS_CODE))
 
+    def get_log_logger(self):
+        if cool_settings.API_LOG_ASYNC:
+            return get_queue_logger(self.logger)
+        return self.logger
+
+    def get_log_info(self, request):
+        """
+        请求日志内容（请求参数截断、META 只保留 `API_LOG_META_KEYS`）
+        """
+        meta_keys = cool_settings.API_LOG_META_KEYS
+        if meta_keys is None:
+            meta = request.META
+        else:
+            meta = {key: request.META[key] for key in meta_keys if key in request.META}
+        try:
+            data = request.data
+        except Exception:
+            data = None
+        try:
+            data = _dumps_truncated(data, cool_settings.API_LOG_DATA_MAX_LENGTH)
+        except Exception:
+            data = _truncate(str(data), cool_settings.API_LOG_DATA_MAX_LENGTH)
+        return {
+            'method': request.method,
+            'uri': request.build_absolute_uri(),
+            'uid': getattr(request, 'uid', ''),
+            'user': force_str(request.user),
+            'data': data,
+            'meta': meta,
+        }
+
     def log_request(self, request, *args, **kwargs):
+        import random
         import uuid
         request.start_time = time.time()
         request.uid = uuid.uuid4().hex
-        self.logger.info(
+        sample_rate = cool_settings.API_LOG_SAMPLE_RATE
+        request.log_sampled = sample_rate >= 1 or random.random() < sample_rate
+        if not request.log_sampled or not self.logger.isEnabledFor(logging.INFO):
+            return
+        info = self.get_log_info(request)
+        self.get_log_logger().info(
             "request start %s %s %s %s %s %s",
-            request.method,
-            request.build_absolute_uri(),
-            request.uid,
-            request.user,
-            request.data,
-            request.META
+            info['method'],
+            info['uri'],
+            info['uid'],
+            info['user'],
+            info['data'],
+            info['meta'],
+            extra={'api_log': info}
         )
 
     def log_response(self, request, response, *args, **kwargs):
-        from rest_framework.response import Response
-        from rest_framework.utils import encoders
-        if isinstance(response, Response):
+        if not getattr(request, 'log_sampled', True) or not self.logger.isEnabledFor(logging.INFO):
+            return
+        max_length = cool_settings.API_LOG_DATA_MAX_LENGTH if response.status_code == 200 else None
+        if isinstance(response, Response) and not response.is_rendered:
             try:
-                data = json.dumps(response.data, ensure_ascii=False, cls=encoders.JSONEncoder)
+                data = _dumps_truncated(response.data, max_length)
             except Exception:
-                data = str(response.data)
+                data = _truncate(str(response.data), max_length)
         elif isinstance(response, HttpResponse):
-            data = response.content
+            # 已渲染的返回直接使用渲染结果，不再重复序列化
+            content = response.content if max_length is None else response.content[:max_length]
+            data = content.decode('utf-8', 'replace')
         else:
             data = ''
-        if response.status_code == 200 and len(data) > 1024:
-            data = data[:1000]
-        self.logger.info(
+        info = self.get_log_info(request)
+        info['elapsed'] = time.time() - getattr(request, 'start_time', 0)
+        info['status_code'] = response.status_code
+        info['response'] = data
+        if self.stage_timer is not None:
+            info['stages'] = dict(self.stage_timer.stages)
+        self.get_log_logger().info(
             "request finish %ss %s %s %s %s %s %s %s %s",
-            time.time() - getattr(request, 'start_time', 0),
-            request.method,
-            request.build_absolute_uri(),
-            getattr(request, 'uid', ''),
-            response.status_code,
-            request.user,
-            request.data,
-            data,
-            request.META
+            info['elapsed'],
+            info['method'],
+            info['uri'],
+            info['uid'],
+            info['status_code'],
+            info['user'],
+            info['data'],
+            info['response'],
+            info['meta'],
+            extra={'api_log': info}
         )
 
     def log_exception(self, request, exc, context):
-        self.logger.error(
+        info = self.get_log_info(request)
+        info['elapsed'] = time.time() - getattr(request, 'start_time', 0)
+        self.get_log_logger().error(
             "request exception %ss %s %s %s %s %s %s",
-            time.time() - getattr(request, 'start_time', 0),
-            request.method,
-            request.build_absolute_uri(),
-            getattr(request, 'uid', ''),
-            request.user,
-            request.data,
-            request.META,
+            info['elapsed'],
+            info['method'],
+            info['uri'],
+            info['uid'],
+            info['user'],
+            info['data'],
+            info['meta'],
             exc_info=exc,
-            extra={'request': request}
+            extra={'request': request, 'api_log': info}
         )
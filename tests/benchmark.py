@@ -0,0 +1,103 @@
+# encoding: utf-8
+"""
+缓存性能对比，不在测试中运行
+
+    python -m tests.benchmark
+"""
+import time
+
+import django
+from django.conf import settings
+
+
+def setup():
+    settings.configure(
+        DATABASES={'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}},
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+        INSTALLED_APPS=('django.contrib.contenttypes', 'django.contrib.auth', 'cool'),
+        SECRET_KEY='benchmark',
+    )
+    django.setup()
+
+
+def best(func, repeat=5):
+    ret = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        ret.append(time.perf_counter() - start)
+    return min(ret)
+
+
+def bench_key_plan():
+    from django.contrib.contenttypes.models import ContentType
+
+    from cool.model import cache
+
+    field_names = ('app_label', 'model')
+    field_values = [('app_label%d' % i, 'model') for i in range(2000)]
+
+    def without_plan():
+        for field_value in field_values:
+            cache.KeyPlan(ContentType, field_names).make_key(field_value)
+
+    def with_plan():
+        cache.model_cache._get_keys(ContentType, field_names, field_values)
+
+    return {'without_plan': best(without_plan), 'with_plan': best(with_plan)}
+
+
+def bench_fast_path():
+    from cool.core import cache
+
+    class NullBackend:
+
+        def get(self, key, default=None):
+            return default
+
+        def get_many(self, keys):
+            return {}
+
+        def set_many(self, data, timeout=None):
+            return []
+
+    class FastCache(cache.BaseCache):
+        key_prefix = '_FastCache'
+        item = cache.CacheItem()
+
+    class SlowCache(FastCache):
+
+        def make_key(self, item, key):
+            return super().make_key(item, key)
+
+    keys = ['key%d' % i for i in range(100)]
+    data = dict.fromkeys(keys, 1)
+
+    def run(cache_obj):
+        cache_obj.cache = NullBackend()
+
+        def func():
+            for _ in range(20):
+                cache_obj.item.get('key')
+                cache_obj.item.get_many(keys)
+                cache_obj.item.set_many(data)
+        return func
+
+    return {'fast': best(run(FastCache())), 'slow': best(run(SlowCache()))}
+
+
+BENCHMARKS = {
+    'key_plan': bench_key_plan,
+    'fast_path': bench_fast_path,
+}
+
+
+def main():
+    setup()
+    for name, bench in BENCHMARKS.items():
+        for case, elapsed in bench().items():
+            print('%s.%s: %.3fms' % (name, case, elapsed * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,11 @@
 # encoding: utf-8
+import time
+from io import StringIO
+from unittest import mock, skipIf
 
+import django
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
 from django.test import SimpleTestCase
 
 from cool.core import cache
@@ -10,6 +16,25 @@ class SimpleCache(cache.BaseCache):
     default_timeout = 10
     test1 = cache.CacheItem()
     test2 = cache.CacheItem()
+    test3 = cache.CacheItem(default_timeout=20, versioned=True)
+    test4 = cache.CacheItem(compress_threshold=100, max_size=1000)
+
+
+class DefaultTimeoutCache(cache.BaseCache):
+    key_prefix = '_DefaultTimeoutCache'
+    item = cache.CacheItem()
+
+
+class SlowCache(SimpleCache):
+
+    def make_key(self, item, key):
+        return super().make_key(item, key)
+
+
+class CustomKeyCache(SimpleCache):
+
+    def make_key(self, item, key):
+        return 'custom:%s' % super().make_key(item, key)
 
 
 class DiffObj:
@@ -47,3 +72,546 @@ class CacheTests(SimpleTestCase):
         self.assertIsNone(simple_cache2.test1.get('diff'))
         simple_cache1.test1.set('diff', 'test')
         self.assertEqual(simple_cache2.test1.get('diff'), 'test')
+
+    def test_version(self):
+        simple_cache = SimpleCache()
+        self.assertEqual(simple_cache.test3.default_timeout, 20)
+        simple_cache.test1.set('version', 1)
+        simple_cache.test3.set('version', 1)
+        simple_cache.test3.set_many({'version1': 1, 'version2': 2})
+        self.assertDictEqual(simple_cache.test3.get_many(['version1', 'version2']), {'version1': 1, 'version2': 2})
+        version = simple_cache.test3.get_version()
+        self.assertEqual(simple_cache.test3.incr_version(), version + 1)
+        self.assertEqual(simple_cache.test1.get('version'), 1)
+        self.assertIsNone(simple_cache.test3.get('version'))
+        self.assertDictEqual(simple_cache.test3.get_many(['version1', 'version2']), {})
+
+        simple_cache2 = SimpleCache()
+        self.assertEqual(simple_cache2.test3.get_version(), version + 1)
+        simple_cache.test3.incr_version()
+        # 其他实例中的版本号在进程内缓存过期后更新
+        self.assertEqual(simple_cache2.test3.get_version(), version + 1)
+        with mock.patch('time.monotonic', return_value=time.monotonic() + simple_cache2.version_timeout):
+            self.assertEqual(simple_cache2.test3.get_version(), version + 2)
+
+    @skipIf(django.VERSION < (3, 1), 'async tests require Django 3.1+')
+    async def test_async(self):
+        simple_cache = SimpleCache()
+        await simple_cache.test1.aset('async', 1)
+        self.assertEqual(await simple_cache.test1.aget('async'), 1)
+        self.assertEqual(simple_cache.test1.get('async'), 1)
+        await simple_cache.test1.aset_many({'async1': 1, 'async2': 2})
+        self.assertDictEqual(
+            await simple_cache.test1.aget_many(['async1', 'async2', 'async3']), {'async1': 1, 'async2': 2}
+        )
+        await simple_cache.test1.adelete_many(['async1', 'async2'])
+        self.assertDictEqual(await simple_cache.test1.aget_many(['async1', 'async2']), {})
+        self.assertFalse(await simple_cache.test1.aadd('async', 2))
+        await simple_cache.test1.adelete('async')
+        self.assertIsNone(await simple_cache.test1.aget('async'))
+
+        lock1 = simple_cache.test1.lock('async_lock', timeout=10)
+        lock2 = simple_cache.test1.lock('async_lock', timeout=10)
+        async with lock1 as acquired:
+            self.assertTrue(acquired)
+            self.assertFalse(await lock2.aacquire())
+        self.assertTrue(await lock2.aacquire())
+        await lock2.arelease()
+
+    @skipIf(django.VERSION < (3, 1), 'async tests require Django 3.1+')
+    async def test_async_version(self):
+        simple_cache = SimpleCache()
+        simple_cache._versions.clear()
+        with mock.patch.object(simple_cache, 'get_version', side_effect=AssertionError):
+            await simple_cache.test3.aset('async_version', 1)
+            self.assertEqual(await simple_cache.test3.aget('async_version'), 1)
+        self.assertEqual(simple_cache.test3.get('async_version'), 1)
+
+    def test_batch(self):
+        simple_cache = SimpleCache()
+        simple_cache.test1.set('batch', 1)
+        simple_cache.test2.set_many({'batch1': 1, 'batch2': 2})
+        simple_cache.test3.set('batch', 3)
+        with mock.patch.object(simple_cache.cache, 'get_many', wraps=simple_cache.cache.get_many) as get_many, \
+                mock.patch.object(simple_cache.cache, 'set_many', wraps=simple_cache.cache.set_many) as set_many:
+            with simple_cache.batch() as batch:
+                future1 = batch.test1.get('batch')
+                future2 = batch.test2.get_many(['batch1', 'batch2', 'batch3'])
+                future3 = batch.test3.get('batch')
+                future4 = batch.test1.get('batch_none', 'default')
+                batch.test1.set('batch_set1', 1)
+                batch.test2.set('batch_set2', 2)
+                batch.test2.delete('batch2')
+                self.assertFalse(future1.done)
+                with self.assertRaises(RuntimeError):
+                    future1.result()
+        self.assertEqual(get_many.call_count, 1)
+        self.assertEqual(set_many.call_count, 1)
+        self.assertEqual(future1.result(), 1)
+        self.assertDictEqual(future2.result(), {'batch1': 1})
+        self.assertEqual(future3.result(), 3)
+        self.assertEqual(future4.result(), 'default')
+        self.assertEqual(simple_cache.test1.get('batch_set1'), 1)
+        self.assertEqual(simple_cache.test2.get('batch_set2'), 2)
+
+    @skipIf(django.VERSION < (3, 1), 'async tests require Django 3.1+')
+    async def test_async_batch(self):
+        simple_cache = SimpleCache()
+        await simple_cache.test1.aset('async_batch', 1)
+        async with simple_cache.batch() as batch:
+            future1 = batch.test1.get('async_batch')
+            future2 = batch.test2.get_many(['async_batch'])
+            batch.test2.set('async_batch', 2)
+        self.assertEqual(future1.result(), 1)
+        self.assertDictEqual(future2.result(), {'async_batch': 2})
+
+    def test_fast_path(self):
+        simple_cache = SimpleCache()
+        slow_cache = SlowCache()
+        self.assertTrue(simple_cache.test1.fast)
+        self.assertFalse(slow_cache.test1.fast)
+        self.assertEqual(simple_cache.test1.prefix, '_SimpleCache:test1')
+        simple_cache.test1.set_many({'fast': 1, ('fast', 1): 2})
+        self.assertEqual(slow_cache.test1.get('fast'), 1)
+        self.assertDictEqual(simple_cache.test1.get_many(['fast', ('fast', 1)]), {'fast': 1, 'fast:1': 2})
+        self.assertDictEqual(slow_cache.test1.get_many(['fast', ('fast', 1)]), {'fast': 1, 'fast:1': 2})
+        simple_cache.test1.delete_many(['fast', ('fast', 1)])
+        self.assertIsNone(slow_cache.test1.get('fast'))
+
+    def test_custom_make_key(self):
+        custom_cache = CustomKeyCache()
+        self.assertFalse(custom_cache.test3.fast)
+        custom_cache.test3.set_many({'a': 1, 'b': 2})
+        key = custom_cache.make_key(custom_cache.test3, 'a')
+        self.assertTrue(key.startswith('custom:_SimpleCache:test3:'))
+        self.assertEqual(custom_cache.cache.get(key), 1)
+        self.assertEqual(custom_cache.test3.get('b'), 2)
+        with custom_cache.batch() as b:
+            f = b.test3.get('b')
+        self.assertEqual(f.result(), 2)
+
+    def test_fast_path_inner_call(self):
+        keys = ['inner%d' % i for i in range(3)]
+
+        def run(cache_obj):
+            with mock.patch.object(cache_obj, 'inner_call', wraps=cache_obj.inner_call) as inner_call:
+                cache_obj.test1.set_many(dict.fromkeys(keys, 1))
+                cache_obj.test1.get('inner0')
+                cache_obj.test1.get_many(keys)
+                cache_obj.test1.delete_many(keys)
+            return inner_call.call_count
+
+        # 未注册监听且未重写时跳过 inner_call
+        self.assertEqual(run(SimpleCache()), 0)
+        # 重写 make_key 等方法时经过 inner_call
+        self.assertEqual(run(SlowCache()), 4)
+        # 注册监听时经过 inner_call 以发送事件
+        events = list()
+        cache.add_listener(events.append)
+        try:
+            self.assertEqual(run(SimpleCache()), 4)
+        finally:
+            cache.remove_listener(events.append)
+        self.assertEqual(len(events), 4)
+
+
+class CacheLockTests(SimpleTestCase):
+
+    def test_lock(self):
+        simple_cache = SimpleCache()
+        lock1 = simple_cache.test1.lock('lock', timeout=10)
+        lock2 = simple_cache.test1.lock('lock', timeout=10)
+        with lock1 as acquired:
+            self.assertTrue(acquired)
+            self.assertFalse(lock2.acquire())
+            self.assertFalse(lock2.acquire(blocking=True, blocking_timeout=0.1))
+        self.assertFalse(lock1.locked)
+        self.assertTrue(lock2.acquire())
+        lock2.release()
+        self.assertIsNone(simple_cache.test1.get(('lock', '__lock__')))
+
+    def test_local_lock(self):
+        simple_cache = SimpleCache()
+        lock1 = simple_cache.test1.lock('local_lock')
+        lock2 = simple_cache.test1.lock('local_lock')
+        with mock.patch.object(simple_cache.cache, 'add', side_effect=ConnectionError):
+            self.assertTrue(lock1.acquire())
+            self.assertFalse(lock2.acquire())
+            lock1.release()
+            self.assertTrue(lock2.acquire())
+            lock2.release()
+
+
+class LocalCacheTests(SimpleTestCase):
+
+    def test_lru(self):
+        local = cache.LocalCache(max_size=2)
+        local.set('a', 1)
+        local.set('b', 2)
+        self.assertEqual(local.get('a'), 1)
+        local.set('c', 3)
+        self.assertEqual(len(local), 2)
+        self.assertIsNone(local.get('b'))
+        self.assertDictEqual(local.get_many(['a', 'b', 'c']), {'a': 1, 'c': 3})
+
+    def test_timeout(self):
+        local = cache.LocalCache()
+        local.set('a', 1, timeout=0.01)
+        local.set('b', 2)
+        time.sleep(0.02)
+        self.assertIsNone(local.get('a'))
+        self.assertEqual(local.get('b'), 2)
+        local.delete('b')
+        self.assertIsNone(local.get('b'))
+
+    def test_compress(self):
+        simple_cache = SimpleCache()
+        value = ['test'] * 1000
+        simple_cache.test4.set('large', value)
+        simple_cache.test4.set('small', 'test')
+        stored = simple_cache.cache.get(simple_cache.make_key(simple_cache.test4, 'large'))
+        self.assertIsInstance(stored, cache.CompressedValue)
+        self.assertEqual(stored.compressor, 'zlib')
+        # 未压缩的值保存序列化结果，缓存后端不再序列化原对象
+        stored = simple_cache.cache.get(simple_cache.make_key(simple_cache.test4, 'small'))
+        self.assertIsInstance(stored, cache.PickledValue)
+        self.assertEqual(simple_cache.test4.get('small'), 'test')
+        self.assertListEqual(simple_cache.test4.get('large'), value)
+        self.assertDictEqual(simple_cache.test4.get_many(['large', 'small']), {'large': value, 'small': 'test'})
+        with simple_cache.batch() as b:
+            f = b.test4.get('large')
+        self.assertListEqual(f.result(), value)
+
+        with self.assertLogs('cool.core', 'WARNING'):
+            simple_cache.test4.set_many({'oversize': [str(i) for i in range(1000)], 'small2': 'test'})
+        self.assertIsNone(simple_cache.test4.get('oversize'))
+        self.assertEqual(simple_cache.test4.get('small2'), 'test')
+        with self.assertLogs('cool.core', 'WARNING'):
+            self.assertFalse(simple_cache.test4.add('oversize', [str(i) for i in range(1000)]))
+
+        self.assertListEqual(simple_cache.test4.get_or_set('large2', lambda: value), value)
+        stored = simple_cache.cache.get(simple_cache.make_key(simple_cache.test4, 'large2'))
+        self.assertIsInstance(stored, cache.CompressedValue)
+        self.assertListEqual(simple_cache.test4.get_or_set('large2', None), value)
+        with self.assertLogs('cool.core', 'WARNING'):
+            oversize = simple_cache.test4.get_or_set('oversize', [str(i) for i in range(1000)])
+        self.assertEqual(len(oversize), 1000)
+        self.assertIsNone(simple_cache.test4.get('oversize'))
+
+        compressor = cache.get_compressor('lz4')
+        self.assertEqual(compressor.decompress(compressor.compress(b'test')), b'test')
+
+    def test_tags(self):
+        simple_cache = SimpleCache()
+        simple_cache.test1.set('tag1', 1, tags=['tag:1'])
+        simple_cache.test3.set_many({'tag1': 1, 'tag2': 2}, tags=['tag:1', 'tag:2'])
+        simple_cache.test2.set('tag1', 1, tags=['tag:2'])
+        simple_cache.test4.set('tag1', 'test', tags=['tag:2'])
+        self.assertEqual(simple_cache.test1.get('tag1'), 1)
+        self.assertEqual(simple_cache.test4.get('tag1'), 'test')
+        self.assertDictEqual(simple_cache.test3.get_many(['tag1', 'tag2']), {'tag1': 1, 'tag2': 2})
+        simple_cache.invalidate_tags(['tag:1'])
+        self.assertIsNone(simple_cache.test1.get('tag1'))
+        self.assertDictEqual(simple_cache.test3.get_many(['tag1', 'tag2']), {})
+        self.assertEqual(simple_cache.test2.get('tag1'), 1)
+        with simple_cache.batch() as b:
+            f1 = b.test1.get('tag1', 0)
+            f2 = b.test2.get('tag1')
+        self.assertEqual(f1.result(), 0)
+        self.assertEqual(f2.result(), 1)
+        cache.invalidate_tags(['tag:2'])
+        self.assertIsNone(simple_cache.test2.get('tag1'))
+        self.assertIsNone(simple_cache.test4.get('tag1'))
+        self.assertEqual(simple_cache.test2.get_or_set('tag1', 3), 3)
+
+        # tag 版本号被淘汰后重新初始化，之前写入的值失效
+        simple_cache.test1.set('tag3', 1, tags=['tag:3'])
+        simple_cache.cache.delete(cache._tag_key('tag:3'))
+        time.sleep(0.002)
+        cache.invalidate_tags(['tag:3'])
+        self.assertIsNone(simple_cache.test1.get('tag3'))
+
+    @skipIf(django.VERSION < (3, 1), 'async tests require Django 3.1+')
+    async def test_async_tags(self):
+        simple_cache = SimpleCache()
+        await simple_cache.test1.aset('atag1', 1, tags=['tag:6'])
+        self.assertTrue(await simple_cache.test1.aadd('atag2', 2, tags=['tag:6']))
+        self.assertEqual(await simple_cache.test1.aget('atag2'), 2)
+        simple_cache.invalidate_tags(['tag:6'])
+        self.assertIsNone(await simple_cache.test1.aget('atag1'))
+        self.assertIsNone(await simple_cache.test1.aget('atag2'))
+
+    def test_tags_concurrent_set(self):
+        simple_cache = SimpleCache()
+        versions = simple_cache.get_tag_versions(['tag:5'])
+        # 写入前 tag 已失效时，写入的值视为未命中
+        with mock.patch.object(simple_cache, 'get_tag_versions', return_value=versions):
+            simple_cache.invalidate_tags(['tag:5'])
+            simple_cache.test1.set('tag5', 1, tags=['tag:5'])
+        self.assertIsNone(simple_cache.test1.get('tag5'))
+
+    def test_tags_default_timeout(self):
+        default_cache = DefaultTimeoutCache()
+        default_cache.item.set('tag1', 1, tags=['tag:4'])
+        self.assertEqual(default_cache.item.get('tag1'), 1)
+        default_cache.invalidate_tags(['tag:4'])
+        self.assertIsNone(default_cache.item.get('tag1'))
+
+    def test_local_broadcast(self):
+        messages = []
+        broadcast = cache.LocalBroadcast()
+        broadcast.subscribe('channel', messages.append)
+        broadcast.publish('channel', ['key'])
+        broadcast.publish('other', ['other'])
+        self.assertListEqual(messages, [['key']])
+
+
+class CacheMetricsTests(SimpleTestCase):
+
+    def setUp(self):
+        self.events = list()
+        self.metrics = cache.CacheMetrics()
+        cache.add_listener(self.events.append)
+        cache.add_listener(self.metrics)
+
+    def tearDown(self):
+        cache.remove_listener(self.events.append)
+        cache.remove_listener(self.metrics)
+        self.metrics.clear()
+
+    def test_listener(self):
+        simple_cache = SimpleCache()
+        simple_cache.test1.set_many({'metrics1': 1, 'metrics2': 2})
+        simple_cache.test1.get_many(['metrics1', 'metrics2', 'metrics3'])
+        simple_cache.test2.get('metrics1')
+        self.assertListEqual(
+            [(event.name, event.op, event.keys, event.hits) for event in self.events],
+            [
+                ('_SimpleCache:test1', 'set_many', 2, 0),
+                ('_SimpleCache:test1', 'get_many', 3, 2),
+                ('_SimpleCache:test2', 'get', 1, 0),
+            ]
+        )
+        self.assertTrue(all(event.elapsed >= 0 for event in self.events))
+        cache.remove_listener(self.events.append)
+        simple_cache.test1.get('metrics1')
+        self.assertEqual(len(self.events), 3)
+
+    def test_metrics(self):
+        simple_cache = SimpleCache()
+        simple_cache.test1.set('metrics', 'value')
+        simple_cache.test1.get('metrics')
+        simple_cache.test1.get('metrics_none')
+        metrics = self.metrics.get_metrics()['_SimpleCache:test1']
+        self.assertEqual(metrics['calls'], 3)
+        self.assertEqual(metrics['hits'], 1)
+        self.assertEqual(metrics['misses'], 1)
+        self.assertEqual(metrics['hit_ratio'], 0.5)
+        self.assertGreater(metrics['bytes'], 0)
+        self.assertLessEqual(metrics['p50'], metrics['p99'])
+
+        self.metrics.flush()
+        self.assertEqual(self.metrics.summarize(self.metrics.load())['_SimpleCache:test1']['calls'], 3)
+        stdout = StringIO()
+        call_command('cache_metrics', stdout=stdout)
+        self.assertIn('_SimpleCache:test1', stdout.getvalue())
+        self.assertIn('50.00%', stdout.getvalue())
+        call_command('cache_metrics', clear=True)
+        self.assertDictEqual(self.metrics.load(), {})
+
+    def test_oversize(self):
+        simple_cache = SimpleCache()
+        with self.assertLogs('cool.core', 'WARNING'):
+            simple_cache.test4.set('oversize', [str(i) for i in range(1000)])
+        self.assertEqual(self.events[-1].op, 'oversize')
+        metrics = self.metrics.get_metrics()['_SimpleCache:test4']
+        self.assertEqual(metrics['oversize'], 1)
+        self.assertEqual(metrics['calls'], 0)
+
+    def test_vary(self):
+        simple_cache = SimpleCache()
+        for hits in (1, 0, 1):
+            cache.send_event(cache.CacheEvent(
+                cache=simple_cache, item=simple_cache.test1, name='vary', op='vary',
+                keys=1, hits=hits, elapsed=0, values=('user', 'tenant')
+            ))
+        metrics = self.metrics.get_metrics()
+        # 按维度统计命中情况，不产生其他统计
+        self.assertListEqual(sorted(metrics), ['vary:tenant', 'vary:user'])
+        self.assertEqual(metrics['vary:user']['hits'], 2)
+        self.assertEqual(metrics['vary:user']['misses'], 1)
+        self.assertEqual(metrics['vary:tenant']['calls'], 0)
+
+
+class MemoizeTests(SimpleTestCase):
+
+    def test_memoize(self):
+        simple_cache = SimpleCache()
+        calls = list()
+
+        @simple_cache.test1.memoize(timeout=60)
+        def add(a, b=0):
+            calls.append((a, b))
+            return a + b
+
+        self.assertEqual(add.__name__, 'add')
+        add.invalidate(1, b=2)
+        self.assertEqual(add(1, b=2), 3)
+        self.assertEqual(add(1, b=2), 3)
+        self.assertEqual(add(2), 2)
+        self.assertListEqual(calls, [(1, 2), (2, 0)])
+        self.assertEqual(simple_cache.test1.get(add.make_key(1, b=2)), 3)
+        add.invalidate(1, b=2)
+        self.assertEqual(add(1, b=2), 3)
+        self.assertEqual(len(calls), 3)
+
+        @simple_cache.test1.memoize(key=lambda value: value)
+        def none(value):
+            calls.append(value)
+            return None
+
+        none.invalidate('none')
+        self.assertIsNone(none('none'))
+        self.assertIsNone(none('none'))
+        self.assertEqual(calls[-1], 'none')
+        self.assertEqual(len(calls), 4)
+
+    def test_memoize_lock(self):
+        simple_cache = SimpleCache()
+        calls = list()
+
+        @simple_cache.test1.memoize(lock_timeout=0.2)
+        def func(value):
+            calls.append(value)
+            return value
+
+        func.invalidate('lock')
+        key = func.make_key('lock')
+        lock = simple_cache.test1.lock(key, 10)
+        self.assertTrue(lock.acquire())
+        try:
+            with mock.patch.object(func, 'lock_interval', 0.01):
+                with mock.patch.object(func, '_wait', wraps=func._wait) as wait:
+                    simple_cache.test1.set(key, 'other')
+                    self.assertEqual(func('lock'), 'other')
+                    self.assertEqual(wait.call_count, 0)
+                    simple_cache.test1.delete(key)
+                    self.assertEqual(func('lock'), 'lock')
+                    self.assertEqual(wait.call_count, 1)
+        finally:
+            lock.release()
+        self.assertListEqual(calls, ['lock'])
+
+    def test_memoize_many(self):
+        simple_cache = SimpleCache()
+        calls = list()
+
+        @simple_cache.test2.memoize_many(timeout=60, lock_timeout=1)
+        def square(ids, offset=0):
+            calls.append(list(ids))
+            return {_id: _id * _id + offset for _id in ids if _id != 0}
+
+        square.invalidate([0, 1, 2, 3])
+        self.assertDictEqual(square([1, 2]), {1: 1, 2: 4})
+        self.assertDictEqual(square([3, 2, 1, 0]), {3: 9, 2: 4, 1: 1})
+        self.assertListEqual(calls, [[1, 2], [3, 0]])
+        self.assertDictEqual(square([1], offset=1), {1: 2})
+        square.invalidate([1])
+        self.assertDictEqual(square([1, 2]), {1: 1, 2: 4})
+        self.assertListEqual(calls, [[1, 2], [3, 0], [1], [1]])
+
+    def test_memoize_lock_reread(self):
+        simple_cache = SimpleCache()
+        calls = list()
+
+        @simple_cache.test1.memoize(lock_timeout=1)
+        def func(value):
+            calls.append(value)
+            return value
+
+        @simple_cache.test2.memoize_many(lock_timeout=1)
+        def func_many(ids):
+            calls.append(list(ids))
+            return dict.fromkeys(ids, 'loaded')
+
+        func.invalidate('reread')
+        func_many.invalidate([1, 2])
+        acquire = cache.CacheLock.acquire
+
+        # 未命中后、加锁前其他进程写入缓存
+        def other_acquire(lock, *args, **kwargs):
+            simple_cache.test1.set(func.make_key('reread'), 'other')
+            simple_cache.test2.set(func_many.make_key(1), 'other')
+            return acquire(lock, *args, **kwargs)
+
+        with mock.patch.object(cache.CacheLock, 'acquire', other_acquire):
+            self.assertEqual(func('reread'), 'other')
+            self.assertDictEqual(func_many([1, 2]), {1: 'other', 2: 'loaded'})
+        self.assertListEqual(calls, [[2]])
+
+    def test_memoize_method(self):
+        simple_cache = SimpleCache()
+        calls = list()
+
+        class Counter:
+
+            def __init__(self, name):
+                self.name = name
+
+            @simple_cache.test1.memoize(timeout=60, key=lambda obj, a, b=0: (obj.name, a, b))
+            def add(self, a, b=0):
+                calls.append((self.name, a, b))
+                return a + b
+
+            @simple_cache.test2.memoize_many(timeout=60, key=lambda obj, _id: (obj.name, _id))
+            def square(self, ids):
+                calls.append((self.name, list(ids)))
+                return {_id: _id * _id for _id in ids}
+
+        counter1, counter2 = Counter('c1'), Counter('c2')
+        counter1.add.invalidate(1, b=2)
+        counter2.add.invalidate(1, b=2)
+        counter1.square.invalidate([1, 2])
+        counter2.square.invalidate([1])
+        self.assertIsInstance(Counter.add, cache.MemoizedFunction)
+        self.assertEqual(counter1.add.__name__, 'add')
+        self.assertEqual(counter1.add(1, b=2), 3)
+        self.assertEqual(counter1.add(1, b=2), 3)
+        self.assertEqual(counter2.add(1, b=2), 3)
+        self.assertNotEqual(counter1.add.make_key(1, b=2), counter2.add.make_key(1, b=2))
+        self.assertDictEqual(counter1.square([1, 2]), {1: 1, 2: 4})
+        self.assertDictEqual(counter1.square([2]), {2: 4})
+        self.assertDictEqual(counter2.square([1]), {1: 1})
+        self.assertListEqual(calls, [('c1', 1, 2), ('c2', 1, 2), ('c1', [1, 2]), ('c2', [1])])
+        counter1.add.invalidate(1, b=2)
+        self.assertEqual(counter1.add(1, b=2), 3)
+        self.assertEqual(calls[-1], ('c1', 1, 2))
+
+        # 装饰方法时必须指定 key
+        with self.assertRaises(Exception) as cm:
+            class Other:
+
+                @simple_cache.test1.memoize(timeout=60)
+                def add(self, a):
+                    return a
+        # Python 3.12 之前 __set_name__ 中的异常包装为 RuntimeError
+        self.assertIsInstance(cm.exception.__cause__ or cm.exception, ImproperlyConfigured)
+
+    def test_memoize_default_key(self):
+        simple_cache = SimpleCache()
+        calls = list()
+
+        @simple_cache.test1.memoize(timeout=60)
+        def func(*args, **kwargs):
+            calls.append((args, kwargs))
+            return args, kwargs
+
+        cases = [(('a:b', ), {}), (('a', 'b'), {}), ((1, ), {}), (('1', ), {}), ((), {'a': 1}), ((), {'a': '1'})]
+        for args, kwargs in cases:
+            func.invalidate(*args, **kwargs)
+        # 参数区分类型及分隔符，不同参数不会生成相同 key
+        self.assertEqual(len({func.make_key(*args, **kwargs) for args, kwargs in cases}), len(cases))
+        for args, kwargs in cases:
+            self.assertEqual(func(*args, **kwargs), (args, kwargs))
+        self.assertEqual(len(calls), len(cases))
+        self.assertEqual(func.make_key(a=1, b=2), func.make_key(b=2, a=1))
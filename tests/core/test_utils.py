@@ -1,4 +1,6 @@
 # encoding: utf-8
+import logging
+import threading
 import unittest
 
 from django.contrib.auth import models
@@ -84,3 +86,28 @@ class ConstructSearchTests(TestCase):
         self.assertEqual(utils.construct_search(
             models.Permission.objects, 'content_type__pk'), "content_type__pk__icontains"
         )
+
+
+class QueueLoggerTests(unittest.TestCase):
+
+    def test_queue_logger(self):
+        logger = logging.getLogger('tests.queue_logger')
+        records = list()
+        done = threading.Event()
+
+        class Handler(logging.Handler):
+            def emit(self, record):
+                records.append((record.getMessage(), threading.current_thread()))
+                done.set()
+
+        handler = Handler()
+        logger.addHandler(handler)
+        try:
+            queue_logger = utils.get_queue_logger(logger)
+            self.assertIs(utils.get_queue_logger(logger), queue_logger)
+            queue_logger.warning('test %s', 1)
+            self.assertTrue(done.wait(1))
+        finally:
+            logger.removeHandler(handler)
+        self.assertEqual(records[0][0], 'test 1')
+        self.assertIsNot(records[0][1], threading.current_thread())
@@ -34,3 +34,25 @@ class TestModel(model.BaseModel):
             ('unique_together3_field1', 'unique_together3_field2'),
             ('unique_together4_field1', 'unique_together4_field2'),
         )
+
+
+class ConstraintModel(model.BaseModel):
+    tenant = models.ForeignKey(SubModel, on_delete=models.CASCADE, related_name='+')
+    code = models.CharField(max_length=100)
+    slug = models.CharField(max_length=100)
+    name = models.CharField(max_length=100)
+    deleted = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['tenant', 'code'], name='constraint_model_tenant_code'),
+            models.UniqueConstraint(fields=['slug'], name='constraint_model_slug'),
+            models.UniqueConstraint(
+                fields=['name'], condition=models.Q(deleted=False), name='constraint_model_name'
+            ),
+        ]
+
+
+class RelatedModel(model.BaseModel):
+    constraint = model.ForeignKey(ConstraintModel, on_delete=models.CASCADE, related_name='+')
+    sub = model.OneToOneField(SubModel, on_delete=models.CASCADE, null=True, related_name='+')
@@ -1,14 +1,20 @@
 # encoding: utf-8
+import threading
+import time
+from unittest import mock
 
 from django.contrib.auth import models
-from django.test import TestCase
+from django.core.cache import cache as django_cache
+from django.test import TestCase, TransactionTestCase
 
+from cool.core import cache as core_cache
 from cool.model import cache
 
 
 class CacheTests(TestCase):
 
     def setUp(self):
+        django_cache.clear()
         models.User.objects.all().delete()
         models.User.objects.create_user(id=1, username='username1')
         models.User.objects.create_user(id=2, username='username2')
@@ -60,3 +66,234 @@ class CacheTests(TestCase):
     def test_not_unique_together_key(self):
         with self.assertRaises(AssertionError):
             cache.model_cache.get_many(models.ContentType,  ['app_label', 'model', 'id'], [('app_label1', 'model', 1)])
+
+    def test_local_cache(self):
+        model_cache = cache.ModelCache()
+        model_cache.get_many(models.User, ['pk'], [(1, )], local_ttl=10)
+        self.assertDictEqual(model_cache.get_stats()['local'], {'hits': 0, 'misses': 1})
+        models.User.objects.filter(pk=1).update(username='changed')
+        model_cache.item.delete_many([model_cache._get_key(models.User, ['pk'], [1])[0]])
+        users, dict_keys_list = model_cache.get_many(models.User, ['pk'], [(1, )], local_ttl=10)
+        self.assertEqual(users[dict_keys_list[0]].username, 'username1')
+        self.assertDictEqual(model_cache.get_stats()['local'], {'hits': 1, 'misses': 1})
+        self.assertIsNot(
+            users[dict_keys_list[0]],
+            model_cache.get_many(models.User, ['pk'], [(1, )], local_ttl=10)[0][dict_keys_list[0]]
+        )
+
+        model_cache.delete_many(models.User, ['pk'], [(1, )])
+        users, dict_keys_list = model_cache.get_many(models.User, ['pk'], [(1, )], local_ttl=10)
+        self.assertEqual(users[dict_keys_list[0]].username, 'changed')
+
+    def test_identity_map_middleware(self):
+        from django.test import RequestFactory
+
+        from cool.model.middleware import identity_map_middleware
+
+        def get_response(request):
+            cache.model_cache.get_many(models.User, ['pk'], [(1, )])
+            self.assertEqual(len(cache._identity_map.get()), 1)
+            return 'response'
+        self.assertEqual(identity_map_middleware(get_response)(RequestFactory().get('/')), 'response')
+        self.assertIsNone(cache._identity_map.get())
+
+    def test_single_flight(self):
+        model_cache = cache.ModelCache()
+        model_cache.lock_interval = 0.01
+        key = model_cache._get_key(models.User, ['pk'], [1])[0]
+        with model_cache.item.lock(key):
+            with self.assertNumQueries(1):
+                users, dict_keys_list = model_cache.get_many(models.User, ['pk'], [(1, )], lock_timeout=0.05)
+        self.assertEqual(users[dict_keys_list[0]].username, 'username1')
+        model_cache.item.delete(key)
+        user = users[dict_keys_list[0]]
+        user.username = 'loaded by other worker'
+        with model_cache.item.lock(key):
+            timer = threading.Timer(0.02, model_cache.item.set, (key, user))
+            timer.start()
+            with self.assertNumQueries(0):
+                users, dict_keys_list = model_cache.get_many(models.User, ['pk'], [(1, )], lock_timeout=1)
+            timer.join()
+        self.assertEqual(users[dict_keys_list[0]].username, 'loaded by other worker')
+
+    def test_single_flight_batch(self):
+        model_cache = cache.ModelCache()
+        with mock.patch.object(model_cache.item, 'add', wraps=model_cache.item.add) as add, \
+                mock.patch.object(model_cache.item, 'delete', wraps=model_cache.item.delete) as delete:
+            users, dict_keys_list = model_cache.get_many(models.User, ['pk'], [(1, ), (2, )], lock_timeout=1)
+        # 一批 key 只加一次锁
+        self.assertEqual(add.call_count, 1)
+        self.assertEqual(delete.call_count, 1)
+        self.assertEqual(len(users), 2)
+        keys = [model_cache._get_key(models.User, ['pk'], [pk])[0] for pk in (1, 2)]
+        model_cache.item.delete_many(keys)
+        model_cache.lock_interval = 0.01
+        # 其他进程加载同一批 key 时等待，超时后从数据库加载
+        with model_cache.batch_lock(list(reversed(keys)), 1):
+            with mock.patch.object(model_cache, '_wait_many', wraps=model_cache._wait_many) as wait_many:
+                users, _ = model_cache.get_many(models.User, ['pk'], [(1, ), (2, )], lock_timeout=0.05)
+        self.assertEqual(wait_many.call_count, 1)
+        self.assertEqual(len(users), 2)
+
+    def test_single_flight_release(self):
+        model_cache = cache.ModelCache()
+        key = model_cache._get_key(models.User, ['pk'], [3])[0]
+        holder = model_cache.batch_lock([key], 10)
+        self.assertTrue(holder.acquire())
+        # 持有锁的进程未找到数据且不缓存，释放锁后等待方停止等待并从数据库加载
+        with mock.patch('time.sleep', side_effect=lambda _: holder.release()) as sleep:
+            with self.assertNumQueries(1):
+                users, _ = model_cache.get_many(models.User, ['pk'], [(3, )], lock_timeout=10)
+        self.assertEqual(users, {})
+        self.assertEqual(sleep.call_count, 1)
+        self.assertTrue(model_cache.batch_lock([key], 10).acquire())
+
+    def test_single_flight_reread(self):
+        model_cache = cache.ModelCache()
+        user = models.User.objects.get(pk=1)
+        key = model_cache._get_key(models.User, ['pk'], [1])[0]
+        acquire = core_cache.CacheLock.acquire
+
+        # 未命中后、加锁前其他进程写入缓存
+        def other_acquire(lock, *args, **kwargs):
+            model_cache.remote_set_many(models.User, {key: user}, 60)
+            return acquire(lock, *args, **kwargs)
+
+        with mock.patch.object(core_cache.CacheLock, 'acquire', other_acquire):
+            with self.assertNumQueries(0):
+                users, dict_keys_list = model_cache.get_many(models.User, ['pk'], [(1, )], lock_timeout=10)
+        self.assertEqual(users[dict_keys_list[0]].pk, 1)
+
+    def test_stale(self):
+        model_cache = cache.ModelCache()
+        key = model_cache._get_key(models.User, ['pk'], [1])[0]
+        stale_user = models.User.objects.get(pk=1)
+        models.User.objects.filter(pk=1).update(username='changed')
+
+        model_cache.item.set(key, cache.StaleValue(stale_user, time.time() - 1))
+        with model_cache.item.lock(key):
+            users, dict_keys_list = model_cache.get_many(models.User, ['pk'], [(1, )], stale_ttl=60)
+        self.assertEqual(users[dict_keys_list[0]].username, 'username1')
+
+        users, dict_keys_list = model_cache.get_many(models.User, ['pk'], [(1, )], stale_ttl=60)
+        self.assertEqual(users[dict_keys_list[0]].username, 'changed')
+        value = model_cache.item.get(key)
+        self.assertIsInstance(value, cache.StaleValue)
+        self.assertGreater(value.expire_at, time.time())
+        users, dict_keys_list = model_cache.get_many(models.User, ['pk'], [(1, )])
+        self.assertEqual(users[dict_keys_list[0]].username, 'changed')
+
+    def test_none_cache(self):
+        model_cache = cache.ModelCache()
+        with self.assertNumQueries(1):
+            users, dict_keys_list = model_cache.get_many(models.User, ['pk'], [(3, )], none_ttl=60)
+            self.assertNotIn(dict_keys_list[0], users)
+            users, dict_keys_list = model_cache.get_many(models.User, ['pk'], [(3, )], none_ttl=60)
+            self.assertNotIn(dict_keys_list[0], users)
+        models.User.objects.create_user(id=3, username='username3')
+        users, dict_keys_list = model_cache.get_many(models.User, ['pk'], [(3, )], none_ttl=60)
+        self.assertNotIn(dict_keys_list[0], users)
+        model_cache.delete_many(models.User, ['pk'], [(3, )])
+        users, dict_keys_list = model_cache.get_many(models.User, ['pk'], [(3, )], none_ttl=60)
+        self.assertEqual(users[dict_keys_list[0]].username, 'username3')
+
+    def test_compact_codec(self):
+        model_cache = cache.ModelCache()
+        codec = cache.CompactCodec()
+        key = model_cache._get_key(models.User, ['pk'], [1])[0]
+        model_cache.get_many(models.User, ['pk'], [(1, )], codec=codec)
+        schema_hash, values = model_cache.item.get(key)
+        self.assertEqual(schema_hash, codec.get_schema(models.User)[0])
+        self.assertIn('username1', values)
+        with self.assertNumQueries(0):
+            users, dict_keys_list = model_cache.get_many(models.User, ['pk'], [(1, )], codec=codec)
+        user = users[dict_keys_list[0]]
+        self.assertIsInstance(user, models.User)
+        self.assertFalse(user._state.adding)
+        self.assertEqual(user.username, 'username1')
+
+        model_cache.item.set(key, ('00000000', values))
+        with self.assertNumQueries(1):
+            users, dict_keys_list = model_cache.get_many(models.User, ['pk'], [(1, )], codec=codec)
+        self.assertEqual(users[dict_keys_list[0]].username, 'username1')
+        with self.assertNumQueries(1):
+            model_cache.get_many(models.User, ['pk'], [(1, )])
+
+    def test_key_plan(self):
+        from tests.model import models as test_models
+        self.assertIn((test_models.TestModel, ('pk', )), cache.ModelCache._key_plans)
+        self.assertIn(
+            (test_models.TestModel, ('unique_together1_field1', 'unique_together1_field2')),
+            cache.ModelCache._key_plans
+        )
+        sub_obj = test_models.SubModel(id=2, unique_field='sub2_unique_field')
+        key, names, values = cache.model_cache._get_key(
+            test_models.TestModel, ['unique_together4_field2', 'unique_together4_field1'], [sub_obj, 1]
+        )
+        self.assertEqual(
+            key, '%s:model_testmodel:unique_together4_field1|unique_together4_field2:1|sub2_unique_field' % (
+                cache.model_cache.get_model_version(test_models.TestModel)
+            )
+        )
+        self.assertTupleEqual(names, ('unique_together4_field1', 'unique_together4_field2'))
+        self.assertTupleEqual(values, ('1', 'sub2_unique_field'))
+        keys = cache.model_cache._get_keys(models.User, ['pk'], [(1, ), (2, )])
+        version = cache.model_cache.get_model_version(models.User)
+        self.assertListEqual(
+            [key for key, _, _ in keys], ['%s:auth_user:id:1' % version, '%s:auth_user:id:2' % version]
+        )
+
+    def test_key_plan_reuse(self):
+        field_names = ('app_label', 'model')
+        cache.ModelCache._key_plans.pop((models.ContentType, field_names), None)
+        with mock.patch.object(cache, 'KeyPlan', wraps=cache.KeyPlan) as key_plan:
+            plan = cache.ModelCache.get_key_plan(models.ContentType, list(field_names))
+            keys = cache.model_cache._get_keys(
+                models.ContentType, field_names, [('app_label%d' % i, 'model') for i in range(10)]
+            )
+            cache.model_cache._get_key(models.ContentType, list(field_names), ['app_label', 'model'])
+        # 同一 model 及字段组合只生成一次计划，之后批量生成 key 时复用
+        self.assertEqual(key_plan.call_count, 1)
+        self.assertIs(cache.ModelCache.get_key_plan(models.ContentType, field_names), plan)
+        self.assertEqual(len(keys), 10)
+
+    def test_metrics_name(self):
+        events = list()
+        core_cache.add_listener(events.append)
+        try:
+            cache.model_cache.get_many(models.User, ['pk'], [(1, )])
+        finally:
+            core_cache.remove_listener(events.append)
+        self.assertEqual(events[0].name, 'cool:model_cache:item:auth_user')
+
+
+class CacheCommitTests(TransactionTestCase):
+    """
+    缓存在事务提交后失效，需要真实提交事务
+    """
+    setUp = CacheTests.setUp
+
+    def test_local_cache_broadcast(self):
+        model_cache1 = cache.ModelCache()
+        model_cache2 = cache.ModelCache()
+        model_cache1._broadcast = model_cache2._broadcast = cache.cache.LocalBroadcast()
+        model_cache1.get_many(models.User, ['pk'], [(1, )], local_ttl=10)
+        models.User.objects.filter(pk=1).update(username='changed')
+        model_cache2.delete_many(models.User, ['pk'], [(1, )])
+        users, dict_keys_list = model_cache1.get_many(models.User, ['pk'], [(1, )], local_ttl=10)
+        self.assertEqual(users[dict_keys_list[0]].username, 'changed')
+        self.assertDictEqual(model_cache1.get_stats()['local'], {'hits': 0, 'misses': 2})
+
+    def test_identity_map(self):
+        model_cache = cache.ModelCache()
+        with cache.identity_map():
+            users, dict_keys_list = model_cache.get_many(models.User, ['pk'], [(1, )])
+            user = users[dict_keys_list[0]]
+            users, dict_keys_list = model_cache.get_many(models.User, ['pk'], [(1, ), (2, )])
+            self.assertIs(users[dict_keys_list[0]], user)
+            self.assertDictEqual(model_cache.get_stats()['identity'], {'hits': 1, 'misses': 2})
+            model_cache.delete_many(models.User, ['pk'], [(1, )])
+            users, dict_keys_list = model_cache.get_many(models.User, ['pk'], [(1, )])
+            self.assertIsNot(users[dict_keys_list[0]], user)
+        users, dict_keys_list = model_cache.get_many(models.User, ['pk'], [(2, )])
+        self.assertDictEqual(model_cache.get_stats()['identity'], {'hits': 1, 'misses': 3})
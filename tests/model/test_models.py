@@ -1,6 +1,18 @@
 # encoding: utf-8
-from django.test import TestCase
+import threading
+import time
+from unittest import mock, skipIf
 
+import django
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Concat
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from cool.model import prefetch_cached
+from cool.model.cache import model_cache
+from cool.model.models import CacheQuerySet
 from tests.model import models
 
 
@@ -238,6 +250,133 @@ class ModelTests(TestCase):
         )
         _check(objs, dict_keys_list)
 
+    def test_none_cache_cleared_on_insert(self):
+        with mock.patch.object(models.SubModel, '_MODEL_CACHE_NONE_TTL', 60):
+            self.assertIsNone(models.SubModel.get_obj_by_pk_from_cache(4))
+            self.assertIsNone(models.SubModel.get_obj_by_unique_key_from_cache(unique_field='sub4_unique_field'))
+            with self.assertNumQueries(0):
+                self.assertIsNone(models.SubModel.get_obj_by_pk_from_cache(4))
+            models.SubModel.objects.create(id=4, unique_field='sub4_unique_field')
+            self.assertEqual(models.SubModel.get_obj_by_pk_from_cache(4).unique_field, 'sub4_unique_field')
+            self.assertEqual(
+                models.SubModel.get_obj_by_unique_key_from_cache(unique_field='sub4_unique_field').pk, 4
+            )
+
+    def test_write_through_fallback(self):
+        with mock.patch.object(models.ConstraintModel, '_MODEL_CACHE_WRITE_THROUGH', True):
+            obj = models.ConstraintModel.objects.create(id=1, tenant_id=1, code='code1', slug='slug1', name='name1')
+            models.ConstraintModel.objects.filter(pk=1).update(name='other')
+            obj.slug = 'slug2'
+            obj.save(update_fields=['slug'])
+            # 只更新部分字段时清空缓存，重新从数据库读取
+            with self.assertNumQueries(1):
+                self.assertEqual(models.ConstraintModel.get_obj_by_pk_from_cache(1).name, 'other')
+            obj = models.ConstraintModel.get_obj_by_pk_from_cache(1)
+            obj.tenant_id = F('tenant_id') + 1
+            obj.save()
+            with self.assertNumQueries(1):
+                self.assertEqual(models.ConstraintModel.get_obj_by_pk_from_cache(1).tenant_id, 2)
+
+    def test_queryset_update_limit(self):
+        models.ConstraintModel.objects.create(id=1, tenant_id=1, code='code1', slug='slug1', name='name1')
+        models.ConstraintModel.objects.create(id=2, tenant_id=2, code='code1', slug='slug2', name='name2')
+        models.ConstraintModel.objects.create(id=3, tenant_id=3, code='code1', slug='slug3', name='name3')
+        models.ConstraintModel.get_objs_by_pks_from_cache([1, 2, 3])
+        with mock.patch.object(models.ConstraintModel, '_MODEL_CACHE_FLUSH_ROWS_LIMIT', 2), \
+                mock.patch.object(CacheQuerySet, 'cache_rows_batch_size', 1):
+            # 超过行数限制时使 model 所有缓存失效
+            with mock.patch.object(model_cache, 'invalidate_model', wraps=model_cache.invalidate_model) as invalidate:
+                self.assertEqual(models.ConstraintModel.objects.update(code='code2'), 3)
+            self.assertEqual(invalidate.call_count, 1)
+            objs = models.ConstraintModel.get_objs_by_pks_from_cache([1, 2, 3])
+            self.assertListEqual([obj.code for obj in objs.values()], ['code2'] * 3)
+            # 未超过行数限制时按主键分批重新查询修改后的数据
+            with self.assertNumQueries(4):
+                models.ConstraintModel.objects.filter(pk__in=[1, 2]).update(slug=Concat('slug', Value('x')))
+        self.assertEqual(models.ConstraintModel.get_obj_by_unique_key_from_cache(slug='slug1x').pk, 1)
+        self.assertIsNone(models.ConstraintModel.get_obj_by_unique_key_from_cache(slug='slug1'))
+        with mock.patch.object(models.ConstraintModel, '_MODEL_CACHE_FLUSH_ROWS_LIMIT', 1):
+            models.ConstraintModel.objects.filter(pk__in=[1, 2]).delete()
+        self.assertIsNone(models.ConstraintModel.get_obj_by_pk_from_cache(1))
+        self.assertEqual(models.ConstraintModel.get_obj_by_pk_from_cache(3).pk, 3)
+
+    def test_queryset_delete(self):
+        models.ConstraintModel.objects.create(id=1, tenant_id=1, code='code1', slug='slug1', name='name1')
+        models.ConstraintModel.get_obj_by_pk_from_cache(1)
+        models.ConstraintModel.objects.filter(slug='slug1').delete()
+        self.assertIsNone(models.ConstraintModel.get_obj_by_pk_from_cache(1))
+
+    def test_bulk_update_create(self):
+        obj1 = models.ConstraintModel.objects.create(id=1, tenant_id=1, code='code1', slug='slug1', name='name1')
+        obj2 = models.ConstraintModel.objects.create(id=2, tenant_id=2, code='code1', slug='slug2', name='name2')
+        models.ConstraintModel.get_objs_by_pks_from_cache([1, 2])
+        models.ConstraintModel.get_obj_by_unique_key_from_cache(slug='slug1')
+        obj1.slug = 'slug3'
+        obj2.name = 'changed'
+        models.ConstraintModel.objects.bulk_update([obj1, obj2], ['slug', 'name'])
+        self.assertIsNone(models.ConstraintModel.get_obj_by_unique_key_from_cache(slug='slug1'))
+        self.assertEqual(models.ConstraintModel.get_obj_by_pk_from_cache(1).slug, 'slug3')
+        self.assertEqual(models.ConstraintModel.get_obj_by_pk_from_cache(2).name, 'changed')
+
+        with mock.patch.object(models.ConstraintModel, '_MODEL_CACHE_NONE_TTL', 60):
+            self.assertIsNone(models.ConstraintModel.get_obj_by_pk_from_cache(3))
+            self.assertIsNone(models.ConstraintModel.get_obj_by_unique_key_from_cache(slug='slug4'))
+            models.ConstraintModel.objects.bulk_create([
+                models.ConstraintModel(id=3, tenant_id=3, code='code1', slug='slug4', name='name3')
+            ])
+            self.assertEqual(models.ConstraintModel.get_obj_by_pk_from_cache(3).slug, 'slug4')
+            self.assertEqual(models.ConstraintModel.get_obj_by_unique_key_from_cache(slug='slug4').pk, 3)
+
+    @skipIf(django.VERSION < (4, 0), 'async cache API requires Django 4.0+')
+    async def test_async_cache(self):
+        await cache.aclear()
+        obj = await models.TestModel.aget_obj_by_pk_from_cache(1)
+        self.assertEqual(obj.unique_field, 'obj1_unique_field')
+        dict_keys_list = list()
+        objs = await models.TestModel.aget_objs_by_pks_from_cache([2, 1, 3], _dict_keys_list=dict_keys_list)
+        self.assertListEqual([objs[key].pk for key in dict_keys_list if key in objs], [2, 1])
+        obj = await models.TestModel.aget_obj_by_unique_key_from_cache(unique_field='obj2_unique_field')
+        self.assertEqual(obj.pk, 2)
+        obj = await models.TestModel.aget_obj_by_unique_together_key_from_cache(
+            unique_together1_field1='obj1_unique_together1_field1',
+            unique_together1_field2='obj1_unique_together1_field2'
+        )
+        self.assertEqual(obj.pk, 1)
+        with mock.patch.object(model_cache, 'aget_many_from_db') as aget_many_from_db:
+            obj = await models.TestModel.aget_obj_by_pk_from_cache(1)
+            objs = await models.TestModel.aget_objs_by_unique_keys_from_cache(unique_field=['obj2_unique_field'])
+        self.assertEqual(aget_many_from_db.call_count, 0)
+        self.assertEqual(obj.pk, 1)
+        self.assertEqual(list(objs.values())[0].pk, 2)
+
+    @skipIf(django.VERSION < (4, 0), 'async cache API requires Django 4.0+')
+    async def test_async_cache_version(self):
+        await cache.aclear()
+        model_cache._versions.clear()
+        # 异步读取时使用异步方法获取版本号，不在事件循环中同步访问缓存
+        with mock.patch.object(model_cache, 'get_version', side_effect=AssertionError):
+            obj = await models.TestModel.aget_obj_by_pk_from_cache(1)
+        self.assertEqual(obj.pk, 1)
+        version = await model_cache.aget_model_version(models.TestModel)
+        self.assertEqual(version, model_cache.get_model_version(models.TestModel))
+
+    @skipIf(django.VERSION < (4, 0), 'async cache API requires Django 4.0+')
+    async def test_async_cache_lock(self):
+        await cache.aclear()
+        with mock.patch.object(models.TestModel, '_MODEL_CACHE_LOCK_TIMEOUT', 10):
+            objs = await models.TestModel.aget_objs_by_pks_from_cache([1, 2])
+        self.assertEqual(len(objs), 2)
+        lock = model_cache.item.lock(model_cache._get_key(models.TestModel, ['pk'], [1])[0])
+        async with lock as acquired:
+            self.assertTrue(acquired)
+
+
+class ModelCommitTests(TransactionTestCase):
+    """
+    缓存在事务提交后失效，需要真实提交事务
+    """
+    setUp = ModelTests.setUp
+
     def test_flush_cache(self):
         from django.core.cache import cache
         from django.db import connection
@@ -282,3 +421,267 @@ class ModelTests(TestCase):
             return list(map(lambda x: x['sql'], queries))
 
         self.assertEqual(_get_sqls(queries1), _get_sqls(queries2))
+
+    def test_unique_constraint(self):
+        models.ConstraintModel.objects.create(id=1, tenant_id=1, code='code1', slug='slug1', name='name1')
+        models.ConstraintModel.objects.create(id=2, tenant_id=2, code='code1', slug='slug2', name='name2')
+        obj = models.ConstraintModel.get_obj_by_unique_together_key_from_cache(tenant_id=2, code='code1')
+        self.assertEqual(obj.pk, 2)
+        dict_keys_list = list()
+        objs = models.ConstraintModel.get_objs_by_unique_together_key_from_cache(
+            tenant=[1, 2], code=['code1', 'code1'], _dict_keys_list=dict_keys_list
+        )
+        self.assertEqual(objs[dict_keys_list[0]].pk, 1)
+        self.assertEqual(objs[dict_keys_list[1]].pk, 2)
+        self.assertEqual(models.ConstraintModel.get_obj_by_unique_key_from_cache(slug='slug1').pk, 1)
+        with self.assertRaises(AssertionError):
+            models.ConstraintModel.get_obj_by_unique_key_from_cache(name='name1')
+
+        with self.assertNumQueries(0):
+            models.ConstraintModel.get_obj_by_unique_together_key_from_cache(tenant_id=2, code='code1')
+            models.ConstraintModel.get_obj_by_unique_key_from_cache(slug='slug1')
+        obj = models.ConstraintModel.objects.get(pk=1)
+        obj.flush_cache()
+        with self.assertNumQueries(2):
+            models.ConstraintModel.get_obj_by_unique_together_key_from_cache(tenant_id=1, code='code1')
+            models.ConstraintModel.get_obj_by_unique_key_from_cache(slug='slug1')
+
+    def test_prefetch_cached(self):
+        models.ConstraintModel.objects.create(id=1, tenant_id=1, code='code1', slug='slug1', name='name1')
+        models.ConstraintModel.objects.create(id=2, tenant_id=2, code='code1', slug='slug2', name='name2')
+        models.RelatedModel.objects.create(id=1, constraint_id=1, sub_id=1)
+        models.RelatedModel.objects.create(id=2, constraint_id=2, sub_id=None)
+        models.RelatedModel.objects.create(id=3, constraint_id=2, sub_id=3)
+        cache.clear()
+
+        objs = list(models.RelatedModel.objects.order_by('pk'))
+        with self.assertNumQueries(3):
+            prefetch_cached(objs, 'constraint__tenant', 'sub')
+        with self.assertNumQueries(0):
+            self.assertListEqual([obj.constraint.pk for obj in objs], [1, 2, 2])
+            self.assertIs(objs[1].constraint, objs[2].constraint)
+            self.assertListEqual([obj.constraint.tenant.pk for obj in objs], [1, 2, 2])
+            self.assertListEqual([obj.sub and obj.sub.pk for obj in objs], [1, None, 3])
+
+        objs = list(models.RelatedModel.objects.order_by('pk'))
+        with self.assertNumQueries(0):
+            prefetch_cached(objs, 'constraint__tenant', 'sub')
+            self.assertListEqual([obj.constraint.tenant.pk for obj in objs], [1, 2, 2])
+
+        with self.assertRaises(ValueError):
+            prefetch_cached(objs, 'id')
+
+    def test_write_through(self):
+        with mock.patch.object(models.ConstraintModel, '_MODEL_CACHE_WRITE_THROUGH', True):
+            obj = models.ConstraintModel.objects.create(id=1, tenant_id=1, code='code1', slug='slug1', name='name1')
+            with self.assertNumQueries(0):
+                self.assertEqual(models.ConstraintModel.get_obj_by_pk_from_cache(1).slug, 'slug1')
+                self.assertEqual(models.ConstraintModel.get_obj_by_unique_key_from_cache(slug='slug1').pk, 1)
+                self.assertEqual(
+                    models.ConstraintModel.get_obj_by_unique_together_key_from_cache(tenant_id=1, code='code1').pk, 1
+                )
+            obj.slug = 'slug2'
+            obj.tenant_id = 2
+            obj.save()
+            with self.assertNumQueries(0):
+                self.assertEqual(models.ConstraintModel.get_obj_by_pk_from_cache(1).slug, 'slug2')
+                self.assertEqual(models.ConstraintModel.get_obj_by_unique_key_from_cache(slug='slug2').pk, 1)
+                self.assertEqual(
+                    models.ConstraintModel.get_obj_by_unique_together_key_from_cache(tenant_id=2, code='code1').pk, 1
+                )
+            with self.assertNumQueries(2):
+                self.assertIsNone(models.ConstraintModel.get_obj_by_unique_key_from_cache(slug='slug1'))
+                self.assertIsNone(
+                    models.ConstraintModel.get_obj_by_unique_together_key_from_cache(tenant_id=1, code='code1')
+                )
+            # 未使用进程内缓存时不广播
+            with mock.patch.object(model_cache, 'local_delete_many') as m:
+                obj.save()
+                with transaction.atomic():
+                    obj.save()
+            m.assert_not_called()
+            with mock.patch.object(models.ConstraintModel, '_MODEL_CACHE_LOCAL_TTL', 10), \
+                    mock.patch.object(model_cache, 'local_delete_many') as m:
+                obj.save()
+            self.assertTrue(m.called)
+
+    def test_transaction_flush(self):
+        obj1 = models.ConstraintModel.objects.create(id=1, tenant_id=1, code='code1', slug='slug1', name='name1')
+        obj2 = models.ConstraintModel.objects.create(id=2, tenant_id=2, code='code1', slug='slug2', name='name2')
+        models.ConstraintModel.get_objs_by_pks_from_cache([1, 2])
+        key = model_cache._get_key(models.ConstraintModel, ['pk'], [1])[0]
+        with mock.patch.object(model_cache.item, 'delete_many', wraps=model_cache.item.delete_many) as delete_many:
+            with transaction.atomic():
+                obj1.name = 'changed1'
+                obj1.save()
+                obj2.name = 'changed2'
+                obj2.save()
+                # 提交前不清空，本线程读取修改的数据直接访问数据库且不写入缓存
+                self.assertEqual(delete_many.call_count, 0)
+                with self.assertNumQueries(1):
+                    objs = models.ConstraintModel.get_objs_by_pks_from_cache([1, 2])
+                self.assertEqual(objs[('1', )].name, 'changed1')
+                self.assertEqual(model_cache.item.get(key).name, 'name1')
+            # 提交后合并为一次清空
+            self.assertEqual(delete_many.call_count, 1)
+            self.assertIsNone(model_cache.item.get(key))
+        with self.assertNumQueries(1):
+            objs = models.ConstraintModel.get_objs_by_pks_from_cache([1, 2])
+        self.assertEqual(objs[('2', )].name, 'changed2')
+
+    def test_transaction_rollback(self):
+        obj = models.ConstraintModel.objects.create(id=1, tenant_id=1, code='code1', slug='slug1', name='name1')
+        models.ConstraintModel.get_obj_by_pk_from_cache(1)
+        with self.assertRaises(ValueError):
+            with transaction.atomic():
+                obj.name = 'changed'
+                obj.save()
+                models.ConstraintModel.get_obj_by_pk_from_cache(1)
+                raise ValueError
+        with transaction.atomic():
+            models.ConstraintModel.get_obj_by_pk_from_cache(1)
+            obj.refresh_from_db()
+            obj.slug = 'slug2'
+            obj.save()
+        obj = models.ConstraintModel.get_obj_by_pk_from_cache(1)
+        self.assertEqual(obj.name, 'name1')
+        self.assertEqual(obj.slug, 'slug2')
+
+    @override_settings(DJANGO_COOL={'MODEL_CACHE_DELAY_DELETE': 60})
+    def test_delay_delete(self):
+        obj = models.ConstraintModel.objects.create(id=1, tenant_id=1, code='code1', slug='slug1', name='name1')
+        deleter = model_cache._delay_deleter
+        deleter.pop_due(float('inf'))
+        with mock.patch('threading.Thread', wraps=threading.Thread) as thread:
+            obj.flush_cache()
+            obj.flush_cache()
+        # 共用一个后台线程
+        self.assertLessEqual(thread.call_count, 1)
+        self.assertEqual(deleter.pop_due(), ([], []))
+        keys, _ = deleter.pop_due(float('inf'))
+        self.assertIn(model_cache._get_key(models.ConstraintModel, ['pk'], [1])[0], keys)
+        self.assertEqual(len(keys), len(set(keys)))
+
+    @override_settings(DJANGO_COOL={'MODEL_CACHE_DELAY_DELETE': 0.01})
+    def test_delay_delete_run(self):
+        obj = models.ConstraintModel.objects.create(id=1, tenant_id=1, code='code1', slug='slug1', name='name1')
+        obj.flush_cache()
+        key = model_cache._get_key(models.ConstraintModel, ['pk'], [1])[0]
+        model_cache.item.set(key, 'stale')
+        for _ in range(100):
+            if model_cache.item.get(key) is None:
+                break
+            time.sleep(0.01)
+        self.assertIsNone(model_cache.item.get(key))
+
+    def test_invalidate_all_cache(self):
+        models.ConstraintModel.objects.create(id=1, tenant_id=1, code='code1', slug='slug1', name='name1')
+        models.ConstraintModel.objects.create(id=2, tenant_id=2, code='code1', slug='slug2', name='name2')
+        models.ConstraintModel.get_objs_by_pks_from_cache([1, 2])
+        models.ConstraintModel._base_manager.update(code='changed')
+        self.assertEqual(models.ConstraintModel.get_obj_by_pk_from_cache(1).code, 'code1')
+        with transaction.atomic():
+            models.ConstraintModel.invalidate_all_cache()
+            with self.assertNumQueries(1):
+                self.assertEqual(models.ConstraintModel.get_obj_by_pk_from_cache(1).code, 'changed')
+            self.assertEqual(models.ConstraintModel.get_obj_by_pk_from_cache(2).code, 'changed')
+        with self.assertNumQueries(1):
+            objs = models.ConstraintModel.get_objs_by_pks_from_cache([1, 2])
+        self.assertListEqual([obj.code for obj in objs.values()], ['changed', 'changed'])
+        with self.assertNumQueries(0):
+            models.ConstraintModel.get_objs_by_pks_from_cache([1, 2])
+
+    def test_cache_tags(self):
+        from cool.core.cache import CacheItem
+
+        item = CacheItem(name='test_tags')
+        item.cache = model_cache
+        obj1 = models.ConstraintModel.objects.create(id=1, tenant_id=1, code='code1', slug='slug1', name='name1')
+        models.ConstraintModel.objects.create(id=2, tenant_id=2, code='code1', slug='slug2', name='name2')
+        self.assertEqual(models.ConstraintModel.get_cache_tag(1), 'model.constraintmodel:1')
+        for pk in (1, 2):
+            item.set(pk, pk, tags=[models.ConstraintModel.get_cache_tag(pk)])
+        obj1.save()
+        self.assertEqual(item.get(1), 1)
+        with mock.patch.object(models.ConstraintModel, '_MODEL_CACHE_TAGS', True):
+            with transaction.atomic():
+                obj1.name = 'changed'
+                obj1.save()
+                # tag 在提交后失效
+                self.assertEqual(item.get(1), 1)
+            self.assertIsNone(item.get(1))
+            self.assertEqual(item.get(2), 2)
+            models.ConstraintModel.objects.filter(pk=2).update(name='changed2')
+            self.assertIsNone(item.get(2))
+            item.set(1, 1, tags=[models.ConstraintModel.get_cache_tag(1)])
+            obj1.delete()
+            self.assertIsNone(item.get(1))
+            # 超过行数限制时只清空 model 对应的 tag，不再查询所有 pk
+            for pk in (3, 4):
+                models.ConstraintModel.objects.create(
+                    id=pk, tenant_id=1, code='code%d' % pk, slug='slug%d' % pk, name='name%d' % pk
+                )
+                item.set(pk, pk, tags=models.ConstraintModel.get_cache_tags(pk))
+            invalidate_tags = model_cache.invalidate_tags
+            with mock.patch.object(models.ConstraintModel, '_MODEL_CACHE_FLUSH_ROWS_LIMIT', 1), \
+                    mock.patch.object(model_cache, 'invalidate_tags', wraps=invalidate_tags) as m:
+                # 行数限制检查 + update
+                with self.assertNumQueries(2):
+                    models.ConstraintModel.objects.update(deleted=True)
+                m.assert_called_once_with(['model.constraintmodel'], using='default')
+            self.assertIsNone(item.get(3))
+            self.assertIsNone(item.get(4))
+
+    def test_delete_flush(self):
+        obj = models.ConstraintModel.objects.create(id=1, tenant_id=1, code='code1', slug='slug1', name='name1')
+        models.ConstraintModel.get_obj_by_pk_from_cache(1)
+        models.ConstraintModel.get_obj_by_unique_key_from_cache(slug='slug1')
+        keys = [
+            model_cache._get_key(models.ConstraintModel, ['pk'], [1])[0],
+            model_cache._get_key(models.ConstraintModel, ['slug'], ['slug1'])[0],
+        ]
+        self.assertEqual(len(model_cache.item.get_many(keys)), 2)
+        obj.delete()
+        self.assertDictEqual(model_cache.item.get_many(keys), {})
+        self.assertIsNone(models.ConstraintModel.get_obj_by_pk_from_cache(1))
+
+    def test_queryset_update(self):
+        models.ConstraintModel.objects.create(id=1, tenant_id=1, code='code1', slug='slug1', name='name1')
+        models.ConstraintModel.objects.create(id=2, tenant_id=2, code='code1', slug='slug2', name='name2')
+        models.ConstraintModel.get_objs_by_pks_from_cache([1, 2])
+        models.ConstraintModel.get_obj_by_unique_key_from_cache(slug='slug1')
+        with mock.patch.object(model_cache.item, 'delete_many', wraps=model_cache.item.delete_many) as delete_many:
+            self.assertEqual(models.ConstraintModel.objects.filter(pk=1).update(slug='slug3'), 1)
+            self.assertEqual(models.ConstraintModel.objects.update(code='code2'), 2)
+        self.assertEqual(delete_many.call_count, 2)
+        self.assertIsNone(models.ConstraintModel.get_obj_by_unique_key_from_cache(slug='slug1'))
+        self.assertEqual(models.ConstraintModel.get_obj_by_unique_key_from_cache(slug='slug3').pk, 1)
+        objs = models.ConstraintModel.get_objs_by_pks_from_cache([1, 2])
+        self.assertListEqual(sorted(obj.code for obj in objs.values()), ['code2', 'code2'])
+
+
+class ModelTestCaseTransactionTests(TestCase):
+
+    def setUp(self):
+        models.SubModel.objects.create(id=1, unique_field="sub1_unique_field")
+
+    def test_flush_in_test_case(self):
+        # TestCase 中事务不会提交，修改的数据直接从数据库读取
+        obj = models.ConstraintModel.objects.create(id=1, tenant_id=1, code='code1', slug='slug1', name='name1')
+        models.ConstraintModel.get_obj_by_pk_from_cache(1)
+        obj.name = 'changed'
+        obj.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(models.ConstraintModel.get_obj_by_pk_from_cache(1).name, 'changed')
+
+    @skipIf(django.VERSION < (3, 2), 'captureOnCommitCallbacks requires Django 3.2+')
+    def test_flush_on_commit(self):
+        obj = models.ConstraintModel.objects.create(id=1, tenant_id=1, code='code1', slug='slug1', name='name1')
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            obj.name = 'changed'
+            obj.save()
+        self.assertTrue(callbacks)
+        with self.assertNumQueries(1):
+            self.assertEqual(models.ConstraintModel.get_obj_by_pk_from_cache(1).name, 'changed')
+        with self.assertNumQueries(0):
+            self.assertEqual(models.ConstraintModel.get_obj_by_pk_from_cache(1).name, 'changed')
@@ -1 +1,66 @@
 # encoding: utf-8
+from django.core.cache import cache
+from django.test import TransactionTestCase
+from rest_framework import serializers
+
+from cool.views import BaseSerializer
+from cool.views.serializer import get_cached_lookups
+from tests.model import models
+
+
+class SubSerializer(BaseSerializer):
+    class Meta:
+        model = models.SubModel
+        fields = ('id', 'unique_field')
+
+
+class ConstraintSerializer(BaseSerializer):
+    tenant = SubSerializer()
+
+    class Meta:
+        model = models.ConstraintModel
+        fields = ('id', 'code', 'tenant')
+
+
+class RelatedSerializer(BaseSerializer):
+    constraint = ConstraintSerializer()
+    sub_unique_field = serializers.CharField(source='sub.unique_field', default=None)
+
+    class Meta:
+        model = models.RelatedModel
+        fields = ('id', 'constraint', 'sub', 'sub_unique_field')
+
+
+class PrefetchCachedTests(TransactionTestCase):
+
+    def setUp(self):
+        models.SubModel.objects.create(id=1, unique_field="sub1_unique_field")
+        models.SubModel.objects.create(id=2, unique_field="sub2_unique_field")
+        models.ConstraintModel.objects.create(id=1, tenant_id=1, code='code1', slug='slug1', name='name1')
+        models.ConstraintModel.objects.create(id=2, tenant_id=2, code='code1', slug='slug2', name='name2')
+        for i in range(1, 11):
+            models.RelatedModel.objects.create(id=i, constraint_id=i % 2 + 1, sub_id=i if i < 3 else None)
+        cache.clear()
+
+    def test_get_cached_lookups(self):
+        self.assertListEqual(
+            get_cached_lookups(RelatedSerializer(), models.RelatedModel), ['constraint', 'constraint__tenant', 'sub']
+        )
+
+    def test_list_serializer(self):
+        queryset = models.RelatedModel.objects.order_by('pk')
+        with self.assertNumQueries(3):
+            serializer = RelatedSerializer(queryset, many=True)
+            data = serializer.data
+        self.assertEqual(len(data), 10)
+        self.assertEqual(data[0]['constraint']['tenant']['unique_field'], 'sub2_unique_field')
+        self.assertEqual(data[1]['sub_unique_field'], 'sub2_unique_field')
+        self.assertIsNone(data[2]['sub_unique_field'])
+        self.assertEqual(serializer.saved_cached_lookups, 14)
+
+    def test_list_serializer_disabled(self):
+        queryset = models.RelatedModel.objects.order_by('pk')
+        serializer = RelatedSerializer(queryset, many=True, prefetch_cached=False)
+        data = serializer.data
+        self.assertEqual(len(data), 10)
+        self.assertEqual(serializer.saved_cached_lookups, 0)
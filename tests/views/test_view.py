@@ -1 +1,241 @@
 # encoding: utf-8
+import datetime
+import json
+import logging
+from unittest import mock
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from rest_framework import fields
+from rest_framework.response import Response
+
+from cool.core import cache
+from cool.core.cache import BaseCache, CacheItem
+from cool.views import CoolAPIException, CoolBFFAPIView, ErrorCode
+from cool.views.signals import request_stage_timing
+
+
+class ViewCache(BaseCache):
+    key_prefix = '_ViewCache'
+    response = CacheItem(default_timeout=60)
+
+
+view_cache = ViewCache()
+
+
+class CacheView(CoolBFFAPIView):
+    CACHE_ITEM = view_cache.response
+    calls = None
+
+    def get_context(self, request, *args, **kwargs):
+        self.calls.append(request.params.ids)
+        return {'ids': request.params.ids}
+
+    class Meta:
+        param_fields = (
+            ('ids', fields.ListField(child=fields.IntegerField(), default=list)),
+            ('date', fields.DateField(default=None)),
+            ('file', fields.FileField(default=None)),
+        )
+
+
+class RenderedCacheView(CacheView):
+    CACHE_RENDERED = True
+    CACHE_ETAG = True
+
+
+class VaryCacheView(CacheView):
+    CACHE_VARY = ('user', 'header:Accept-Language', 'tenant')
+
+    def get_context(self, request, *args, **kwargs):
+        self.calls.append(request.params.ids)
+        return {'user': request.user.pk}
+
+
+class Params:
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class ViewTests(SimpleTestCase):
+
+    def test_gen_cache_key(self):
+        view = CacheView()
+        self.assertTupleEqual(CacheView.get_cache_key_fields(), ('ids', 'date', 'file'))
+        key1 = view.gen_cache_key(Params(ids=[1, 2], date=datetime.date(2020, 1, 1), file=None))
+        key2 = view.gen_cache_key(Params(ids=[1, 2], date=datetime.date(2020, 1, 1), file=None))
+        self.assertTupleEqual(key1, key2)
+        self.assertTrue(key1[0].startswith('tests.views.test_view.CacheView:'))
+        self.assertEqual(len(key1[1]), 40)
+        self.assertNotEqual(key1, view.gen_cache_key(Params(ids=['1', '2'], date='2020-01-01', file=None)))
+        self.assertNotEqual(key1, view.gen_cache_key(Params(ids=[2, 1], date=datetime.date(2020, 1, 1), file=None)))
+        self.assertEqual(
+            view.gen_cache_key(Params(ids={'a': 1, 'b': {2, 1}}, date=None, file=None)),
+            view.gen_cache_key(Params(ids={'b': {1, 2}, 'a': 1}, date=None, file=None)),
+        )
+        self.assertIsNone(
+            view.gen_cache_key(Params(ids=[], date=None, file=SimpleUploadedFile('test.txt', b'test')))
+        )
+
+    def test_cache_version(self):
+
+        class VersionView(CacheView):
+            CACHE_VERSION = 2
+
+        self.assertEqual(VersionView.get_cache_version(), '2')
+        self.assertEqual(VersionView().view_uniq_key(), 'tests.views.test_view.VersionView:2')
+        self.assertEqual(len(CacheView.get_cache_version()), 8)
+
+    @override_settings(ALLOWED_HOSTS=['testserver'])
+    def test_view_cache(self):
+        calls = list()
+        view = CacheView.as_view(calls=calls)
+        request_factory = RequestFactory()
+        for _ in range(2):
+            response = view(request_factory.get('/', {'ids': [1, 2]}))
+            self.assertEqual(response.status_code, 200)
+        self.assertListEqual(calls, [[1, 2]])
+        view(request_factory.get('/', {'ids': [1, 3]}))
+        self.assertListEqual(calls, [[1, 2], [1, 3]])
+
+    @override_settings(ALLOWED_HOSTS=['testserver'])
+    def test_rendered_cache(self):
+        calls = list()
+        view = RenderedCacheView.as_view(calls=calls)
+        request_factory = RequestFactory()
+        response1 = view(request_factory.get('/', {'ids': [4]}))
+        response1.render()
+        response2 = view(request_factory.get('/', {'ids': [4]}))
+        self.assertListEqual(calls, [[4]])
+        self.assertNotIsInstance(response2, Response)
+        self.assertEqual(response2.content, response1.content)
+        self.assertEqual(response2['Content-Type'], response1['Content-Type'])
+        self.assertEqual(response2['ETag'], response1['ETag'])
+
+        response3 = view(request_factory.get('/', {'ids': [4]}, HTTP_IF_NONE_MATCH=response1['ETag']))
+        self.assertEqual(response3.status_code, 304)
+        self.assertEqual(response3.content, b'')
+        response4 = view(request_factory.post('/', {'ids': [4]}, HTTP_IF_NONE_MATCH=response1['ETag']))
+        self.assertEqual(response4.status_code, 200)
+        self.assertIn('ETag', response4)
+
+        # 媒体类型参数不同时分开缓存
+        response5 = view(request_factory.get('/', {'ids': [4]}, HTTP_ACCEPT='application/json; indent=4'))
+        self.assertNotEqual(response5.content, response1.content)
+        self.assertNotEqual(response5['ETag'], response1['ETag'])
+        count = len(calls)
+        response6 = view(request_factory.get('/', {'ids': [4]}, HTTP_ACCEPT='application/json; indent=4'))
+        self.assertEqual(response6.content, response5.content)
+        self.assertEqual(len(calls), count)
+
+    @override_settings(ALLOWED_HOSTS=['testserver'])
+    def test_vary_cache(self):
+        calls = list()
+        events = list()
+        view = VaryCacheView.as_view(calls=calls)
+        request_factory = RequestFactory()
+
+        def request(user, language='en', tenant=1, ids=5):
+            req = request_factory.get('/', {'ids': [ids]}, HTTP_ACCEPT_LANGUAGE=language)
+            req.user = user
+            req.tenant = tenant
+            return view(req)
+
+        user1, user2 = User(pk=1), User(pk=2)
+        request(user1)
+        cache.add_listener(events.append)
+        try:
+            request(user1)
+            request(user2)
+        finally:
+            cache.remove_listener(events.append)
+        request(AnonymousUser())
+        request(user1, language='zh-hans')
+        request(user1, tenant=2)
+        request(user1)
+        self.assertEqual(len(calls), 5)
+        # 每次读取只有一次缓存读取事件及一次按维度统计的事件
+        self.assertListEqual(
+            [(event.name, event.op, event.hits) for event in events if event.op in ('get', 'vary')],
+            [
+                ('_ViewCache:response', 'get', 1),
+                ('cool:view_cache:vary', 'vary', 1),
+                ('_ViewCache:response', 'get', 0),
+                ('cool:view_cache:vary', 'vary', 0),
+            ]
+        )
+        self.assertTrue(all(event.values == VaryCacheView.CACHE_VARY for event in events if event.op == 'vary'))
+        with mock.patch.object(
+                VaryCacheView, 'check_api_permissions', side_effect=CoolAPIException(ErrorCode.ERROR_PERMISSION)
+        ):
+            response = request(user1)
+        response.render()
+        self.assertEqual(json.loads(response.content)['code'], ErrorCode.ERROR_PERMISSION)
+        self.assertEqual(len(calls), 5)
+
+        req = request_factory.get('/')
+        req.user = user1
+        with mock.patch.object(VaryCacheView, 'log_exception') as log_exception:
+            response = view(req)
+        self.assertIsInstance(log_exception.call_args[0][1], ImproperlyConfigured)
+        response.render()
+        self.assertEqual(json.loads(response.content)['code'], ErrorCode.ERROR_SYSTEM)
+
+    @override_settings(ALLOWED_HOSTS=['testserver'], DJANGO_COOL={'API_LOG_DATA_MAX_LENGTH': 20})
+    def test_log(self):
+        view = CacheView.as_view(calls=list())
+        request_factory = RequestFactory()
+        with self.assertLogs('cool.views', 'INFO') as logs:
+            view(request_factory.get('/', {'ids': list(range(100))}, HTTP_USER_AGENT='test'))
+        start, finish = [record.api_log for record in logs.records]
+        self.assertDictEqual(start['meta'], {'REMOTE_ADDR': '127.0.0.1', 'HTTP_USER_AGENT': 'test'})
+        self.assertEqual(len(finish['response']), 20)
+        self.assertEqual(finish['status_code'], 200)
+
+        logger = logging.getLogger('cool.views')
+        level = logger.level
+        logger.setLevel(logging.WARNING)
+        try:
+            with mock.patch('cool.views.view._dumps_truncated') as dumps:
+                view(request_factory.get('/', {'ids': [1]}))
+            dumps.assert_not_called()
+        finally:
+            logger.setLevel(level)
+
+        with override_settings(DJANGO_COOL={'API_LOG_SAMPLE_RATE': 0}):
+            with mock.patch.object(CacheView, 'get_log_info') as get_log_info:
+                view(request_factory.get('/', {'ids': [1]}))
+            get_log_info.assert_not_called()
+
+    @override_settings(ALLOWED_HOSTS=['testserver'], DJANGO_COOL={'API_SERVER_TIMING': True})
+    def test_stage_timing(self):
+        view = CacheView.as_view(calls=list())
+        request_factory = RequestFactory()
+        response = view(request_factory.get('/', {'ids': [6]}))
+        self.assertTrue(response.is_rendered)
+        names = [item.split(';')[0] for item in response['Server-Timing'].split(', ')]
+        self.assertListEqual(
+            names, ['initial', 'params', 'permissions', 'cache', 'context', 'serialize', 'render', 'total']
+        )
+
+        signals = list()
+
+        def receiver(sender, view, request, response, stages, **kwargs):
+            signals.append((sender, list(stages.keys())))
+
+        request_stage_timing.connect(receiver, sender=RenderedCacheView)
+        try:
+            with override_settings(DJANGO_COOL={}):
+                response = RenderedCacheView.as_view(calls=list())(request_factory.get('/', {'ids': [6]}))
+                response = RenderedCacheView.as_view(calls=list())(request_factory.get('/', {'ids': [6]}))
+                self.assertNotIn('Server-Timing', response)
+                view(request_factory.get('/', {'ids': [6]}))
+        finally:
+            request_stage_timing.disconnect(receiver, sender=RenderedCacheView)
+        self.assertListEqual(signals, [
+            (RenderedCacheView, ['initial', 'params', 'permissions', 'cache', 'context', 'serialize', 'render']),
+            (RenderedCacheView, ['initial', 'params', 'permissions', 'cache']),
+        ])